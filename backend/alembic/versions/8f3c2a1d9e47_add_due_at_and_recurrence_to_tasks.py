@@ -0,0 +1,35 @@
+"""add due_at and recurrence to tasks
+
+Revision ID: 8f3c2a1d9e47
+Revises: 235b918324d4
+Create Date: 2026-10-19 09:12:44.381205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3c2a1d9e47'
+down_revision: Union[str, None] = '235b918324d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('due_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('tasks', sa.Column('recurrence_rule', sa.String(), nullable=True))
+    op.create_index('ix_tasks_owner_id_due_at', 'tasks', ['owner_id', 'due_at'], unique=False)
+    op.create_index(
+        'ix_tasks_recurring_due_at', 'tasks', ['due_at'], unique=False,
+        postgresql_where=sa.text('recurrence_rule IS NOT NULL')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_recurring_due_at', table_name='tasks')
+    op.drop_index('ix_tasks_owner_id_due_at', table_name='tasks')
+    op.drop_column('tasks', 'recurrence_rule')
+    op.drop_column('tasks', 'due_at')
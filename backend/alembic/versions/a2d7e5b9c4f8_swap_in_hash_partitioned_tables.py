@@ -0,0 +1,137 @@
+"""swap in hash partitioned tables
+
+Revision ID: a2d7e5b9c4f8
+Revises: f6c3a9e1b7d2
+Create Date: 2026-10-19 15:52:44.106958
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2d7e5b9c4f8'
+down_revision: Union[str, None] = 'f6c3a9e1b7d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = {"goals": "owner_id", "tasks": "owner_id"}
+
+# Same function as in f6c3a9e1b7d2, recreated on downgrade
+MIRROR_FUNCTION = """
+    CREATE FUNCTION mirror_to_hashed() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        shadow text := TG_TABLE_NAME || '_hashed';
+        key text := TG_ARGV[0];
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            EXECUTE format('DELETE FROM %I WHERE id = $1 AND %I = $2', shadow, key)
+                USING OLD.id, (to_jsonb(OLD) ->> key)::integer;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', shadow) USING NEW;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Writers wait here for the few statements below; run app/partitioning.py
+    # backfill beforehand so the catch-up copy is small
+    op.execute("LOCK TABLE goals, tasks IN ACCESS EXCLUSIVE MODE")
+    for table in TABLES:
+        shadow = f"{table}_hashed"
+        op.execute(f"""
+            INSERT INTO {shadow} SELECT * FROM {table}
+            WHERE id > (SELECT last_id FROM partition_backfill WHERE table_name = '{table}')
+            ON CONFLICT DO NOTHING
+        """)
+        rows, shadow_rows = bind.execute(sa.text(
+            f"SELECT (SELECT count(*) FROM {table}), (SELECT count(*) FROM {shadow})"
+        )).one()
+        if rows != shadow_rows:
+            raise RuntimeError(f"{shadow} has {shadow_rows} rows but {table} has {rows}")
+
+    # Foreign keys to goals.id can't follow: a hash-partitioned table only has
+    # unique keys that include the partition key. The repositories already
+    # check ownership and goal deletion unlinks tasks and closure rows.
+    for table in TABLES:
+        constraints = bind.execute(sa.text(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = CAST(:table AS regclass)"
+        ), {"table": table}).all()
+        for referencing, name in constraints:
+            op.execute(f"ALTER TABLE {referencing} DROP CONSTRAINT {name}")
+
+    for table, key in TABLES.items():
+        shadow = f"{table}_hashed"
+        index_names = bind.execute(sa.text(
+            r"SELECT indexname FROM pg_indexes WHERE tablename = :shadow AND indexname LIKE '%\_hashed'"
+        ), {"shadow": shadow}).scalars().all()
+        op.execute(f"DROP TRIGGER {table}_mirror_to_hashed ON {table}")
+        # Keep the id sequence alive when the old table is dropped
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {shadow}_pkey TO {table}_pkey")
+        op.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {shadow}_{key}_fkey TO {table}_{key}_fkey")
+        for name in index_names:
+            op.execute(f"ALTER INDEX {name} RENAME TO {name[:-len('_hashed')]}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.drop_table('partition_backfill')
+    op.execute("DROP FUNCTION mirror_to_hashed()")
+
+
+def downgrade() -> None:
+    # Back to the state after f6c3a9e1b7d2 with the backfill complete: plain
+    # tables again, and the partitioned ones kept as mirrored shadows
+    bind = op.get_bind()
+    op.execute(MIRROR_FUNCTION)
+    op.create_table('partition_backfill',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('last_id', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+    for table, key in TABLES.items():
+        shadow = f"{table}_hashed"
+        index_names = bind.execute(sa.text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexdef NOT LIKE 'CREATE UNIQUE%'"
+        ), {"table": table}).scalars().all()
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(f"ALTER TABLE {table} RENAME TO {shadow}")
+        op.execute(f"ALTER TABLE {shadow} RENAME CONSTRAINT {table}_pkey TO {shadow}_pkey")
+        op.execute(f"ALTER TABLE {shadow} RENAME CONSTRAINT {table}_{key}_fkey TO {shadow}_{key}_fkey")
+        for name in index_names:
+            op.execute(f"ALTER INDEX {name} RENAME TO {name}_hashed")
+
+        op.execute(f"CREATE TABLE {table} (LIKE {shadow} INCLUDING DEFAULTS)")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} DROP NOT NULL")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {shadow}")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_{key}_fkey FOREIGN KEY ({key}) REFERENCES users (id)")
+        definitions = bind.execute(sa.text(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = :shadow AND indexdef NOT LIKE 'CREATE UNIQUE%'"
+        ), {"shadow": shadow}).scalars().all()
+        for definition in definitions:
+            op.execute(re.sub(r"^CREATE INDEX (\S+)_hashed ON (ONLY )?\S+ ", rf"CREATE INDEX \1 ON {table} ", definition))
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+        op.execute(
+            f"CREATE TRIGGER {table}_mirror_to_hashed AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION mirror_to_hashed('{key}')"
+        )
+        op.execute(f"INSERT INTO partition_backfill (table_name, last_id) SELECT '{table}', coalesce(max(id), 0) FROM {table}")
+
+    op.create_foreign_key('goals_parent_id_fkey', 'goals', 'goals', ['parent_id'], ['id'])
+    op.create_foreign_key('tasks_goal_id_fkey', 'tasks', 'goals', ['goal_id'], ['id'])
+    op.create_foreign_key('goal_closure_ancestor_id_fkey', 'goal_closure', 'goals', ['ancestor_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('goal_closure_descendant_id_fkey', 'goal_closure', 'goals', ['descendant_id'], ['id'], ondelete='CASCADE')
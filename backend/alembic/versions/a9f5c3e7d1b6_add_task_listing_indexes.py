@@ -0,0 +1,39 @@
+"""add task listing indexes
+
+Revision ID: a9f5c3e7d1b6
+Revises: d8c4a2f6e0b3
+Create Date: 2026-10-19 14:02:11.480265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9f5c3e7d1b6'
+down_revision: Union[str, None] = 'd8c4a2f6e0b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY so a large tasks table stays writable while the indexes build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tasks_owner_id_id', 'tasks', ['owner_id', 'id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_tasks_owner_id_completed_created_at', 'tasks', ['owner_id', 'completed', 'created_at'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_tasks_owner_id_updated_at', 'tasks', ['owner_id', 'updated_at'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_tasks_open_owner_id_goal_id', 'tasks', ['owner_id', 'goal_id'], unique=False,
+                        postgresql_where=sa.text('completed = false'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tasks_open_owner_id_goal_id', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_owner_id_updated_at', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_owner_id_completed_created_at', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_owner_id_id', table_name='tasks', postgresql_concurrently=True)
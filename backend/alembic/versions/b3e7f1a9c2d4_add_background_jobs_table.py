@@ -0,0 +1,45 @@
+"""add background_jobs table
+
+Revision ID: b3e7f1a9c2d4
+Revises: f2b8c6d4a1e9
+Create Date: 2026-10-19 12:52:31.604418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e7f1a9c2d4'
+down_revision: Union[str, None] = 'f2b8c6d4a1e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('background_jobs',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('idempotency_key', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index('ix_background_jobs_pending_run_after', 'background_jobs', ['run_after'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"))
+    op.create_index('ix_background_jobs_finished_at', 'background_jobs', ['finished_at'], unique=False,
+                    postgresql_where=sa.text("status = 'done'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_background_jobs_finished_at', table_name='background_jobs')
+    op.drop_index('ix_background_jobs_pending_run_after', table_name='background_jobs')
+    op.drop_table('background_jobs')
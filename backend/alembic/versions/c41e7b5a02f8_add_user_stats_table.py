@@ -0,0 +1,39 @@
+"""add user_stats table
+
+Revision ID: c41e7b5a02f8
+Revises: 8f3c2a1d9e47
+Create Date: 2026-10-19 10:03:17.552918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7b5a02f8'
+down_revision: Union[str, None] = '8f3c2a1d9e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('current_streak', sa.Integer(), nullable=True),
+    sa.Column('longest_streak', sa.Integer(), nullable=True),
+    sa.Column('last_active_date', sa.Date(), nullable=True),
+    sa.Column('total_count', sa.Integer(), nullable=True),
+    sa.Column('window_end', sa.Date(), nullable=True),
+    sa.Column('daily_counts', postgresql.ARRAY(sa.Integer()), nullable=True),
+    sa.Column('goal_progress', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Backfill afterwards with: python -m app.stats
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
@@ -0,0 +1,41 @@
+"""add rank to tasks
+
+Revision ID: c7e1b5d9f3a2
+Revises: a9f5c3e7d1b6
+Create Date: 2026-10-19 14:41:57.092634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e1b5d9f3a2'
+down_revision: Union[str, None] = 'a9f5c3e7d1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # "C" collation so keys compare bytewise, matching app/ranking.py
+    op.add_column('tasks', sa.Column('rank', sa.String(collation='C'), nullable=True))
+
+    # Existing lists keep their id order. Zero-padded hex digits are valid
+    # base-62 key digits in the same order, and the trailing V keeps keys
+    # from ending in the zero digit.
+    op.execute("""
+        UPDATE tasks SET rank = ranked.rank
+        FROM (
+            SELECT id, lpad(to_hex(row_number() OVER (PARTITION BY owner_id, goal_id ORDER BY id)), 8, '0') || 'V' AS rank
+            FROM tasks
+        ) AS ranked
+        WHERE tasks.id = ranked.id
+    """)
+    op.create_index('ix_tasks_owner_id_goal_id_rank', 'tasks', ['owner_id', 'goal_id', 'rank'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_owner_id_goal_id_rank', table_name='tasks')
+    op.drop_column('tasks', 'rank')
@@ -0,0 +1,51 @@
+"""add task tags and tag_counts
+
+Revision ID: c8f2a6d4e1b9
+Revises: b5e9c1f7a3d6
+Create Date: 2026-10-19 17:02:44.190853
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8f2a6d4e1b9'
+down_revision: Union[str, None] = 'b5e9c1f7a3d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default is a catalog-only change, existing rows are not rewritten
+    op.add_column('tasks', sa.Column('tags', postgresql.ARRAY(sa.String()), server_default='{}', nullable=False))
+    op.add_column('tasks_archive', sa.Column('tags', postgresql.ARRAY(sa.String()), server_default='{}', nullable=False))
+    op.create_table('tag_counts',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('tag', sa.String(), nullable=False),
+    sa.Column('task_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('owner_id', 'tag')
+    )
+
+    # CONCURRENTLY is not supported on a partitioned table: create the parent
+    # index on its own (invalid until every partition has one), build each
+    # partition's index concurrently and attach it
+    op.execute("CREATE INDEX ix_tasks_tags ON ONLY tasks USING gin (tags)")
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'tasks'::regclass ORDER BY 1"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_tags_idx ON {partition} USING gin (tags)")
+            op.execute(f"ALTER INDEX ix_tasks_tags ATTACH PARTITION {partition}_tags_idx")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_tags', table_name='tasks')
+    op.drop_table('tag_counts')
+    op.drop_column('tasks_archive', 'tags')
+    op.drop_column('tasks', 'tags')
@@ -0,0 +1,53 @@
+"""add outbox table
+
+Revision ID: d8c4a2f6e0b3
+Revises: b3e7f1a9c2d4
+Create Date: 2026-10-19 13:30:48.215907
+
+"""
+from datetime import date, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8c4a2f6e0b3'
+down_revision: Union[str, None] = 'b3e7f1a9c2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE outbox_id_seq")
+    op.execute("""
+        CREATE TABLE outbox (
+            id BIGINT NOT NULL DEFAULT nextval('outbox_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            event_type VARCHAR NOT NULL,
+            aggregate_type VARCHAR NOT NULL,
+            aggregate_id INTEGER NOT NULL,
+            owner_id INTEGER NOT NULL,
+            payload JSON NOT NULL,
+            dispatched_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE outbox_id_seq OWNED BY outbox.id")
+    op.execute("CREATE INDEX ix_outbox_undispatched_id ON outbox (id) WHERE dispatched_at IS NULL")
+
+    # The relay keeps creating partitions ahead of time; see app/outbox.py
+    today = date.today()
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        op.execute(
+            f"CREATE TABLE outbox_p{day:%Y%m%d} PARTITION OF outbox "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        )
+    op.execute("CREATE TABLE outbox_default PARTITION OF outbox DEFAULT")
+
+
+def downgrade() -> None:
+    # Dropping the parent drops every partition
+    op.drop_table('outbox')
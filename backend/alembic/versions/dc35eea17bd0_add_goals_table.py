@@ -1,7 +1,7 @@
 """add goals table
 
 Revision ID: dc35eea17bd0
-Revises: 
+Revises: 1c0d9e3a7b52
 Create Date: 2025-03-25 13:50:48.087176
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = 'dc35eea17bd0'
-down_revision: Union[str, None] = None
+down_revision: Union[str, None] = '1c0d9e3a7b52'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
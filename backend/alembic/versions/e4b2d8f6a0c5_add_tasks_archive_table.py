@@ -0,0 +1,57 @@
+"""add tasks_archive table
+
+Revision ID: e4b2d8f6a0c5
+Revises: c7e1b5d9f3a2
+Create Date: 2026-10-19 15:08:26.731190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b2d8f6a0c5'
+down_revision: Union[str, None] = 'c7e1b5d9f3a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # No foreign keys so archiving never contends with writes to users and
+    # goals; GoalRepository.delete unlinks archived tasks by hand
+    op.create_table('tasks_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('goal_id', sa.Integer(), nullable=True),
+    sa.Column('due_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('recurrence_rule', sa.String(), nullable=True),
+    sa.Column('rank', sa.String(collation='C'), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tasks_archive_owner_id_id', 'tasks_archive', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_tasks_archive_goal_id', 'tasks_archive', ['goal_id'], unique=False)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tasks_archivable', 'tasks', [sa.text('coalesce(updated_at, created_at)')], unique=False,
+                        postgresql_where=sa.text('completed AND recurrence_rule IS NULL'),
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_archivable', table_name='tasks')
+    # Archived tasks go back to the hot table before the archive is dropped
+    op.execute("""
+        INSERT INTO tasks (id, title, description, completed, created_at, updated_at, owner_id, goal_id, due_at, recurrence_rule, rank)
+        SELECT id, title, description, completed, created_at, updated_at, owner_id, goal_id, due_at, recurrence_rule, rank
+        FROM tasks_archive
+    """)
+    op.drop_index('ix_tasks_archive_goal_id', table_name='tasks_archive')
+    op.drop_index('ix_tasks_archive_owner_id_id', table_name='tasks_archive')
+    op.drop_table('tasks_archive')
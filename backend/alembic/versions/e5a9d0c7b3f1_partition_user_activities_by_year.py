@@ -0,0 +1,102 @@
+"""partition user_activities by year
+
+Revision ID: e5a9d0c7b3f1
+Revises: c41e7b5a02f8
+Create Date: 2026-10-19 11:27:40.918342
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a9d0c7b3f1'
+down_revision: Union[str, None] = 'c41e7b5a02f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # Keep the id sequence alive when the old table is dropped
+    op.execute("ALTER SEQUENCE user_activities_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE user_activities RENAME TO user_activities_legacy")
+
+    op.execute("""
+        CREATE TABLE user_activities (
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            date DATE NOT NULL,
+            id INTEGER DEFAULT nextval('user_activities_id_seq'),
+            count INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (user_id, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    op.execute("ALTER SEQUENCE user_activities_id_seq OWNED BY user_activities.id")
+
+    first, last = bind.execute(sa.text(
+        "SELECT min(date), max(date) FROM user_activities_legacy"
+    )).one()
+    current_year = date.today().year
+    first_year = first.year if first else current_year
+    last_year = max(last.year if last else current_year, current_year + 1)
+    for year in range(first_year, last_year + 1):
+        op.execute(
+            f"CREATE TABLE user_activities_y{year} PARTITION OF user_activities "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+    op.execute("CREATE TABLE user_activities_default PARTITION OF user_activities DEFAULT")
+
+    # Duplicate (user_id, date) rows are merged by summing their counts
+    op.execute("""
+        INSERT INTO user_activities (user_id, date, id, count, created_at)
+        SELECT user_id, date, min(id), sum(count), min(created_at)
+        FROM user_activities_legacy
+        WHERE user_id IS NOT NULL AND date IS NOT NULL
+        GROUP BY user_id, date
+    """)
+    op.drop_table('user_activities_legacy')
+
+    op.create_table('user_activity_years',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('counts', postgresql.ARRAY(sa.Integer()), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'year')
+    )
+
+
+def downgrade() -> None:
+    # Packed history is expanded back into daily rows before it is dropped
+    op.execute("ALTER SEQUENCE user_activities_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE user_activities RENAME TO user_activities_partitioned")
+    op.create_table('user_activities',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('user_activities_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('date', sa.Date(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE user_activities_id_seq OWNED BY user_activities.id")
+    op.execute("""
+        INSERT INTO user_activities (id, user_id, created_at, date, count)
+        SELECT coalesce(id, nextval('user_activities_id_seq')), user_id, created_at, date, count
+        FROM user_activities_partitioned
+    """)
+    op.execute("""
+        INSERT INTO user_activities (user_id, date, count)
+        SELECT y.user_id, make_date(y.year, 1, 1) + (c.ordinality - 1)::int, c.count
+        FROM user_activity_years y, unnest(y.counts) WITH ORDINALITY AS c(count, ordinality)
+        WHERE c.count > 0
+    """)
+    op.create_index(op.f('ix_user_activities_id'), 'user_activities', ['id'], unique=False)
+    op.create_index(op.f('ix_user_activities_date'), 'user_activities', ['date'], unique=False)
+    op.drop_table('user_activities_partitioned')
+    op.drop_table('user_activity_years')
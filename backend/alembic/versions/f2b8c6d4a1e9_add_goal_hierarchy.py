@@ -0,0 +1,60 @@
+"""add goal hierarchy
+
+Revision ID: f2b8c6d4a1e9
+Revises: e5a9d0c7b3f1
+Create Date: 2026-10-19 12:14:05.337120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8c6d4a1e9'
+down_revision: Union[str, None] = 'e5a9d0c7b3f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('goals', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.add_column('goals', sa.Column('subtree_total_tasks', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('goals', sa.Column('subtree_completed_tasks', sa.Integer(), server_default='0', nullable=False))
+    op.create_foreign_key('goals_parent_id_fkey', 'goals', 'goals', ['parent_id'], ['id'])
+    op.create_index(op.f('ix_goals_parent_id'), 'goals', ['parent_id'], unique=False)
+
+    op.create_table('goal_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['goals.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['goals.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_goal_closure_descendant_id_depth', 'goal_closure', ['descendant_id', 'depth'], unique=False)
+
+    # Existing goals are all top-level: each is only its own ancestor, and its
+    # subtree counts are its direct task counts
+    op.execute("INSERT INTO goal_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM goals")
+    op.execute("""
+        UPDATE goals SET
+            subtree_total_tasks = counts.total,
+            subtree_completed_tasks = counts.completed
+        FROM (
+            SELECT goal_id, count(id) AS total, count(id) FILTER (WHERE completed) AS completed
+            FROM tasks WHERE goal_id IS NOT NULL GROUP BY goal_id
+        ) AS counts
+        WHERE goals.id = counts.goal_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_goal_closure_descendant_id_depth', table_name='goal_closure')
+    op.drop_table('goal_closure')
+    op.drop_index(op.f('ix_goals_parent_id'), table_name='goals')
+    op.drop_constraint('goals_parent_id_fkey', 'goals', type_='foreignkey')
+    op.drop_column('goals', 'subtree_completed_tasks')
+    op.drop_column('goals', 'subtree_total_tasks')
+    op.drop_column('goals', 'parent_id')
@@ -0,0 +1,93 @@
+"""add hash partitioned shadow tables
+
+Revision ID: f6c3a9e1b7d2
+Revises: e4b2d8f6a0c5
+Create Date: 2026-10-19 15:36:12.480273
+
+"""
+import os
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c3a9e1b7d2'
+down_revision: Union[str, None] = 'e4b2d8f6a0c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HASH_PARTITIONS = int(os.getenv("HASH_PARTITIONS", "16"))
+TABLES = {"goals": "owner_id", "tasks": "owner_id"}
+
+# Replays every change to a table on its _hashed shadow. Delete-then-insert
+# needs no column list, and the shadow shares the table's column order.
+MIRROR_FUNCTION = """
+    CREATE FUNCTION mirror_to_hashed() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        shadow text := TG_TABLE_NAME || '_hashed';
+        key text := TG_ARGV[0];
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            EXECUTE format('DELETE FROM %I WHERE id = $1 AND %I = $2', shadow, key)
+                USING OLD.id, (to_jsonb(OLD) ->> key)::integer;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            EXECUTE format('INSERT INTO %I SELECT ($1).*', shadow) USING NEW;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    op.execute(MIRROR_FUNCTION)
+    op.create_table('partition_backfill',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('last_id', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+    for table, key in TABLES.items():
+        shadow = f"{table}_hashed"
+        # The partition key has to be part of the primary key
+        op.execute(f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY HASH ({key})")
+        op.execute(f"ALTER TABLE {shadow} ALTER COLUMN {key} SET NOT NULL")
+        op.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_pkey PRIMARY KEY (id, {key})")
+        op.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_{key}_fkey FOREIGN KEY ({key}) REFERENCES users (id)")
+        for remainder in range(HASH_PARTITIONS):
+            op.execute(
+                f"CREATE TABLE {table}_h{remainder:02d} PARTITION OF {shadow} "
+                f"FOR VALUES WITH (MODULUS {HASH_PARTITIONS}, REMAINDER {remainder})"
+            )
+
+        # Same secondary indexes as the table, suffixed until the swap; each
+        # one is created on every partition
+        definitions = bind.execute(sa.text(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = :table AND indexdef NOT LIKE 'CREATE UNIQUE%'"
+        ), {"table": table}).scalars().all()
+        for definition in definitions:
+            op.execute(re.sub(r"^CREATE INDEX (\S+) ON (ONLY )?\S+ ", rf"CREATE INDEX \1_hashed ON {shadow} ", definition))
+        if not any(f"({key}, id)" in definition for definition in definitions):
+            op.execute(f"CREATE INDEX ix_{table}_{key}_id_hashed ON {shadow} ({key}, id)")
+
+        op.execute(
+            f"CREATE TRIGGER {table}_mirror_to_hashed AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION mirror_to_hashed('{key}')"
+        )
+        # Writes are mirrored from here on; app/partitioning.py copies the older rows
+        op.execute(f"INSERT INTO partition_backfill (table_name, last_id) VALUES ('{table}', 0)")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_mirror_to_hashed ON {table}")
+        # Dropping the parent drops every partition
+        op.execute(f"DROP TABLE IF EXISTS {table}_hashed")
+    op.drop_table('partition_backfill')
+    op.execute("DROP FUNCTION IF EXISTS mirror_to_hashed()")
@@ -0,0 +1,190 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import argparse
+from . import models
+from .partitioning import create_hash_partitions
+
+# Daily rows older than this many full years are rolled into user_activity_years
+KEEP_DAILY_YEARS = 1
+
+
+def partition_name(year: int) -> str:
+    return f"user_activities_y{year}"
+
+
+def ensure_year_partition(db: Session, year: int) -> None:
+    """
+    Create the range partition for `year` if it doesn't exist yet, itself
+    hash-partitioned by user_id. Years created before that stay unsplit.
+
+    Rows of that year already in user_activities_default (e.g. increments
+    that arrived after compact_year dropped the year's partition) would make
+    Postgres refuse the partition, so the table is built detached, the rows
+    are moved into it and it is attached, all in the caller's transaction.
+    """
+    name = partition_name(year)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+    bounds = f"FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    db.execute(text(
+        f"CREATE TABLE {name} (LIKE user_activities INCLUDING DEFAULTS) PARTITION BY HASH (user_id)"
+    ))
+    create_hash_partitions(db, name)
+    columns = ", ".join(column.name for column in models.UserActivity.__table__.columns)
+    db.execute(text(
+        f"WITH moved AS ("
+        f"DELETE FROM user_activities_default WHERE date >= '{year}-01-01' AND date < '{year + 1}-01-01' "
+        f"RETURNING {columns}) "
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+    ))
+    db.execute(text(f"ALTER TABLE user_activities ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def _day_index(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+
+def pack_year(year: int, counts: Dict[date, int], existing: Optional[List[int]] = None) -> List[int]:
+    # One slot per day of the year; index 365 only used in leap years
+    packed = list(existing) if existing else [0] * 366
+    for day, count in counts.items():
+        if day.year == year:
+            packed[_day_index(day)] += count
+    return packed
+
+
+def unpack_year(year: int, packed: List[int], start: Optional[date], end: Optional[date]) -> Dict[date, int]:
+    first = date(year, 1, 1)
+    counts = {}
+    for index, count in enumerate(packed or []):
+        if not count:
+            continue
+        day = first + timedelta(days=index)
+        if day.year != year or (start and day < start) or (end and day > end):
+            continue
+        counts[day] = count
+    return counts
+
+
+def load_counts(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None) -> Dict[date, int]:
+    """
+    Daily activity counts for a user, merging packed yearly history with the
+    daily rows. Both lookups are primary-key range scans.
+    """
+    counts: Dict[date, int] = defaultdict(int)
+
+    years = db.query(models.UserActivityYear).filter(models.UserActivityYear.user_id == user_id)
+    if start:
+        years = years.filter(models.UserActivityYear.year >= start.year)
+    if end:
+        years = years.filter(models.UserActivityYear.year <= end.year)
+    for packed in years.all():
+        for day, count in unpack_year(packed.year, packed.counts, start, end).items():
+            counts[day] += count
+
+    daily = db.query(models.UserActivity.date, models.UserActivity.count).filter(
+        models.UserActivity.user_id == user_id
+    )
+    if start:
+        daily = daily.filter(models.UserActivity.date >= start)
+    if end:
+        daily = daily.filter(models.UserActivity.date <= end)
+    for day, count in daily.all():
+        if count:
+            counts[day] += count
+
+    return dict(counts)
+
+
+def compact_year(db: Session, year: int, batch_size: int = 1000) -> int:
+    """
+    Roll a year's daily rows into one packed row per user, in batches of users,
+    then drop the emptied partition. Returns the number of daily rows removed.
+    """
+    removed = 0
+    last_user_id = 0
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    while True:
+        user_ids = [user_id for (user_id,) in db.query(models.UserActivity.user_id).filter(
+            models.UserActivity.date >= start,
+            models.UserActivity.date <= end,
+            models.UserActivity.user_id > last_user_id
+        ).distinct().order_by(models.UserActivity.user_id).limit(batch_size).all()]
+        if not user_ids:
+            break
+
+        rows = db.query(
+            models.UserActivity.user_id, models.UserActivity.date, models.UserActivity.count
+        ).filter(
+            models.UserActivity.user_id.in_(user_ids),
+            models.UserActivity.date >= start,
+            models.UserActivity.date <= end
+        ).all()
+        by_user: Dict[int, Dict[date, int]] = defaultdict(lambda: defaultdict(int))
+        for user_id, day, count in rows:
+            by_user[user_id][day] += count or 0
+
+        existing = {
+            packed.user_id: packed for packed in db.query(models.UserActivityYear).filter(
+                models.UserActivityYear.user_id.in_(user_ids),
+                models.UserActivityYear.year == year
+            ).with_for_update().all()
+        }
+        for user_id, counts in by_user.items():
+            previous = existing.get(user_id)
+            packed = pack_year(year, counts, previous.counts if previous else None)
+            db.execute(insert(models.UserActivityYear).values(
+                user_id=user_id, year=year, counts=packed, total=sum(packed)
+            ).on_conflict_do_update(
+                index_elements=["user_id", "year"],
+                set_={"counts": packed, "total": sum(packed)}
+            ))
+
+        removed += db.query(models.UserActivity).filter(
+            models.UserActivity.user_id.in_(user_ids),
+            models.UserActivity.date >= start,
+            models.UserActivity.date <= end
+        ).delete(synchronize_session=False)
+        db.commit()
+        last_user_id = user_ids[-1]
+        print(f"Compacted {removed} activity rows for {year}")
+
+    db.execute(text(f"DROP TABLE IF EXISTS {partition_name(year)}"))
+    db.commit()
+    return removed
+
+
+def compactable_years(db: Session, today: date, keep_years: int = KEEP_DAILY_YEARS) -> Iterable[int]:
+    oldest = db.query(func.min(models.UserActivity.date)).scalar()
+    if oldest is None:
+        return range(0)
+    return range(oldest.year, today.year - keep_years)
+
+
+if __name__ == "__main__":
+    # Yearly maintenance: python -m app.activity_store [--compact] [--ensure-years N]
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Maintain user_activities partitions and packed history")
+    parser.add_argument("--compact", action="store_true", help="Roll old daily rows into yearly packed rows")
+    parser.add_argument("--keep-years", type=int, default=KEEP_DAILY_YEARS)
+    parser.add_argument("--ensure-years", type=int, default=1, help="Create partitions for this many upcoming years")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    init_engine()
+    db = SessionLocal()
+    try:
+        today = date.today()
+        for year in range(today.year, today.year + args.ensure_years + 1):
+            ensure_year_partition(db, year)
+        db.commit()
+        if args.compact:
+            for year in compactable_years(db, today, args.keep_years):
+                compact_year(db, year, batch_size=args.batch_size)
+    finally:
+        db.close()
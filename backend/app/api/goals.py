@@ -1,124 +1,147 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from .. import schemas, models
-from ..database import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from typing import List, Optional, Tuple
+from .. import schemas, models, idempotency
 from ..auth import get_current_user
+from ..cache import response_cache
+from ..encoding import JSON, encoded_response, render, request_format
+from ..repositories import UnitOfWork, get_uow
 
 router = APIRouter(
     prefix="/goals",
     tags=["goals"]
 )
 
-@router.post("/", response_model=schemas.Goal)
-def create_goal(
-    goal: schemas.GoalCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
+def _require_user(current_user: models.User) -> None:
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+def _tree_nodes(rows: List[Tuple[models.Goal, int]]) -> List[schemas.GoalTreeNode]:
+    return [
+        schemas.GoalTreeNode(
+            id=goal.id,
+            title=goal.title,
+            parent_id=goal.parent_id,
+            depth=depth,
+            completed=goal.completed,
+            is_pinned=goal.is_pinned,
+            subtree_total_tasks=goal.subtree_total_tasks,
+            subtree_completed_tasks=goal.subtree_completed_tasks,
+            progress=round(100 * goal.subtree_completed_tasks / goal.subtree_total_tasks) if goal.subtree_total_tasks else 0
+        )
+        for goal, depth in rows
+    ]
+
+@router.post("/", response_model=schemas.Goal)
+def create_goal(
+    goal: schemas.GoalCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    _require_user(current_user)
+    replayed = idempotency.begin(uow, current_user.id, idempotency_key, "POST /goals", goal.model_dump(mode="json"))
+    if replayed is not None:
+        return replayed
+    if goal.parent_id is not None:
+        uow.goals.require_owned(goal.parent_id, current_user.id)
     
-    db_goal = models.Goal(**goal.dict(), owner_id=current_user.id)
-    db.add(db_goal)
-    db.commit()
-    db.refresh(db_goal)
+    db_goal = uow.goals.add(models.Goal(**goal.model_dump(), owner_id=current_user.id))
+    idempotency.complete(uow, schemas.Goal, db_goal)
+    uow.commit()
     return db_goal
 
 @router.get("/", response_model=List[schemas.Goal])
 def read_goals(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    goals = db.query(models.Goal).filter(
-        models.Goal.owner_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return goals
+    _require_user(current_user)
+    media_type = request_format(request)
+    content = response_cache.get_or_compute(
+        current_user.id, "goals",
+        {"skip": skip, "limit": limit, "format": None if media_type == JSON else media_type},
+        lambda: render(schemas.goal_list_adapter, uow.goals.list_for_owner(current_user.id, skip=skip, limit=limit), media_type)
+    )
+    return encoded_response(content, media_type)
 
 @router.get("/{goal_id}", response_model=schemas.Goal)
 def read_goal(
     goal_id: int,
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    goal = db.query(models.Goal).filter(
-        models.Goal.id == goal_id,
-        models.Goal.owner_id == current_user.id
-    ).first()
-    if goal is None:
-        raise HTTPException(status_code=404, detail="Goal not found")
-    return goal
+    _require_user(current_user)
+    return uow.goals.require_owned(goal_id, current_user.id)
+
+@router.get("/{goal_id}/subtree", response_model=List[schemas.GoalTreeNode])
+def read_goal_subtree(
+    goal_id: int,
+    max_depth: Optional[int] = None,
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    """The goal and all of its sub-goals, breadth first, with rolled-up progress."""
+    _require_user(current_user)
+    uow.goals.require_owned(goal_id, current_user.id)
+    return _tree_nodes(uow.goals.list_subtree(goal_id, max_depth))
+
+@router.get("/{goal_id}/ancestors", response_model=List[schemas.GoalTreeNode])
+def read_goal_ancestors(
+    goal_id: int,
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    """The path from the top-level goal down to this one, with each goal's rolled-up progress."""
+    _require_user(current_user)
+    uow.goals.require_owned(goal_id, current_user.id)
+    return _tree_nodes(uow.goals.list_ancestors(goal_id))
+
+@router.post("/{goal_id}/move", response_model=schemas.Goal)
+def move_goal(
+    goal_id: int,
+    move: schemas.GoalMove,
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    _require_user(current_user)
+    db_goal = uow.goals.require_owned(goal_id, current_user.id)
+    uow.goals.move(db_goal, move.parent_id)
+    uow.commit()
+    return db_goal
 
 @router.put("/{goal_id}", response_model=schemas.Goal)
 def update_goal(
     goal_id: int,
     goal: schemas.GoalUpdate,
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    db_goal = db.query(models.Goal).filter(
-        models.Goal.id == goal_id,
-        models.Goal.owner_id == current_user.id
-    ).first()
-    if db_goal is None:
-        raise HTTPException(status_code=404, detail="Goal not found")
+    _require_user(current_user)
+    db_goal = uow.goals.require_owned(goal_id, current_user.id)
     
     # Filter out None values to avoid overwriting with None
-    update_data = {key: value for key, value in goal.dict().items() if value is not None}
-    for key, value in update_data.items():
-        setattr(db_goal, key, value)
+    update_data = {key: value for key, value in goal.model_dump().items() if value is not None}
+    uow.goals.update(db_goal, update_data)
     
-    db.commit()
-    db.refresh(db_goal)
+    uow.commit()
     return db_goal
 
 @router.delete("/{goal_id}")
 def delete_goal(
     goal_id: int,
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    db_goal = db.query(models.Goal).filter(
-        models.Goal.id == goal_id,
-        models.Goal.owner_id == current_user.id
-    ).first()
-    if db_goal is None:
-        raise HTTPException(status_code=404, detail="Goal not found")
+    _require_user(current_user)
+    db_goal = uow.goals.require_owned(goal_id, current_user.id)
     
-    db.delete(db_goal)
-    db.commit()
-    return {"message": "Goal deleted successfully"} 
\ No newline at end of file
+    uow.goals.delete(db_goal)
+    uow.commit()
+    return {"message": "Goal deleted successfully"}
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, Request
+from typing import List
+from .. import schemas, models
+from ..auth import get_current_user
+from ..cache import response_cache
+from ..encoding import JSON, encoded_response, render, request_format
+from ..repositories import UnitOfWork, get_uow
+
+router = APIRouter(
+    prefix="/tags",
+    tags=["tags"]
+)
+
+@router.get("/", response_model=List[schemas.TagCount])
+def read_tags(
+    request: Request,
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Counts of the user's live tasks per tag, most used first, read from tag_counts
+    media_type = request_format(request)
+    content = response_cache.get_or_compute(
+        current_user.id, "tags",
+        {"format": None if media_type == JSON else media_type},
+        lambda: render(
+            schemas.tag_count_list_adapter,
+            [{"tag": tag, "count": count} for tag, count in uow.tags.list_for_owner(current_user.id)],
+            media_type
+        )
+    )
+    return encoded_response(content, media_type)
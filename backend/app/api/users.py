@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
-from .. import schemas, models
+from .. import schemas, models, stats
 from ..database import get_db
 from ..auth import get_current_user, get_password_hash
+from ..encoding import encoded_response, render, request_format
+from ..repositories import UnitOfWork, get_uow, resolve_today
 from datetime import date, timedelta
 
 router = APIRouter(
@@ -32,59 +34,113 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
+@router.get("/me/dashboard", response_model=schemas.Dashboard)
+def read_dashboard(
+    request: Request,
+    days: int = 365,
+    task_limit: int = 100,
+    today: str = None,  # Optional client-provided today param for consistent dates
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Everything the home page needs on first paint in one request: the user,
+    pinned goals with progress, open tasks and the activity heatmap summary.
+    The user is resolved once and the three reads share the request's
+    session, so a dashboard holds a single pooled connection.
+    """
+    user_id = current_user.id
+    end_date = resolve_today(today)
+    start_date = end_date - timedelta(days=days-1)  # -1 to include today
+
+    pinned_goals = []
+    for goal, total_tasks, completed_tasks in uow.goals.list_pinned_with_progress(user_id):
+        pinned_goals.append(schemas.PinnedGoal(
+            id=goal.id,
+            title=goal.title,
+            description=goal.description,
+            target_date=goal.target_date,
+            is_pinned=goal.is_pinned,
+            parent_id=goal.parent_id,
+            completed=goal.completed,
+            total_tasks=total_tasks,
+            completed_tasks=completed_tasks,
+            progress=round(100 * completed_tasks / total_tasks) if total_tasks else 0
+        ))
+
+    open_tasks = [schemas.Task.model_validate(task) for task in uow.tasks.list_open(user_id, limit=task_limit)]
+
+    counts = uow.activities.counts_by_day(user_id, start_date, end_date)
+    activity_days = {day.isoformat(): count for day, count in sorted(counts.items())}
+
+    dashboard = schemas.Dashboard(
+        user=schemas.User.model_validate(current_user),
+        pinned_goals=pinned_goals,
+        open_tasks=open_tasks,
+        today_count=activity_days.get(end_date.isoformat(), 0),
+        heatmap=schemas.HeatmapSummary(
+            start_date=start_date,
+            end_date=end_date,
+            total=sum(activity_days.values()),
+            active_days=len(activity_days),
+            max_count=max(activity_days.values(), default=0),
+            days=activity_days
+        )
+    )
+    media_type = request_format(request)
+    return encoded_response(render(schemas.dashboard_adapter, dashboard, media_type), media_type)
+
+@router.get("/me/stats", response_model=schemas.UserStats)
+def read_user_stats(
+    today: str = None,  # Optional client-provided today param for consistent dates
+    uow: UnitOfWork = Depends(get_uow),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Streaks, rolling 7/30-day totals and per-goal completion, read from the
+    materialized user_stats row. The row is built on first access.
+    """
+    user_stats = uow.stats.get(current_user.id)
+    if user_stats is None:
+        user_stats = uow.stats.ensure(current_user.id)
+        uow.commit()
+    return stats.to_schema_fields(user_stats, resolve_today(today))
+
 @router.get("/me/tasks", response_model=List[schemas.Task])
 def read_user_tasks(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    include_archived: bool = False,
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    tasks = db.query(models.Task).filter(
-        models.Task.owner_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return tasks
+    media_type = request_format(request)
+    tasks = uow.tasks.list_for_owner(current_user.id, skip=skip, limit=limit, include_archived=include_archived)
+    return encoded_response(render(schemas.task_list_adapter, tasks, media_type), media_type)
 
 @router.get("/me/goals", response_model=List[schemas.Goal])
 def read_user_goals(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
-    goals = db.query(models.Goal).filter(
-        models.Goal.owner_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return goals
+    media_type = request_format(request)
+    goals = uow.goals.list_for_owner(current_user.id, skip=skip, limit=limit)
+    return encoded_response(render(schemas.goal_list_adapter, goals, media_type), media_type)
 
 @router.get("/me/activity", response_model=Dict[str, int])
 def read_user_activity(
+    request: Request,
     days: int = 365,
     today: str = None,  # Optional client-provided today param for consistent dates
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
     try:
-        # Get server's today date
-        server_today = date.today()
-        print(f"Server date: {server_today.isoformat()}")
-        
-        # Use client's today if provided, otherwise use server's today
-        # This helps handle timezone differences
-        if today:
-            try:
-                # Parse the client's today string (YYYY-MM-DD format)
-                client_today = date.fromisoformat(today)
-                print(f"Client provided today: {client_today.isoformat()}")
-                print(f"Server today: {server_today.isoformat()}")
-                
-                # Use client's today for consistency
-                end_date = client_today
-            except ValueError:
-                print(f"Invalid client today format: {today}, using server date")
-                end_date = server_today
-        else:
-            end_date = server_today
-            
+        end_date = resolve_today(today)
         print(f"Using end_date: {end_date.isoformat()}")
         
         # Calculate date range
@@ -93,19 +149,11 @@ def read_user_activity(
         print(f"Fetching activity for user {current_user.id} from {start_date} to {end_date}")
         
         # Query user activities within the date range
-        activities = db.query(models.UserActivity).filter(
-            models.UserActivity.user_id == current_user.id,
-            models.UserActivity.date >= start_date,
-            models.UserActivity.date <= end_date
-        ).all()
-        
-        # Log the found activities
-        print(f"Found {len(activities)} activity records")
-        for activity in activities:
-            print(f"Activity on {activity.date.isoformat()}: {activity.count} tasks")
+        counts = uow.activities.counts_by_day(current_user.id, start_date, end_date)
+        print(f"Found {len(counts)} active days")
         
         # Convert to dictionary with date string as key and count as value
-        activity_data = {activity.date.isoformat(): activity.count for activity in activities}
+        activity_data = {day.isoformat(): count for day, count in counts.items()}
         
         # Fill in missing dates with zero count
         current_date = start_date
@@ -115,11 +163,8 @@ def read_user_activity(
                 activity_data[date_str] = 0
             current_date += timedelta(days=1)
         
-        # Check today's count specifically
-        today_str = end_date.isoformat()
-        print(f"Today's activity count ({today_str}): {activity_data.get(today_str, 0)}")
-        
-        return activity_data
+        media_type = request_format(request)
+        return encoded_response(render(schemas.activity_adapter, activity_data, media_type), media_type)
     except Exception as e:
         print(f"Error retrieving activity data: {str(e)}")
         raise HTTPException(
@@ -127,75 +172,37 @@ def read_user_activity(
             detail=f"Internal server error: {str(e)}"
         )
 
-@router.post("/me/activity/increment", response_model=Dict[str, int])
+@router.post("/me/activity/increment", response_model=Dict[str, Any])
 def increment_activity(
     today: str = None,  # Optional client-provided today param
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Test endpoint to manually increment the activity count.
     This is helpful for debugging activity tracking.
     """
-    # Get server's today date
-    server_today = date.today()
-    
-    # Use client's today if provided, otherwise use server's today
-    if today:
-        try:
-            client_today = date.fromisoformat(today)
-            print(f"Increment: Client provided today: {client_today.isoformat()}")
-            print(f"Increment: Server today: {server_today.isoformat()}")
-            activity_date = client_today
-        except ValueError:
-            print(f"Increment: Invalid client today format: {today}, using server date")
-            activity_date = server_today
-    else:
-        activity_date = server_today
-    
+    activity_date = resolve_today(today)
     print(f"Incrementing activity for date: {activity_date.isoformat()}")
     
-    # Check if there's already an activity record for today
-    db_activity = db.query(models.UserActivity).filter(
-        models.UserActivity.user_id == current_user.id,
-        models.UserActivity.date == activity_date
-    ).first()
-    
-    if db_activity:
-        # Update existing activity count
-        old_count = db_activity.count
-        db_activity.count += 1
-        print(f"Updating activity count for user {current_user.id} on {activity_date}: {old_count} -> {db_activity.count}")
-    else:
-        # Create new activity record
-        db_activity = models.UserActivity(
-            date=activity_date,
-            count=1,
-            user_id=current_user.id
-        )
-        db.add(db_activity)
-        print(f"Creating new activity record for user {current_user.id} on {activity_date} with count 1")
-    
-    # Commit the changes
-    db.commit()
-    db.refresh(db_activity)
+    count = uow.activities.increment(current_user.id, activity_date)
+    uow.commit()
     
     # Return the updated count
-    return {"count": db_activity.count, "date": activity_date.isoformat()}
+    return {"count": count, "date": activity_date.isoformat()}
 
 @router.get("/me/activity/debug", response_model=List[Dict[str, Any]])
 def debug_user_activity(
-    db: Session = Depends(get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(get_current_user)
 ):
     """
     Debug endpoint to view all user activity records in their raw form.
-    This helps identify issues with activity tracking.
+    This helps identify issues with activity tracking. Compacted years are
+    not included.
     """
     # Get all activity records for the user
-    activities = db.query(models.UserActivity).filter(
-        models.UserActivity.user_id == current_user.id
-    ).all()
+    activities = uow.activities.list_all(current_user.id)
     
     # Format the results
     results = []
@@ -208,12 +215,9 @@ def debug_user_activity(
             "created_at": activity.created_at.isoformat() if activity.created_at else None
         })
     
-    # Also check if we have any records for today
+    # Today's record is already among the loaded rows
     today = date.today()
-    today_record = db.query(models.UserActivity).filter(
-        models.UserActivity.user_id == current_user.id,
-        models.UserActivity.date == today
-    ).first()
+    today_record = next((activity for activity in activities if activity.date == today), None)
     
     # Print summary for server logs
     print(f"User {current_user.id} has {len(activities)} activity records")
@@ -221,4 +225,4 @@ def debug_user_activity(
     if today_record:
         print(f"Today's count: {today_record.count}")
     
-    return results 
\ No newline at end of file
+    return results 
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import List
+from sqlalchemy import select, text, union_all
+from sqlalchemy.orm import Session
+import argparse
+import os
+from . import models
+from .cache import response_cache
+
+# Completed one-off tasks untouched for this long move to tasks_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+TASK_COLUMNS = [column.name for column in models.Task.__table__.columns]
+
+
+def tasks_with_archive(*names: str):
+    """
+    UNION ALL of the hot and archived task tables over the given columns (all
+    of Task's by default). Postgres pushes outer filters into both branches.
+    """
+    names = names or TASK_COLUMNS
+    return union_all(
+        select(*(models.Task.__table__.c[name] for name in names)),
+        select(*(models.TaskArchive.__table__.c[name] for name in names))
+    ).subquery("tasks_with_archive")
+
+
+def archive_batch(db: Session, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> List[int]:
+    """
+    Move up to batch_size archivable tasks in one statement and return the
+    owner of each moved task. Goal rollups already count completed tasks and
+    are unchanged by the move; tag_counts only count live tasks, so the moved
+    tasks' tags are taken off in the same statement, which also writes a
+    task.archived outbox event with each moved row.
+    """
+    columns = ", ".join(TASK_COLUMNS)
+    owners = db.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM tasks WHERE id IN (
+                SELECT id FROM tasks
+                WHERE completed AND recurrence_rule IS NULL AND coalesce(updated_at, created_at) < :cutoff
+                ORDER BY coalesce(updated_at, created_at)
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {columns}
+        ), untagged AS (
+            UPDATE tag_counts SET task_count = tag_counts.task_count - removed.tasks
+            FROM (
+                SELECT owner_id, tag, count(*) AS tasks FROM moved, unnest(moved.tags) AS tag
+                GROUP BY owner_id, tag
+            ) AS removed
+            WHERE tag_counts.owner_id = removed.owner_id AND tag_counts.tag = removed.tag
+        ), recorded AS (
+            INSERT INTO outbox (id, event_type, aggregate_type, aggregate_id, owner_id, payload)
+            SELECT nextval('outbox_id_seq'), 'task.archived', 'task', id, owner_id, to_json(moved) FROM moved
+        )
+        INSERT INTO tasks_archive ({columns}, archived_at)
+        SELECT {columns}, now() FROM moved
+        RETURNING owner_id
+    """), {"cutoff": cutoff, "batch_size": batch_size}).scalars().all()
+    return list(owners)
+
+
+def archive_completed(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive in short transactions until no candidates are left; returns how many tasks moved."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        owners = archive_batch(db, cutoff, batch_size)
+        db.commit()
+        for owner_id in set(owners):
+            response_cache.invalidate(owner_id)
+        archived += len(owners)
+        if len(owners) < batch_size:
+            return archived
+        print(f"Archived {archived} tasks so far")
+
+
+if __name__ == "__main__":
+    # Run from cron: python -m app.archive [--days N] [--batch-size N]
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Move old completed tasks into tasks_archive")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive tasks completed more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_engine()
+    db = SessionLocal()
+    try:
+        print(f"Archived {archive_completed(db, args.days, args.batch_size)} tasks")
+    finally:
+        db.close()
@@ -1,17 +1,23 @@
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from . import models, schemas
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from .database import get_db
+from .database import get_db, pin_to_primary_if_recent_write
+from .revocation import revocation_list
+import os
+import secrets
 
 # Configuration
 SECRET_KEY = "your-secret-key-here"  # Change this to a secure secret key in production
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 600
+# Access tokens are short-lived and checked against the in-memory revocation
+# list; refresh tokens are exchanged (and rotated) at POST /token/refresh
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(
@@ -26,16 +32,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access") -> str:
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti names the token in revoked_tokens
+    to_encode.update({"exp": expire, "typ": token_type, "jti": secrets.token_urlsafe(16)})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def issue_tokens(email: str) -> Dict[str, str]:
+    """A new access and refresh token pair, the body of /token and /token/refresh."""
+    return {
+        "access_token": create_access_token(
+            data={"sub": email}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ),
+        "refresh_token": create_access_token(
+            data={"sub": email}, expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), token_type="refresh"
+        ),
+        "token_type": "bearer"
+    }
+
+def decode_token(token: str, token_type: str = "access") -> Dict[str, Any]:
+    """Claims of a valid token of the given type; raises JWTError otherwise."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # Tokens without a jti predate revocation and can't be revoked, so they are refused
+    if payload.get("typ") != token_type or not payload.get("jti") or payload.get("sub") is None:
+        raise JWTError(f"Not a valid {token_type} token")
+    return payload
+
+def revoke_token(db: Session, payload: Dict[str, Any], user_id: int) -> bool:
+    expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+    return revocation_list.revoke(db, payload["jti"], user_id, expires_at)
+
+def get_token_claims(authorization: str) -> Optional[Dict[str, Any]]:
+    """Claims of a valid access token in an Authorization header, without a DB hit."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token(token, "access")
+    except JWTError:
+        return None
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[models.User]:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -44,14 +85,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        payload = decode_token(token, "access")
+        token_data = schemas.TokenData(email=payload["sub"])
     except JWTError:
         raise credentials_exception
-        
+    # In memory unless the Bloom filter says the token may be revoked
+    if revocation_list.is_revoked(db, payload["jti"]):
+        raise credentials_exception
+    
+    pin_to_primary_if_recent_write(db, token_data.email)
     user = db.query(models.User).filter(models.User.email == token_data.email).first()
     if user is None:
         raise credentials_exception
@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import os
+import threading
+import time
+
+# memory | external
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+# uvicorn's default for --workers
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class LRUCacheBackend:
+    """
+    In-process LRU bounded by the total size of stored values. A write only
+    invalidates the entries of the worker that served it, so with several
+    workers the others would serve stale lists until the TTL runs out.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def read_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self.size -= len(value)
+
+
+class InMemoryKeyValueStore:
+    """
+    Local stand-in for an external key-value server, exposing the subset of
+    the redis-py client API that ExternalCacheBackend uses.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires = self._data.get(key, (0, None))
+            value = int(value) + 1
+            self._data[key] = (value, expires)
+            return value
+
+
+class ExternalCacheBackend:
+    """Cache shared across workers through a redis-compatible client; size bounds are the server's job."""
+
+    evictions = 0
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.client.set(key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def read_counter(self, key: str) -> int:
+        value = self.client.get(key)
+        return int(value) if value is not None else 0
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+    Serialized responses keyed by (user_id, route, params). Every user has a
+    generation counter that is part of the key; a write bumps it, which
+    invalidates all of that user's entries in O(1) without scanning keys.
+    Concurrent misses for the same key share one computation (single-flight).
+    """
+
+    def __init__(self, backend: Any, ttl: int = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, user_id: int, route: str, params: Dict[str, Any]) -> str:
+        generation = self.backend.read_counter(f"gen:{user_id}")
+        query = "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+        return f"resp:{user_id}:{generation}:{route}?{query}"
+
+    def get_or_compute(self, user_id: int, route: str, params: Dict[str, Any], compute: Callable[[], bytes]) -> bytes:
+        key = self._key(user_id, route, params)
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            self.coalesced += 1
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self.misses += 1
+        try:
+            flight.value = compute()
+            self.backend.set(key, flight.value, self.ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def invalidate(self, user_id: int) -> None:
+        self.backend.incr(f"gen:{user_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.backend.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "size_bytes": getattr(self.backend, "size", None)
+        }
+
+
+def serialize(adapter: Any, rows: Any) -> bytes:
+    """Validate ORM rows against a pydantic TypeAdapter and dump them to JSON bytes."""
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def _create_backend() -> Any:
+    redis_url = os.getenv("RESPONSE_CACHE_URL")
+    if WEB_CONCURRENCY > 1 and not (RESPONSE_CACHE_BACKEND == "external" and redis_url):
+        raise RuntimeError("With more than one worker, set RESPONSE_CACHE_BACKEND=external and RESPONSE_CACHE_URL")
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return LRUCacheBackend()
+    if RESPONSE_CACHE_BACKEND == "external":
+        if not redis_url:
+            # No server configured: use the local stand-in
+            return ExternalCacheBackend(InMemoryKeyValueStore())
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL requires the redis package")
+        return ExternalCacheBackend(redis.Redis.from_url(redis_url))
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {RESPONSE_CACHE_BACKEND}")
+
+
+response_cache = ResponseCache(_create_backend())
@@ -0,0 +1,131 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+from .auth import get_token_claims
+from .revocation import revocation_list
+
+# Read endpoints the frontend tends to fire several times at once
+COALESCED_PATHS = ("/tasks", "/tasks/", "/goals", "/goals/", "/users/me/activity")
+
+
+def scope_header(scope: Dict[str, Any], name: bytes) -> bytes:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return b""
+
+
+def scope_token_claims(scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return get_token_claims(scope_header(scope, b"authorization").decode("latin-1"))
+
+
+def scope_user_key(scope: Dict[str, Any]) -> Optional[str]:
+    claims = scope_token_claims(scope)
+    return claims["sub"] if claims else None
+
+
+class RequestCoalescer:
+    """
+    Per-worker single-flight state: in-flight reads, per-user write sequence
+    numbers and counters. Only touched from the event loop, so no locking.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self.write_seq: Dict[str, int] = {}
+        self.inflight: Dict[Tuple, "asyncio.Future[List[Dict[str, Any]]]"] = {}
+
+    def bump(self, user_key: str) -> None:
+        self.write_seq[user_key] = self.write_seq.get(user_key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "shared_rate": self.followers / total if total else 0.0,
+            "in_flight": len(self.inflight)
+        }
+
+
+request_coalescer = RequestCoalescer()
+
+
+class RequestCoalescingMiddleware:
+    """
+    ASGI middleware that lets identical concurrent reads share one execution.
+    Reads are keyed by (user, method, path, query, representation headers);
+    followers wait for the leader and replay its response messages.
+
+    Every write by a user bumps that user's write sequence when it starts and
+    when it finishes, and the sequence is part of the key, so a read issued
+    after a write never joins a computation that began before it.
+
+    Only access tokens the revocation filter rules out are coalesced.
+    """
+
+    def __init__(self, app: Any, paths: Iterable[str] = COALESCED_PATHS, coalescer: Optional[RequestCoalescer] = None):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.coalescer = coalescer or request_coalescer
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        claims = scope_token_claims(scope)
+        if claims is None:
+            await self.app(scope, receive, send)
+            return
+        user_key = claims["sub"]
+
+        if scope["method"] not in ("GET", "HEAD"):
+            self.coalescer.bump(user_key)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.coalescer.bump(user_key)
+            return
+
+        # Followers never reach the route's revocation check, so a token that
+        # may be revoked runs on its own and gets its 401 there
+        if scope["path"] not in self.paths or revocation_list.may_be_revoked(claims["jti"]):
+            await self.app(scope, receive, send)
+            return
+
+        key = (
+            user_key,
+            scope["method"],
+            scope["path"],
+            scope.get("query_string", b""),
+            scope_header(scope, b"accept"),
+            scope_header(scope, b"accept-encoding"),
+            self.coalescer.write_seq.get(user_key, 0),
+        )
+        flight = self.coalescer.inflight.get(key)
+        if flight is not None:
+            self.coalescer.followers += 1
+            for message in await asyncio.shield(flight):
+                await send(message)
+            return
+
+        self.coalescer.leaders += 1
+        flight = asyncio.get_running_loop().create_future()
+        self.coalescer.inflight[key] = flight
+        messages: List[Dict[str, Any]] = []
+
+        async def capture(message: Dict[str, Any]) -> None:
+            messages.append(message)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+            flight.set_result(messages)
+        except BaseException as e:
+            flight.set_exception(e)
+            # Mark retrieved so a flight without followers doesn't log a warning
+            flight.exception()
+            raise
+        finally:
+            del self.coalescer.inflight[key]
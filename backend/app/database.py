@@ -1,28 +1,316 @@
-from sqlalchemy import create_engine
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import Insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Request
 from dotenv import load_dotenv
+import itertools
 import os
+import threading
+import time
 
-load_dotenv()
+# Nothing here touches the environment or the database at import time; the
+# engine is created by init_engine(), normally from the app lifespan.
+engine: Optional[Engine] = None
+replica_router: Optional["ReplicaRouter"] = None
 
-POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
-POSTGRES_SERVER = os.getenv("POSTGRES_SERVER", "localhost")
-POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
-POSTGRES_DB = os.getenv("POSTGRES_DB", "planner")
+Base = declarative_base()
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# SQLAlchemy dialect per DATABASE_DRIVER. With psycopg (3) every connection
+# turns a statement into a server-side prepared statement once it has run
+# DATABASE_PREPARE_THRESHOLD times (0 prepares at once, "none" never, e.g.
+# behind a transaction-pooling pgbouncer), keeping up to DATABASE_PREPARED_MAX.
+# The router queries are the same few statements per owner, so they stop
+# being parsed and planned on every request.
+DRIVERS = {"psycopg2": "postgresql+psycopg2", "psycopg": "postgresql+psycopg"}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_driver() -> str:
+    load_dotenv()
+    driver = os.getenv("DATABASE_DRIVER", "psycopg2")
+    if driver not in DRIVERS:
+        raise ValueError(f"Unknown database driver: {driver}")
+    return driver
 
-Base = declarative_base()
+def with_driver(url: str, driver: Optional[str] = None) -> str:
+    """The same URL with the scheme of the configured (or given) driver."""
+    scheme, separator, rest = url.partition("://")
+    if not separator or scheme.split("+")[0] not in ("postgresql", "postgres"):
+        return url
+    return f"{DRIVERS[driver or get_driver()]}://{rest}"
+
+def engine_options(url: str) -> Dict[str, Any]:
+    if not url.startswith(DRIVERS["psycopg"] + "://"):
+        return {}
+    threshold = os.getenv("DATABASE_PREPARE_THRESHOLD", "2")
+    return {"connect_args": {"prepare_threshold": None if threshold.lower() == "none" else int(threshold)}}
+
+def create_db_engine(url: str, **kwargs) -> Engine:
+    """An engine for `url` with the driver's settings from engine_options applied."""
+    created = create_engine(url, **{**engine_options(url), **kwargs})
+    if url.startswith(DRIVERS["psycopg"] + "://"):
+        # prepared_max is a connection attribute, not a libpq option, so it is set per connection
+        prepared_max = int(os.getenv("DATABASE_PREPARED_MAX", "200"))
+
+        @event.listens_for(created, "connect")
+        def _set_prepared_max(dbapi_connection, connection_record):
+            dbapi_connection.prepared_max = prepared_max
+    return created
+
+@lru_cache()
+def get_database_url(driver: Optional[str] = None) -> str:
+    load_dotenv()
+
+    POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
+    POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
+    POSTGRES_SERVER = os.getenv("POSTGRES_SERVER", "localhost")
+    POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
+    POSTGRES_DB = os.getenv("POSTGRES_DB", "planner")
+
+    return with_driver(f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}", driver)
+
+@lru_cache()
+def get_replica_urls() -> List[str]:
+    # Comma-separated, e.g. two local instances: postgresql://...:5433/planner,postgresql://...:5434/planner
+    load_dotenv()
+    return [with_driver(url.strip()) for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+
+class ReplicaRouter:
+    """Picks a replica engine per session, round-robin or by fewest checked-out connections."""
+
+    def __init__(self, engines: List[Engine], strategy: str = "round_robin"):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.engines = engines
+        self.strategy = strategy
+        self._cycle = itertools.cycle(engines)
+        self._lock = threading.Lock()
+
+    def choose(self) -> Engine:
+        if self.strategy == "least_connections":
+            return min(self.engines, key=lambda replica: replica.pool.checkedout())
+        with self._lock:
+            return next(self._cycle)
+
+    def dispose(self) -> None:
+        for replica in self.engines:
+            replica.dispose()
+
+
+class RecentWrites:
+    """
+    Short-lived per-user markers so reads right after a write go to the
+    primary instead of a replica that may not have caught up yet. Marks all
+    live for the same TTL, so the oldest expire first and are evicted from
+    the front on every mark; past max_keys the oldest go early.
+    """
+
+    def __init__(self, ttl_seconds: float, max_keys: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._marks: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._marks.pop(key, None)
+            self._marks[key] = now + self.ttl_seconds
+            while self._marks and (len(self._marks) > self.max_keys or next(iter(self._marks.values())) < now):
+                self._marks.popitem(last=False)
+
+    def is_recent(self, key: str) -> bool:
+        with self._lock:
+            expires = self._marks.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._marks[key]
+                return False
+            return True
+
+
+class SharedRecentWrites:
+    """
+    The same markers kept in a redis-compatible server with a TTL, so a read
+    that lands on another worker than the write still goes to the primary.
+    """
+
+    def __init__(self, client: Any, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+
+    def mark(self, key: str) -> None:
+        self.client.set(f"primary_pin:{key}", 1, px=max(1, int(self.ttl_seconds * 1000)))
+
+    def is_recent(self, key: str) -> bool:
+        return bool(self.client.exists(f"primary_pin:{key}"))
+
+
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+# Replaced by a SharedRecentWrites in init_engine when REPLICA_PIN_URL is set
+recent_writes: Any = RecentWrites(REPLICA_PIN_SECONDS)
+
+def _create_recent_writes() -> Any:
+    redis_url = os.getenv("REPLICA_PIN_URL")
+    if not redis_url:
+        return RecentWrites(REPLICA_PIN_SECONDS)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("REPLICA_PIN_URL requires the redis package")
+    return SharedRecentWrites(redis.Redis.from_url(redis_url), REPLICA_PIN_SECONDS)
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to a replica when the session is marked read-only
+    (info["replica"]). Writes, flushes and locking reads always use the
+    primary, and the first write pins the rest of the session to it.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("replica") and replica_router is not None:
+            writing = self._flushing or getattr(clause, "is_dml", False) or \
+                getattr(clause, "_for_update_arg", None) is not None
+            if writing:
+                self.info["replica"] = False
+            else:
+                if "replica_engine" not in self.info:
+                    # Sticky per session so one request sees one snapshot
+                    self.info["replica_engine"] = replica_router.choose()
+                return self.info["replica_engine"]
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _mark_recent_write(session):
+    if session.info.pop("wrote", False) and session.info.get("user_key"):
+        recent_writes.mark(session.info["user_key"])
+
+
+@contextmanager
+def pipeline(db: Session) -> Iterator[None]:
+    """
+    Run the statements of the block in psycopg 3 pipeline mode: they are sent
+    without waiting for each other and answered in one round trip when the
+    block ends. Only for statements whose results are not read, since
+    SQLAlchemy sees no rows or rowcount until the sync. Errors surface at the
+    end of the block as psycopg exceptions. A no-op with psycopg2.
+    """
+    connection = db.connection().connection.driver_connection
+    if not hasattr(connection, "pipeline"):
+        yield
+        return
+    with connection.pipeline():
+        yield
+
+def defer_write(db: Session, statement: Any) -> None:
+    """
+    Queue a write whose result nobody reads (outbox events, jobs, counter
+    deltas) until just before the transaction commits, where all queued
+    writes go out in one pipeline. Inside a savepoint the write runs at once,
+    so rolling the savepoint back still undoes it.
+    """
+    if db.in_nested_transaction():
+        db.execute(statement)
+    else:
+        db.info.setdefault("deferred_writes", []).append(statement)
+
+def flush_deferred_writes(db: Session) -> None:
+    statements = db.info.pop("deferred_writes", None)
+    if not statements:
+        return
+    # Writes pin the session to the primary, so the pipeline opens there too
+    db.info["replica"] = False
+    # ORM flushes check rowcounts, so they run before the pipeline starts
+    db.flush()
+    # Core execution on the session's connection: Session.execute would send these
+    # inserts through the ORM bulk path, which reads results the pipeline hasn't got yet.
+    # Inline inserts skip the implicit RETURNING of the new primary key for the same reason.
+    connection = db.connection()
+    with pipeline(db):
+        for statement in statements:
+            if isinstance(statement, Insert) and not statement._returning:
+                statement = statement.inline()
+            connection.execute(statement)
+
+@event.listens_for(Session, "before_commit")
+def _flush_deferred_writes(session):
+    # Also fired when a savepoint is released; the queue belongs to the outer transaction
+    if not session.in_nested_transaction():
+        flush_deferred_writes(session)
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_deferred_writes(session, transaction):
+    # A rolled back transaction takes its queued writes with it
+    if transaction.parent is None:
+        session.info.pop("deferred_writes", None)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+def init_engine(url: Optional[str] = None, **kwargs) -> Engine:
+    global engine, replica_router, recent_writes
+    if engine is None:
+        url = url or get_database_url()
+        engine = create_db_engine(url, **{"pool_pre_ping": True, **kwargs})
+        SessionLocal.configure(bind=engine)
+        replica_urls = get_replica_urls()
+        if replica_urls:
+            recent_writes = _create_recent_writes()
+            replica_router = ReplicaRouter(
+                [
+                    create_db_engine(replica_url, **{"pool_pre_ping": True, **kwargs})
+                    for replica_url in replica_urls
+                ],
+                strategy=os.getenv("REPLICA_STRATEGY", "round_robin")
+            )
+    return engine
+
+def prewarm_pool(size: int) -> None:
+    """Open `size` connections up front so the first requests don't pay for connects."""
+    engines = [init_engine()] + (replica_router.engines if replica_router else [])
+    for warm_engine in engines:
+        connections = [warm_engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
+
+def dispose_engine() -> None:
+    global engine, replica_router
+    if replica_router is not None:
+        replica_router.dispose()
+        replica_router = None
+    if engine is not None:
+        engine.dispose()
+        engine = None
+
+def pin_to_primary_if_recent_write(db: Session, user_key: str) -> None:
+    # Called once the user is known; later commits mark this user as a recent writer
+    db.info["user_key"] = user_key
+    if recent_writes.is_recent(user_key):
+        db.info["replica"] = False
 
 # Dependency
-def get_db():
+def get_db(request: Request = None):
     db = SessionLocal()
+    # Read-only requests may be served by a replica
+    db.info["replica"] = request is not None and request.method in ("GET", "HEAD")
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
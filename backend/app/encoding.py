@@ -0,0 +1,183 @@
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import gzip
+import json
+import os
+from fastapi import Request, Response
+from .cache import serialize
+from .coalesce import scope_header
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Lists of objects are sent as one array per field instead of one object per row
+COLUMNAR_JSON = "application/vnd.planner.columnar+json"
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = (JSON, MSGPACK, COLUMNAR_JSON, "text/")
+
+
+def _media_ranges(header: str) -> List[Tuple[str, float]]:
+    ranges = []
+    for part in header.split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            ranges.append((media_type.lower(), quality))
+    # Stable sort keeps the client's order for equal q values
+    return sorted(ranges, key=lambda item: -item[1])
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response format from an Accept header; JSON unless the client prefers another."""
+    for media_type, _ in _media_ranges(accept or ""):
+        if media_type in (MSGPACK, "application/x-msgpack") and msgpack is not None:
+            return MSGPACK
+        if media_type == COLUMNAR_JSON:
+            return COLUMNAR_JSON
+        if media_type in (JSON, "application/*", "*/*"):
+            return JSON
+    return JSON
+
+
+def request_format(request: Request) -> str:
+    return negotiate(request.headers.get("accept"))
+
+
+def to_columnar(value: Any) -> Any:
+    """
+    Turn every list of objects into an object of equal-length arrays, recursively.
+    Mappings such as the activity heatmap have no repeated keys and are left as is.
+    """
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            # Rows come from one schema, so the first row's fields are everyone's
+            columns: Dict[str, List[Any]] = {name: [] for name in value[0]}
+            for item in value:
+                for name, column in columns.items():
+                    column.append(to_columnar(item.get(name)))
+            return columns
+        return [to_columnar(item) for item in value]
+    if isinstance(value, dict):
+        return {name: to_columnar(item) for name, item in value.items()}
+    return value
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Naive timestamps are stored as UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as msgpack")
+
+
+def render(adapter: Any, value: Any, media_type: str) -> bytes:
+    """Validate value against a pydantic TypeAdapter and encode it in the negotiated format."""
+    if media_type == JSON:
+        return serialize(adapter, value)
+    validated = adapter.validate_python(value, from_attributes=True)
+    if media_type == COLUMNAR_JSON:
+        data = to_columnar(adapter.dump_python(validated, mode="json"))
+        return json.dumps(data, separators=(",", ":")).encode()
+    return msgpack.packb(adapter.dump_python(validated), default=_msgpack_default, datetime=False)
+
+
+def encoded_response(content: bytes, media_type: str) -> Response:
+    return Response(content=content, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def _accepted_encoding(header: bytes) -> Optional[str]:
+    tokens = set()
+    for part in header.decode("latin-1").split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if not any(param.replace(" ", "") in ("q=0", "q=0.0") for param in params):
+            tokens.add(name.lower())
+    if brotli is not None and "br" in tokens:
+        return "br"
+    if "gzip" in tokens:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete (non-streaming) responses of at least minimum_size
+    bytes with brotli when the client accepts it and the package is
+    installed, otherwise gzip. Streaming responses pass through untouched.
+    """
+
+    def __init__(self, app: Any, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        encoding = _accepted_encoding(scope_header(scope, b"accept-encoding")) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+
+        async def compressing_send(message: Dict[str, Any]) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            pending, start = start, None
+            headers = [(key, value) for key, value in pending.get("headers", [])]
+            body = message.get("body", b"")
+            content_type = next((value for key, value in headers if key.lower() == b"content-type"), b"").decode("latin-1")
+            already_encoded = any(key.lower() == b"content-encoding" for key, _ in headers)
+            if (
+                message.get("more_body")
+                or already_encoded
+                or len(body) < self.minimum_size
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(pending)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**pending, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,56 @@
+from typing import Any, Dict, List, Set, Tuple
+from sqlalchemy import func, tuple_, update
+from sqlalchemy.orm import Session
+from . import jobs
+from . import models
+
+
+def recompute_goals(db: Session, goals: List[Tuple[int, int]]) -> Set[int]:
+    """
+    Recompute Goal.completed for many (owner_id, goal_id) pairs with one
+    grouped count and one bulk UPDATE. Only the owner's own tasks count, so
+    a task pointing at another user's goal can't flip it, and filtering on
+    owner_id prunes both queries to the owners' partitions. Goals without
+    tasks keep their manually set status. Returns the owners of goals that
+    changed. Archived tasks are always completed, so leaving tasks_archive
+    out doesn't change the outcome.
+    """
+    owner_ids = sorted({owner_id for owner_id, _ in goals})
+    rows = db.query(
+        models.Task.owner_id,
+        models.Task.goal_id,
+        func.count(models.Task.id),
+        func.count(models.Task.id).filter(models.Task.completed == True)
+    ).filter(
+        models.Task.owner_id.in_(owner_ids),
+        tuple_(models.Task.owner_id, models.Task.goal_id).in_(goals)
+    ).group_by(models.Task.owner_id, models.Task.goal_id).all()
+
+    with_tasks = [(owner_id, goal_id) for owner_id, goal_id, _, _ in rows]
+    done = [(owner_id, goal_id) for owner_id, goal_id, total, completed in rows if total > 0 and completed == total]
+    if not with_tasks:
+        return set()
+
+    goal_key = tuple_(models.Goal.owner_id, models.Goal.id)
+    completed = goal_key.in_(done)
+    changed = db.execute(
+        update(models.Goal)
+        .where(
+            models.Goal.owner_id.in_(owner_ids),
+            goal_key.in_(with_tasks),
+            models.Goal.completed.is_distinct_from(completed)
+        )
+        .values(completed=completed)
+        .returning(models.Goal.owner_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    return set(changed)
+
+
+@jobs.handler("goals.recompute")
+def recompute_goals_job(db: Session, payloads: List[Dict[str, Any]]) -> Set[int]:
+    # Every pending recompute in the batch is merged into one pass
+    goals = set()
+    for payload in payloads:
+        goals.update((payload["owner_id"], goal_id) for goal_id in payload["goal_ids"])
+    return recompute_goals(db, sorted(goals)) if goals else set()
@@ -0,0 +1,206 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, insert, literal, or_, select, text, update
+from sqlalchemy.orm import Session, aliased
+import argparse
+from . import models
+from . import archive
+
+# Advisory lock class for one owner's goal hierarchy. Task rollups take it
+# shared, structural changes (moves, deletes) take it exclusive, so a move
+# never races with a delta that was computed against the old ancestors.
+GOAL_TREE_LOCK = 4201
+
+_closure = models.GoalClosure
+
+
+def lock_tree(db: Session, owner_id: int, exclusive: bool = False) -> None:
+    function = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    db.execute(text(f"SELECT {function}(:lock, :owner_id)"), {"lock": GOAL_TREE_LOCK, "owner_id": owner_id})
+
+
+def _ancestor_ids(goal_id: int, include_self: bool = True):
+    query = select(_closure.ancestor_id).where(_closure.descendant_id == goal_id)
+    return query if include_self else query.where(_closure.depth > 0)
+
+
+def _descendant_ids(goal_id: int, include_self: bool = True):
+    query = select(_closure.descendant_id).where(_closure.ancestor_id == goal_id)
+    return query if include_self else query.where(_closure.depth > 0)
+
+
+def _add_counts(db: Session, owner_id: int, goal_ids, total: int, completed: int) -> None:
+    if not total and not completed:
+        return
+    # owner_id keeps the update inside the owner's tree and lets Postgres prune to their partition
+    db.execute(
+        update(models.Goal)
+        .where(models.Goal.owner_id == owner_id, models.Goal.id.in_(goal_ids))
+        .values(
+            subtree_total_tasks=models.Goal.subtree_total_tasks + total,
+            subtree_completed_tasks=models.Goal.subtree_completed_tasks + completed
+        )
+        .execution_options(synchronize_session="fetch")
+    )
+
+
+def insert_paths(db: Session, goal_id: int, parent_id: Optional[int]) -> None:
+    """Link a new goal to itself and to every ancestor of its parent in one INSERT ... SELECT."""
+    paths = select(_closure.ancestor_id, literal(goal_id), _closure.depth + 1).where(_closure.descendant_id == parent_id)
+    db.execute(insert(_closure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        paths.union_all(select(literal(goal_id), literal(goal_id), literal(0)))
+    ))
+
+
+def apply_task_delta(db: Session, owner_id: int, goal_id: int, total: int, completed: int) -> None:
+    """Add task count deltas to a goal and all of its ancestors with one indexed UPDATE."""
+    if not total and not completed:
+        return
+    lock_tree(db, owner_id)
+    _add_counts(db, owner_id, _ancestor_ids(goal_id), total, completed)
+
+
+def is_descendant(db: Session, ancestor_id: int, goal_id: int) -> bool:
+    return db.query(_closure).filter(
+        _closure.ancestor_id == ancestor_id,
+        _closure.descendant_id == goal_id
+    ).first() is not None
+
+
+def subtree(db: Session, goal_id: int, max_depth: Optional[int] = None) -> List[Tuple[models.Goal, int]]:
+    """A goal and all of its sub-goals with their depth below it, breadth first."""
+    query = db.query(models.Goal, _closure.depth).join(
+        _closure, _closure.descendant_id == models.Goal.id
+    ).filter(_closure.ancestor_id == goal_id)
+    if max_depth is not None:
+        query = query.filter(_closure.depth <= max_depth)
+    return query.order_by(_closure.depth, models.Goal.id).all()
+
+
+def ancestors(db: Session, goal_id: int) -> List[Tuple[models.Goal, int]]:
+    """The path from the root goal down to (and including) goal_id, with each goal's distance from it."""
+    return db.query(models.Goal, _closure.depth).join(
+        _closure, _closure.ancestor_id == models.Goal.id
+    ).filter(_closure.descendant_id == goal_id).order_by(_closure.depth.desc()).all()
+
+
+def move_subtree(db: Session, goal: models.Goal, parent_id: Optional[int]) -> None:
+    """
+    Re-parent a goal with all of its sub-goals: drop the paths from the old
+    ancestors, add the cross product of the new parent's ancestors and the
+    subtree, and move the subtree's counts from the old ancestors to the new.
+    """
+    lock_tree(db, goal.owner_id, exclusive=True)
+    db.flush()
+    # Counts read under the exclusive lock can't change until commit
+    db.refresh(goal)
+    if parent_id is not None and is_descendant(db, goal.id, parent_id):
+        raise ValueError("A goal cannot be moved under itself or one of its sub-goals")
+
+    total, completed = goal.subtree_total_tasks, goal.subtree_completed_tasks
+    old_ancestors = _ancestor_ids(goal.id, include_self=False)
+    _add_counts(db, goal.owner_id, old_ancestors, -total, -completed)
+    db.execute(delete(_closure).where(
+        _closure.descendant_id.in_(_descendant_ids(goal.id)),
+        _closure.ancestor_id.in_(old_ancestors)
+    ))
+
+    if parent_id is not None:
+        parent_paths = aliased(models.GoalClosure)
+        subtree_paths = aliased(models.GoalClosure)
+        db.execute(insert(_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                parent_paths.ancestor_id,
+                subtree_paths.descendant_id,
+                parent_paths.depth + subtree_paths.depth + 1
+            ).where(parent_paths.descendant_id == parent_id, subtree_paths.ancestor_id == goal.id)
+        ))
+        _add_counts(db, goal.owner_id, _ancestor_ids(parent_id), total, completed)
+
+    goal.parent_id = parent_id
+
+
+def detach(db: Session, goal: models.Goal) -> None:
+    """
+    Unlink a goal that is about to be deleted. Its sub-goals move up to its
+    parent and its own tasks stop counting towards its ancestors.
+    """
+    lock_tree(db, goal.owner_id, exclusive=True)
+    db.flush()
+    tasks = archive.tasks_with_archive("id", "goal_id", "completed")
+    total, completed = db.query(
+        func.count(tasks.c.id),
+        func.count(tasks.c.id).filter(tasks.c.completed == True)
+    ).filter(tasks.c.goal_id == goal.id).one()
+
+    proper_ancestors = _ancestor_ids(goal.id, include_self=False)
+    _add_counts(db, goal.owner_id, proper_ancestors, -total, -completed)
+    db.execute(
+        update(_closure)
+        .where(
+            _closure.descendant_id.in_(_descendant_ids(goal.id, include_self=False)),
+            _closure.ancestor_id.in_(proper_ancestors)
+        )
+        .values(depth=_closure.depth - 1)
+    )
+    db.execute(delete(_closure).where(or_(_closure.ancestor_id == goal.id, _closure.descendant_id == goal.id)))
+    db.execute(
+        update(models.Goal)
+        .where(models.Goal.parent_id == goal.id)
+        .values(parent_id=goal.parent_id)
+        .execution_options(synchronize_session="fetch")
+    )
+
+
+def rebuild(db: Session) -> None:
+    """Recompute goal_closure from goals.parent_id and every goal's rolled-up counts."""
+    db.execute(text("DELETE FROM goal_closure"))
+    db.execute(text("""
+        WITH RECURSIVE paths (ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM goals
+            UNION ALL
+            SELECT paths.ancestor_id, goals.id, paths.depth + 1
+            FROM paths JOIN goals ON goals.parent_id = paths.descendant_id
+        )
+        INSERT INTO goal_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, descendant_id, depth FROM paths
+    """))
+    db.execute(text("""
+        UPDATE goals SET
+            subtree_total_tasks = rollup.total,
+            subtree_completed_tasks = rollup.completed
+        FROM (
+            SELECT goal_closure.ancestor_id AS goal_id,
+                   count(tasks.id) AS total,
+                   count(tasks.id) FILTER (WHERE tasks.completed) AS completed
+            FROM goal_closure LEFT JOIN (
+                SELECT id, goal_id, completed FROM tasks
+                UNION ALL
+                SELECT id, goal_id, completed FROM tasks_archive
+            ) AS tasks ON tasks.goal_id = goal_closure.descendant_id
+            GROUP BY goal_closure.ancestor_id
+        ) AS rollup
+        WHERE goals.id = rollup.goal_id
+    """))
+
+
+if __name__ == "__main__":
+    # Repair: python -m app.goal_tree --rebuild
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Maintain the goal hierarchy closure table and rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute goal_closure and subtree task counts")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        init_engine()
+        db = SessionLocal()
+        try:
+            rebuild(db)
+            db.commit()
+            print("Rebuilt goal hierarchy")
+        finally:
+            db.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Type
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import hashlib
+import json
+import os
+from . import models
+
+# How long a stored response answers retries of the same Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(operation: str, body: Any) -> bytes:
+    """Hash of what a request asks for, so a key reused for a different request is rejected."""
+    encoded = json.dumps([operation, body], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).digest()[:16]
+
+
+def begin(uow: Any, user_id: int, key: Optional[str], operation: str, body: Any) -> Optional[Response]:
+    """
+    Claim `key` for this request inside the unit of work's transaction, or
+    return the stored response of the request that already used it. A
+    concurrent request with the same key waits on the insert until the first
+    one commits (and replays it) or rolls back (and takes over the key).
+    Requests without a key always run.
+    """
+    if not key:
+        return None
+    request_hash = fingerprint(operation, body)
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    claimed = uow.db.execute(
+        insert(models.IdempotencyKey)
+        .values(user_id=user_id, key=key, request_hash=request_hash, expires_at=expires_at)
+        .on_conflict_do_nothing()
+        .returning(models.IdempotencyKey.key)
+    ).first()
+    if claimed is None:
+        stored = uow.db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.key == key
+        ).with_for_update().one()
+        if stored.expires_at > now:
+            if stored.request_hash != request_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            return Response(
+                content=stored.response,
+                status_code=stored.status_code,
+                media_type="application/json",
+                headers={REPLAYED_HEADER: "true"}
+            )
+        # Expired but not pruned yet: reuse the row for this request
+        stored.request_hash = request_hash
+        stored.status_code = None
+        stored.response = None
+        stored.expires_at = expires_at
+    uow.idempotency_key = (user_id, key)
+    return None
+
+
+def complete(uow: Any, schema: Type[BaseModel], value: Any, status_code: int = 200) -> None:
+    """Store the response in the same transaction as the change it describes."""
+    if uow.idempotency_key is None:
+        return
+    user_id, key = uow.idempotency_key
+    uow.db.flush()
+    uow.db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.key == key
+    ).update({
+        models.IdempotencyKey.status_code: status_code,
+        models.IdempotencyKey.response: schema.model_validate(value).model_dump_json().encode()
+    }, synchronize_session=False)
+    uow.idempotency_key = None
+
+
+def prune(db: Session) -> int:
+    return db.execute(delete(models.IdempotencyKey).where(
+        models.IdempotencyKey.expires_at < datetime.now(timezone.utc)
+    )).rowcount
@@ -0,0 +1,215 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import os
+import threading
+import time
+from . import idempotency
+from . import models
+from . import revocation
+from .cache import response_cache
+
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "200"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "8"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+# Finished rows are kept this long so their idempotency keys keep deduplicating
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "48"))
+
+# kind -> handler(db, payloads) returning the owners whose cached listings it made stale.
+# Handlers get every payload of their kind in a claimed batch and must not commit.
+Handler = Callable[[Session, List[Dict[str, Any]]], Set[int]]
+HANDLERS: Dict[str, Handler] = {}
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    def register(function: Handler) -> Handler:
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def job_insert(kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> Any:
+    statement = insert(models.BackgroundJob).values(kind=kind, payload=payload, idempotency_key=idempotency_key)
+    if idempotency_key is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=["idempotency_key"])
+    return statement
+
+
+def enqueue(db: Session, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> None:
+    """
+    Add a job in the caller's transaction, so it is durable exactly when the
+    write that caused it commits. A repeated idempotency key is ignored.
+    """
+    db.execute(job_insert(kind, payload, idempotency_key))
+
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+
+
+class JobRunner:
+    """
+    Worker thread that claims due jobs with FOR UPDATE SKIP LOCKED, runs each
+    kind's handler over the whole batch, and marks the jobs done in the same
+    transaction as their effects, so a crash either loses nothing or redoes
+    nothing. A failing batch is retried job by job, so one bad payload only
+    delays itself; it is retried with exponential backoff and parked as dead
+    after max_attempts. Several workers can share the table.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        interval_seconds: float = JOB_POLL_INTERVAL_SECONDS,
+        batch_size: int = JOB_BATCH_SIZE,
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.processed = 0
+        self.retried = 0
+        self.last_lag_seconds = 0.0
+        self._last_prune = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        self.session_factory = session_factory
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds * 5)
+            self._thread = None
+
+    def wake(self) -> None:
+        """Called after a commit that enqueued jobs, so they run without waiting for the next poll."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                # Keep draining while full batches come back
+                while self.run_once() == self.batch_size:
+                    pass
+                if time.monotonic() - self._last_prune > 3600:
+                    self.prune()
+            except Exception as e:
+                print(f"Job runner error: {str(e)}")
+
+    def run_once(self) -> int:
+        db = self.session_factory()
+        try:
+            now = datetime.now(timezone.utc)
+            jobs = db.query(models.BackgroundJob).filter(
+                models.BackgroundJob.status == "pending",
+                models.BackgroundJob.run_after <= now
+            ).order_by(models.BackgroundJob.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+            if not jobs:
+                db.commit()
+                return 0
+
+            by_kind: Dict[str, List[models.BackgroundJob]] = defaultdict(list)
+            for job in jobs:
+                by_kind[job.kind].append(job)
+
+            stale_owners: Set[int] = set()
+            for kind, group in by_kind.items():
+                try:
+                    with db.begin_nested():
+                        stale_owners |= self._handle(db, kind, group)
+                    self._finish(group, now)
+                except Exception:
+                    # Isolate the failure: run the group's jobs one at a time
+                    for job in group:
+                        try:
+                            with db.begin_nested():
+                                stale_owners |= self._handle(db, kind, [job])
+                            self._finish([job], now)
+                        except Exception as e:
+                            self._fail(job, e, now)
+            db.commit()
+        finally:
+            db.close()
+
+        for owner_id in stale_owners:
+            response_cache.invalidate(owner_id)
+        return len(jobs)
+
+    def _handle(self, db: Session, kind: str, jobs: List[models.BackgroundJob]) -> Set[int]:
+        function = HANDLERS.get(kind)
+        if function is None:
+            raise ValueError(f"No handler registered for job kind {kind}")
+        return function(db, [job.payload for job in jobs]) or set()
+
+    def _finish(self, jobs: Iterable[models.BackgroundJob], now: datetime) -> None:
+        for job in jobs:
+            job.status = "done"
+            job.finished_at = now
+            self.processed += 1
+            self.last_lag_seconds = (now - job.created_at).total_seconds()
+
+    def _fail(self, job: models.BackgroundJob, error: Exception, now: datetime) -> None:
+        job.attempts += 1
+        job.last_error = str(error)
+        if job.attempts >= self.max_attempts:
+            job.status = "dead"
+            job.finished_at = now
+            print(f"Job {job.id} ({job.kind}) failed {job.attempts} times, giving up: {str(error)}")
+        else:
+            job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+            self.retried += 1
+
+    def prune(self) -> int:
+        self._last_prune = time.monotonic()
+        db = self.session_factory()
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=JOB_RETENTION_HOURS)
+            removed = db.execute(delete(models.BackgroundJob).where(
+                models.BackgroundJob.status == "done",
+                models.BackgroundJob.finished_at < cutoff
+            )).rowcount
+            # Expired idempotency keys and revocations are housekeeping of the same kind
+            idempotency.prune(db)
+            revocation.prune(db)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def stats(self, db: Session) -> Dict[str, Any]:
+        depth, oldest = db.query(
+            func.count(models.BackgroundJob.id),
+            func.min(models.BackgroundJob.created_at)
+        ).filter(models.BackgroundJob.status == "pending").one()
+        dead = db.query(func.count(models.BackgroundJob.id)).filter(models.BackgroundJob.status == "dead").scalar()
+        return {
+            "depth": depth,
+            "oldest_pending_seconds": (datetime.now(timezone.utc) - oldest).total_seconds() if oldest else 0.0,
+            "dead": dead,
+            "processed": self.processed,
+            "retried": self.retried,
+            "last_lag_seconds": self.last_lag_seconds,
+            "running": self._thread is not None
+        }
+
+
+job_runner = JobRunner()
@@ -1,32 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, Header, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import timedelta
-from . import models, schemas, database, auth
-from .database import engine, get_db
-from .api import tasks, users, goals
-
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="Extended Planner API",
-    description="API for the Extended Planner application",
-    version="1.0.0"
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+import os
+from . import models, schemas, database, auth, idempotency
+from .database import get_db
+from .cache import response_cache
+from .encoding import JSON, CompressionMiddleware, encoded_response, render, request_format
+from .coalesce import RequestCoalescingMiddleware, request_coalescer
+from .ratelimit import AdmissionControlMiddleware
+from .profiling import ProfilingMiddleware, profile_store, require_profile_admin
+from .repositories import UnitOfWork, get_uow, resolve_today
+from .revocation import revocation_list
+from .jobs import job_runner
+from .outbox import OUTBOX_RELAY_ENABLED, outbox_relay
+from .scheduler import RECURRENCE_SCHEDULER_ENABLED, RecurrenceScheduler
+
+# Connections to open at startup; 0 leaves the pool to fill on demand
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "0"))
+
+router = APIRouter()
 
 # User registration and authentication endpoints
-@app.post("/register", response_model=schemas.User)
+@router.post("/register", response_model=schemas.User)
 async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user:
@@ -43,7 +43,7 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
-@app.post("/token", response_model=schemas.Token, summary="Create access token", description="OAuth2 compatible token login, get an access token for future requests")
+@router.post("/token", response_model=schemas.Token, summary="Create access token", description="OAuth2 compatible token login, get an access token for future requests")
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -62,108 +62,282 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+    return auth.issue_tokens(user.email)
+
+@router.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new token pair. The old refresh token is
+    revoked in the same step, so replaying it, even concurrently, fails.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    try:
+        payload = auth.decode_token(body.refresh_token, "refresh")
+    except JWTError:
+        raise invalid
+    user = db.query(models.User).filter(models.User.email == payload["sub"]).first()
+    if user is None or not auth.revoke_token(db, payload, user.id):
+        raise invalid
+    db.commit()
+    return auth.issue_tokens(user.email)
 
-@app.get("/users/me", response_model=schemas.User)
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(
+    body: Optional[schemas.LogoutRequest] = None,
+    token: str = Depends(auth.oauth2_scheme),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Revokes the access token the request was made with and, if given, the session's refresh token
+    auth.revoke_token(db, auth.decode_token(token, "access"), current_user.id)
+    if body is not None and body.refresh_token:
+        try:
+            refresh = auth.decode_token(body.refresh_token, "refresh")
+        except JWTError:
+            refresh = None
+        if refresh is not None and refresh["sub"] == current_user.email:
+            auth.revoke_token(db, refresh, current_user.id)
+    db.commit()
+
+@router.get("/users/me", response_model=schemas.User)
 async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return current_user
 
 # Task endpoints with optional authentication
-@app.get("/tasks", response_model=List[schemas.Task])
-async def read_tasks(
+@router.get("/tasks", response_model=List[schemas.Task])
+def read_tasks(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    query: schemas.TaskQuery = Depends(),
     current_user: Optional[models.User] = Depends(auth.get_optional_current_user),
-    db: Session = Depends(get_db)
+    uow: UnitOfWork = Depends(get_uow)
 ):
-    if current_user:
-        tasks = db.query(models.Task).filter(models.Task.owner_id == current_user.id).offset(skip).limit(limit).all()
-    else:
-        tasks = []
-    return tasks
+    if not current_user:
+        return []
+    media_type = request_format(request)
+    filters = query.model_dump()
+    content = response_cache.get_or_compute(
+        current_user.id, "tasks",
+        {"skip": skip, "limit": limit, "format": None if media_type == JSON else media_type, **filters},
+        lambda: render(
+            schemas.task_list_adapter,
+            uow.tasks.list_for_owner(current_user.id, skip=skip, limit=limit, **filters),
+            media_type
+        )
+    )
+    return encoded_response(content, media_type)
 
-@app.post("/tasks", response_model=schemas.Task)
+@router.post("/tasks", response_model=schemas.Task)
 async def create_task(
     task: schemas.TaskCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    uow: UnitOfWork = Depends(get_uow)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    db_task = models.Task(**task.dict(), owner_id=current_user.id)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    replayed = idempotency.begin(uow, current_user.id, idempotency_key, "POST /tasks", task.model_dump(mode="json"))
+    if replayed is not None:
+        return replayed
+    # A task may only be filed under one of the caller's own goals
+    if task.goal_id:
+        uow.goals.require_owned(task.goal_id, current_user.id)
+    db_task = uow.tasks.add(models.Task(**task.model_dump(), owner_id=current_user.id))
+    idempotency.complete(uow, schemas.Task, db_task)
+    uow.commit()
     return db_task
 
-@app.get("/tasks/{task_id}", response_model=schemas.Task)
+def _owned_task(
+    uow: UnitOfWork,
+    task_id: int,
+    owner_id: int,
+    forbidden: str,
+    include_archived: bool = False
+) -> models.Task:
+    """
+    The caller's task, looked up in their partition only. Just a miss pays
+    for the unscoped lookup that tells someone else's task (403) from none (404).
+    """
+    task = uow.tasks.get_owned(task_id, owner_id)
+    if task is None and include_archived:
+        task = uow.tasks.get_archived(task_id)
+    if task is not None and task.owner_id == owner_id:
+        return task
+    if task is not None or uow.tasks.get(task_id) is not None:
+        raise HTTPException(status_code=403, detail=forbidden)
+    raise HTTPException(status_code=404, detail="Task not found")
+
+@router.get("/tasks/{task_id:int}", response_model=schemas.Task)
 def get_task(
     task_id: int,
-    db: Session = Depends(database.get_db),
+    include_archived: bool = False,
+    uow: UnitOfWork = Depends(get_uow),
     current_user: Optional[models.User] = Depends(auth.get_optional_current_user)
 ):
-    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    if current_user:
+        task = _owned_task(uow, task_id, current_user.id, "Not authorized to access this task", include_archived)
+    else:
+        task = uow.tasks.get(task_id)
+        if task is None and include_archived:
+            task = uow.tasks.get_archived(task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    if current_user and task.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this task")
     return task
 
-@app.patch("/tasks/{task_id}", response_model=schemas.Task)
+@router.patch("/tasks/{task_id:int}", response_model=schemas.Task)
 def update_task(
     task_id: int,
     task_update: schemas.TaskUpdate,
-    db: Session = Depends(database.get_db),
+    today: str = None,  # Optional client-provided today parameter
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if db_task.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to modify this task")
-    
-    update_data = task_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_task, field, value)
-    
-    db.commit()
-    db.refresh(db_task)
+    replayed = idempotency.begin(
+        uow, current_user.id, idempotency_key, f"PATCH /tasks/{task_id}",
+        {"update": task_update.model_dump(mode="json", exclude_unset=True), "today": today}
+    )
+    if replayed is not None:
+        return replayed
+
+    db_task = _owned_task(uow, task_id, current_user.id, "Not authorized to modify this task")
+
+    values = task_update.model_dump(exclude_unset=True)
+    if values.get("goal_id") is not None:
+        uow.goals.require_owned(values["goal_id"], current_user.id)
+    task_being_completed = bool(values.get("completed")) and not db_task.completed
+    uow.tasks.update(db_task, values)
+
+    # Activity is counted by the job runner after the response is sent. The key
+    # makes a task count once per day even if it is re-completed or the request retried
+    if task_being_completed:
+        activity_date = resolve_today(today).isoformat()
+        uow.enqueue_job(
+            "activity.increment",
+            {"user_id": current_user.id, "date": activity_date},
+            idempotency_key=f"activity:{task_id}:{activity_date}"
+        )
+
+    idempotency.complete(uow, schemas.Task, db_task)
+    uow.commit()
     return db_task
 
-@app.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/tasks/{task_id:int}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_task(
     task_id: int,
-    db: Session = Depends(database.get_db),
+    uow: UnitOfWork = Depends(get_uow),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if db_task.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this task")
-    
-    db.delete(db_task)
-    db.commit()
+    db_task = _owned_task(uow, task_id, current_user.id, "Not authorized to delete this task")
+    uow.tasks.delete(db_task)
+    uow.commit()
     return None
 
-# Include routers
-app.include_router(users.router)
-app.include_router(tasks.router)
-app.include_router(goals.router)
+@router.get("/cache/stats", dependencies=[Depends(require_profile_admin)])
+def read_cache_stats():
+    stats = response_cache.stats()
+    stats["coalescing"] = request_coalescer.stats()
+    return stats
+
+@router.get("/jobs/stats", dependencies=[Depends(require_profile_admin)])
+def read_job_stats(db: Session = Depends(get_db)):
+    # Queue depth and lag of the background job runner
+    return job_runner.stats(db)
 
-@app.get("/")
+@router.get("/auth/revocations/stats", dependencies=[Depends(require_profile_admin)])
+def read_revocation_stats():
+    # How often the Bloom filter let a request skip the revoked_tokens lookup
+    return revocation_list.stats()
+
+@router.get("/outbox/stats", dependencies=[Depends(require_profile_admin)])
+def read_outbox_stats():
+    return outbox_relay.stats()
+
+@router.get("/profiles", dependencies=[Depends(require_profile_admin)])
+def list_profiles():
+    # Newest first; fetch one with GET /profiles/{id} and feed it to flamegraph.pl or speedscope
+    return profile_store.list()
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_profile_admin)])
+def read_profile(profile_id: str):
+    folded = profile_store.read(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return folded
+
+@router.get("/")
 async def root():
-    return {"message": "Welcome to Extended Planner API"} 
\ No newline at end of file
+    return {"message": "Welcome to Extended Planner API"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema management is left to Alembic (`alembic upgrade head`)
+    database.init_engine()
+    if DB_POOL_PREWARM:
+        database.prewarm_pool(DB_POOL_PREWARM)
+    recurrence_scheduler = RecurrenceScheduler(database.SessionLocal)
+    if RECURRENCE_SCHEDULER_ENABLED:
+        recurrence_scheduler.start()
+    job_runner.start(database.SessionLocal)
+    revocation_list.start(database.SessionLocal)
+    if OUTBOX_RELAY_ENABLED:
+        outbox_relay.start(database.SessionLocal)
+    yield
+    recurrence_scheduler.stop()
+    job_runner.stop()
+    revocation_list.stop()
+    outbox_relay.stop()
+    database.dispose_engine()
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Extended Planner API",
+        description="API for the Extended Planner application",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+
+    # Added first so it sits inside CORS and its 429/503 responses carry CORS headers
+    app.add_middleware(AdmissionControlMiddleware)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # Frontend URL
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Large responses are compressed once, before coalesced followers replay them
+    app.add_middleware(CompressionMiddleware)
+    # Identical concurrent reads from one user share a single execution
+    app.add_middleware(RequestCoalescingMiddleware)
+    # Outermost, so a profile covers every other middleware too
+    app.add_middleware(ProfilingMiddleware)
+
+    # Routers are imported here so importing this module stays cheap
+    from .api import tasks, users, goals, tags
+
+    # The routes above are registered first so they keep precedence
+    app.include_router(router)
+    app.include_router(users.router)
+    app.include_router(tasks.router)
+    app.include_router(goals.router)
+    app.include_router(tags.router)
+    return app
+
+app = create_app()
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Date, Index, JSON, LargeBinary, Sequence, DDL, event
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
+from .partitioning import create_hash_partitions
 
 class User(Base):
     __tablename__ = "users"
@@ -21,22 +23,86 @@ class User(Base):
 class Task(Base):
     __tablename__ = "tasks"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Hash-partitioned by owner_id, so the table's primary key is (id, owner_id);
+    # ids stay unique and the mapper identifies rows by id alone
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
     completed = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    owner_id = Column(Integer, ForeignKey("users.id"))
-    goal_id = Column(Integer, ForeignKey("goals.id"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Not a database foreign key: goals has no unique key on id alone
+    goal_id = Column(Integer, nullable=True)
+    # For recurring tasks this is the current occurrence; see app/recurrence.py
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    recurrence_rule = Column(String, nullable=True)
+    # Fractional index key within the (owner_id, goal_id) list; see app/ranking.py
+    rank = Column(String(collation="C"), nullable=True)
+    # Normalized by app/tags.py; counted per owner in tag_counts
+    tags = Column(ARRAY(String), nullable=False, default=list, server_default="{}")
 
     owner = relationship("User", back_populates="tasks")
-    goal = relationship("Goal", back_populates="tasks")
+    # Only goal_id is written through these; owner_id narrows the join to the owner's partition
+    goal = relationship(
+        "Goal", back_populates="tasks",
+        primaryjoin="and_(foreign(Task.goal_id) == Goal.id, Task.owner_id == remote(Goal.owner_id))"
+    )
+
+    __table_args__ = (
+        Index("ix_tasks_owner_id_due_at", "owner_id", "due_at"),
+        Index(
+            "ix_tasks_recurring_due_at", "due_at",
+            postgresql_where=recurrence_rule.isnot(None)
+        ),
+        # Listing filters and sorts; see TaskRepository.list_for_owner
+        Index("ix_tasks_owner_id_id", "owner_id", "id"),
+        Index("ix_tasks_owner_id_completed_created_at", "owner_id", "completed", "created_at"),
+        Index("ix_tasks_owner_id_updated_at", "owner_id", "updated_at"),
+        Index("ix_tasks_owner_id_goal_id_rank", "owner_id", "goal_id", "rank"),
+        # Serves tags && (any) and tags @> (all) filters
+        Index("ix_tasks_tags", "tags", postgresql_using="gin"),
+        Index(
+            "ix_tasks_open_owner_id_goal_id", "owner_id", "goal_id",
+            postgresql_where=completed == False
+        ),
+        # Finds archival candidates oldest first; see app/archive.py
+        Index(
+            "ix_tasks_archivable", func.coalesce(updated_at, created_at),
+            postgresql_where=(completed == True) & recurrence_rule.is_(None)
+        ),
+        {"postgresql_partition_by": "HASH (owner_id)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+class TaskArchive(Base):
+    """Completed tasks moved out of the hot tasks table by app/archive.py; same columns as Task."""
+    __tablename__ = "tasks_archive"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String)
+    description = Column(String)
+    completed = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    owner_id = Column(Integer, nullable=False)
+    goal_id = Column(Integer, nullable=True)
+    due_at = Column(DateTime(timezone=True), nullable=True)
+    recurrence_rule = Column(String, nullable=True)
+    rank = Column(String(collation="C"), nullable=True)
+    tags = Column(ARRAY(String), nullable=False, default=list, server_default="{}")
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tasks_archive_owner_id_id", "owner_id", "id"),
+        Index("ix_tasks_archive_goal_id", "goal_id"),
+    )
 
 class Goal(Base):
     __tablename__ = "goals"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Hash-partitioned by owner_id like tasks
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
     target_date = Column(DateTime(timezone=True))
@@ -44,18 +110,168 @@ class Goal(Base):
     is_pinned = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Sub-goal hierarchy; goal_closure holds every ancestor/descendant pair
+    parent_id = Column(Integer, nullable=True, index=True)
+    # Task counts over this goal and all of its sub-goals, maintained incrementally
+    subtree_total_tasks = Column(Integer, nullable=False, default=0, server_default="0")
+    subtree_completed_tasks = Column(Integer, nullable=False, default=0, server_default="0")
 
     owner = relationship("User", back_populates="goals")
-    tasks = relationship("Task", back_populates="goal")
+    tasks = relationship(
+        "Task", back_populates="goal", order_by="Task.rank",
+        primaryjoin="and_(Goal.id == foreign(Task.goal_id), Goal.owner_id == remote(Task.owner_id))"
+    )
+
+    __table_args__ = (
+        Index("ix_goals_owner_id_id", "owner_id", "id"),
+        {"postgresql_partition_by": "HASH (owner_id)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+class TagCount(Base):
+    """Live tasks per owner and tag, moved by deltas on every task write; see TagRepository."""
+    __tablename__ = "tag_counts"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    tag = Column(String, primary_key=True)
+    task_count = Column(Integer, nullable=False, default=0)
+
+class GoalClosure(Base):
+    __tablename__ = "goal_closure"
+
+    # One row per (ancestor, descendant) pair, including each goal with itself at depth 0
+    # Rows are removed by goal_tree.detach; goals can't be referenced by id alone
+    ancestor_id = Column(Integer, primary_key=True)
+    descendant_id = Column(Integer, primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_goal_closure_descendant_id_depth", "descendant_id", "depth"),
+    )
 
 class UserActivity(Base):
     __tablename__ = "user_activities"
     
-    id = Column(Integer, primary_key=True, index=True)
-    date = Column(Date, index=True)
+    # Keyed by (user_id, date) and range-partitioned by year; see app/activity_store.py
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    id = Column(Integer, Sequence("user_activities_id_seq"))
     count = Column(Integer, default=0)
-    user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    user = relationship("User", back_populates="activities") 
\ No newline at end of file
+    user = relationship("User", back_populates="activities")
+
+    __table_args__ = (
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+def _create_hash_partitions(table, connection, **kw):
+    create_hash_partitions(connection, table.name)
+
+# Hash-partitioned tables get all their partitions up front
+event.listen(Task.__table__, "after_create", _create_hash_partitions)
+event.listen(Goal.__table__, "after_create", _create_hash_partitions)
+
+# A partitioned table needs somewhere to put rows before yearly partitions exist
+event.listen(
+    UserActivity.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS user_activities_default PARTITION OF user_activities DEFAULT")
+)
+
+class UserActivityYear(Base):
+    """Compacted activity history: one row per user per year, counts indexed by day of year."""
+    __tablename__ = "user_activity_years"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    counts = Column(ARRAY(Integer))
+    total = Column(Integer, default=0)
+
+class UserStats(Base):
+    """Materialized per-user statistics, maintained incrementally by app/stats.py."""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    current_streak = Column(Integer, default=0)
+    longest_streak = Column(Integer, default=0)
+    last_active_date = Column(Date, nullable=True)
+    total_count = Column(Integer, default=0)
+    # Rolling daily counts, newest first, anchored at window_end
+    window_end = Column(Date, nullable=True)
+    daily_counts = Column(ARRAY(Integer))
+    # {goal_id: [total_tasks, completed_tasks]}
+    goal_progress = Column(JSON, default=dict)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class BackgroundJob(Base):
+    """Durable job row, run after the request by app/jobs.py; see JobRunner."""
+    __tablename__ = "background_jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    # Enqueueing the same key twice is a no-op while the first row is retained
+    idempotency_key = Column(String, unique=True, nullable=True)
+    # pending | done | dead
+    status = Column(String, nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_background_jobs_pending_run_after", "run_after", postgresql_where=status == "pending"),
+        Index("ix_background_jobs_finished_at", "finished_at", postgresql_where=status == "done"),
+    )
+
+class OutboxEvent(Base):
+    """Change event written in the same transaction as the change; relayed by app/outbox.py."""
+    __tablename__ = "outbox"
+
+    # created_at is part of the key because the table is range-partitioned by day on it
+    id = Column(BigInteger, Sequence("outbox_id_seq"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    event_type = Column(String, nullable=False)
+    aggregate_type = Column(String, nullable=False)
+    aggregate_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, nullable=False)
+    payload = Column(JSON, nullable=False)
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_undispatched_id", "id", postgresql_where=dispatched_at.is_(None)),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+# Rows land here if the relay hasn't created the day's partition yet
+event.listen(
+    OutboxEvent.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS outbox_default PARTITION OF outbox DEFAULT")
+)
+
+class IdempotencyKey(Base):
+    """Response of a write sent with an Idempotency-Key header, replayed to retries; see app/idempotency.py."""
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # Truncated sha256 of the operation and body
+    request_hash = Column(LargeBinary, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class RevokedToken(Base):
+    """Token revoked before its expiry (logout, refresh rotation); mirrored in memory by app/revocation.py."""
+    __tablename__ = "revoked_tokens"
+
+    id = Column(BigInteger, primary_key=True)
+    jti = Column(String, nullable=False, unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # The token's own exp; the row can go once the token is dead anyway
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
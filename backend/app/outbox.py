@@ -0,0 +1,304 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+from . import models
+
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Comma-separated: log, memory, webhook (needs OUTBOX_WEBHOOK_URL)
+OUTBOX_SINKS = os.getenv("OUTBOX_SINKS", "log")
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL")
+# Daily partitions older than this are dropped once every row in them is dispatched
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+OUTBOX_PARTITION_DAYS_AHEAD = int(os.getenv("OUTBOX_PARTITION_DAYS_AHEAD", "7"))
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def snapshot(row: models.Base) -> Dict[str, Any]:
+    """Column values of an ORM row as a JSON-ready dict."""
+    return {column.key: _jsonable(getattr(row, column.key)) for column in inspect(row).mapper.column_attrs}
+
+
+def event_insert(event_type: str, aggregate_type: str, aggregate_id: int, owner_id: int, payload: Dict[str, Any]) -> Any:
+    return insert(models.OutboxEvent).values(
+        event_type=event_type,
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        owner_id=owner_id,
+        payload=_jsonable(payload)
+    )
+
+
+def record(
+    db: Session,
+    event_type: str,
+    aggregate_type: str,
+    aggregate_id: int,
+    owner_id: int,
+    payload: Dict[str, Any]
+) -> None:
+    """Write an event in the caller's transaction; it exists exactly when the change commits."""
+    db.execute(event_insert(event_type, aggregate_type, aggregate_id, owner_id, payload))
+
+
+def partition_name(day: date) -> str:
+    return f"outbox_p{day:%Y%m%d}"
+
+
+def ensure_partitions(db: Session, start: date, days: int = OUTBOX_PARTITION_DAYS_AHEAD) -> None:
+    for offset in range(days + 1):
+        day = start + timedelta(days=offset)
+        try:
+            with db.begin_nested():
+                db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF outbox "
+                    f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+                ))
+        except Exception as e:
+            # Rows for that day already sit in the default partition; they are pruned from there
+            print(f"Could not create outbox partition for {day.isoformat()}: {str(e)}")
+
+
+def prune_partitions(db: Session, today: date, retention_days: int = OUTBOX_RETENTION_DAYS) -> List[str]:
+    """Drop daily partitions past retention whose events have all been dispatched."""
+    cutoff = today - timedelta(days=retention_days)
+    names = db.execute(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = 'outbox'
+    """)).scalars().all()
+
+    dropped = []
+    for name in sorted(names):
+        if not name.startswith("outbox_p"):
+            continue
+        day = datetime.strptime(name[len("outbox_p"):], "%Y%m%d").date()
+        if day >= cutoff:
+            continue
+        if db.execute(text(f"SELECT 1 FROM {name} WHERE dispatched_at IS NULL LIMIT 1")).first():
+            print(f"Keeping {name}: it still has undispatched events")
+            continue
+        db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    # The default partition can't be dropped, so old dispatched rows are deleted from it instead
+    db.execute(text(
+        "DELETE FROM outbox_default WHERE dispatched_at IS NOT NULL AND created_at < :cutoff"
+    ), {"cutoff": cutoff})
+    return dropped
+
+
+class InMemorySink:
+    """Keeps dispatched events in a list; a stand-in for real consumers in tests and local runs."""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        self.events.extend(events)
+
+
+class LogSink:
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            print(f"Outbox event {event['id']}: {event['event_type']} {event['aggregate_type']} {event['aggregate_id']}")
+
+
+class WebhookSink:
+    """POSTs each batch as a JSON array; a non-2xx answer fails the batch so it is retried."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(events).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Webhook answered {response.status}")
+
+
+def create_sinks(names: str = OUTBOX_SINKS) -> List[Any]:
+    sinks = []
+    for name in (name.strip() for name in names.split(",")):
+        if name == "log":
+            sinks.append(LogSink())
+        elif name == "memory":
+            sinks.append(InMemorySink())
+        elif name == "webhook":
+            if not OUTBOX_WEBHOOK_URL:
+                raise RuntimeError("The webhook outbox sink requires OUTBOX_WEBHOOK_URL")
+            sinks.append(WebhookSink(OUTBOX_WEBHOOK_URL))
+        elif name:
+            raise ValueError(f"Unknown outbox sink: {name}")
+    return sinks
+
+
+def to_message(event: models.OutboxEvent) -> Dict[str, Any]:
+    return {
+        "id": event.id,
+        "created_at": event.created_at.isoformat(),
+        "event_type": event.event_type,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "owner_id": event.owner_id,
+        "payload": event.payload
+    }
+
+
+class OutboxRelay:
+    """
+    Claims undispatched events in id order with FOR UPDATE SKIP LOCKED, hands
+    each batch to every sink and marks it dispatched in the same transaction.
+    Delivery is at least once: a sink failure rolls the batch back for the
+    next tick, so consumers should deduplicate on the event id. Several relays
+    can run side by side. Once an hour it also creates upcoming daily
+    partitions and drops expired ones.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        sinks: Optional[List[Any]] = None,
+        interval_seconds: float = OUTBOX_POLL_INTERVAL_SECONDS,
+        batch_size: int = OUTBOX_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.sinks = sinks
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.dispatched = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._last_maintenance = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        self.session_factory = session_factory
+        if self.sinks is None:
+            self.sinks = create_sinks()
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds * 5)
+            self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if time.monotonic() - self._last_maintenance > 3600:
+                    self.maintain()
+                while self.run_once() == self.batch_size:
+                    pass
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Outbox relay error: {str(e)}")
+
+    def run_once(self) -> int:
+        db = self.session_factory()
+        try:
+            events = db.query(models.OutboxEvent).filter(
+                models.OutboxEvent.dispatched_at.is_(None)
+            ).order_by(models.OutboxEvent.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+            if events:
+                messages = [to_message(event) for event in events]
+                for sink in self.sinks:
+                    sink.send(messages)
+                now = datetime.now(timezone.utc)
+                for event in events:
+                    event.dispatched_at = now
+            db.commit()
+            self.dispatched += len(events)
+            return len(events)
+        finally:
+            db.close()
+
+    def maintain(self, today: Optional[date] = None) -> List[str]:
+        self._last_maintenance = time.monotonic()
+        today = today or date.today()
+        db = self.session_factory()
+        try:
+            ensure_partitions(db, today)
+            dropped = prune_partitions(db, today)
+            db.commit()
+            return dropped
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dispatched": self.dispatched,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "sinks": [type(sink).__name__ for sink in self.sinks or []],
+            "running": self._thread is not None
+        }
+
+
+outbox_relay = OutboxRelay()
+
+
+if __name__ == "__main__":
+    # Standalone relay: python -m app.outbox [--once] [--maintain]
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Relay outbox events to the configured sinks")
+    parser.add_argument("--once", action="store_true", help="Dispatch one batch and exit")
+    parser.add_argument("--maintain", action="store_true", help="Only create and prune partitions")
+    args = parser.parse_args()
+
+    init_engine()
+    relay = OutboxRelay(SessionLocal, create_sinks())
+    if args.maintain:
+        print(f"Dropped partitions: {relay.maintain()}")
+    elif args.once:
+        print(f"Dispatched {relay.run_once()} events")
+    else:
+        relay.maintain()
+        try:
+            while True:
+                if relay.run_once() < relay.batch_size:
+                    time.sleep(relay.interval_seconds)
+        except KeyboardInterrupt:
+            pass
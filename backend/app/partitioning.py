@@ -0,0 +1,111 @@
+from typing import Any, Dict
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import argparse
+import os
+import time
+
+# Hash partitions per owner-partitioned table (and per yearly user_activities partition)
+HASH_PARTITIONS = int(os.getenv("HASH_PARTITIONS", "16"))
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "5000"))
+
+# Tables moved to hash partitioning and their partition keys. Until the swap
+# revision (a2d7e5b9c4f8) runs, each has a {table}_hashed shadow that triggers
+# keep in sync and backfill() fills with the existing rows.
+HASH_PARTITIONED = {"goals": "owner_id", "tasks": "owner_id"}
+
+
+def hash_partition_name(parent: str, remainder: int) -> str:
+    return f"{parent}_h{remainder:02d}"
+
+
+def create_hash_partitions(db: Any, parent: str, count: int = HASH_PARTITIONS) -> None:
+    """Create the `count` partitions of a table declared PARTITION BY HASH."""
+    for remainder in range(count):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {hash_partition_name(parent, remainder)} PARTITION OF {parent} "
+            f"FOR VALUES WITH (MODULUS {count}, REMAINDER {remainder})"
+        ))
+
+
+def shadow_name(table: str) -> str:
+    return f"{table}_hashed"
+
+
+def backfill(db: Session, table: str, batch_size: int = BACKFILL_BATCH_SIZE, pause_seconds: float = 0.0) -> int:
+    """
+    Copy existing rows of `table` into its shadow in id order, one short
+    transaction per chunk, and record progress in partition_backfill so a
+    restart resumes where it stopped. Source rows are locked FOR SHARE while
+    copied, so a concurrent update waits and its trigger then replaces the
+    copy. Returns the number of rows copied.
+    """
+    shadow = shadow_name(table)
+    last_id = db.execute(
+        text("SELECT last_id FROM partition_backfill WHERE table_name = :table"), {"table": table}
+    ).scalar()
+    if last_id is None:
+        raise RuntimeError(f"{shadow} does not exist; run the migrations up to f6c3a9e1b7d2 first")
+
+    copied = 0
+    while True:
+        upper = db.execute(text(
+            f"SELECT max(id) FROM (SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size) AS chunk"
+        ), {"last_id": last_id, "batch_size": batch_size}).scalar()
+        if upper is None:
+            db.commit()
+            return copied
+        copied += db.execute(text(
+            f"INSERT INTO {shadow} SELECT * FROM {table} WHERE id > :last_id AND id <= :upper "
+            f"FOR SHARE ON CONFLICT DO NOTHING"
+        ), {"last_id": last_id, "upper": upper}).rowcount
+        db.execute(
+            text("UPDATE partition_backfill SET last_id = :upper, updated_at = now() WHERE table_name = :table"),
+            {"upper": upper, "table": table}
+        )
+        db.commit()
+        last_id = upper
+        print(f"Copied {copied} {table} rows (up to id {upper})")
+        if pause_seconds:
+            # Leaves room for replication and autovacuum to keep up
+            time.sleep(pause_seconds)
+
+
+def status(db: Session) -> Dict[str, Dict[str, Any]]:
+    """Backfill progress and row counts of every table still waiting for the swap."""
+    progress = dict(db.execute(text("SELECT table_name, last_id FROM partition_backfill")).all())
+    report = {}
+    for table in HASH_PARTITIONED:
+        if table not in progress:
+            continue
+        report[table] = {
+            "last_id": progress[table],
+            "max_id": db.execute(text(f"SELECT max(id) FROM {table}")).scalar(),
+            "rows": db.execute(text(f"SELECT count(*) FROM {table}")).scalar(),
+            "shadow_rows": db.execute(text(f"SELECT count(*) FROM {shadow_name(table)}")).scalar()
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # Online migration: alembic upgrade f6c3a9e1b7d2, python -m app.partitioning backfill, alembic upgrade head
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Backfill the hash-partitioned shadows of tasks and goals")
+    parser.add_argument("command", choices=["backfill", "status"])
+    parser.add_argument("--table", choices=sorted(HASH_PARTITIONED), help="Only this table")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+    args = parser.parse_args()
+
+    init_engine()
+    db = SessionLocal()
+    try:
+        if args.command == "status":
+            for table, row in status(db).items():
+                print(f"{table}: {row['shadow_rows']}/{row['rows']} rows, copied up to id {row['last_id']} of {row['max_id']}")
+        else:
+            for table in [args.table] if args.table else HASH_PARTITIONED:
+                print(f"Backfilled {backfill(db, table, args.batch_size, args.pause)} {table} rows")
+    finally:
+        db.close()
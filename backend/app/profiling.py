@@ -0,0 +1,248 @@
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from fastapi import Header, HTTPException
+import hmac
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from .coalesce import scope_header, scope_user_key
+
+# A request is profiled when it carries `X-Profile: <PROFILE_ADMIN_TOKEN>` or
+# is picked by PROFILE_SAMPLE_RATE (0..1). With neither set the middleware
+# only does one attribute check per request.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "planner-profiles"))
+# The oldest profiles are deleted once the directory holds this many
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "100"))
+PROFILE_MAX_DEPTH = 128
+
+PROFILE_ID = re.compile(r"^\d{13}-[0-9a-f]{6}$")
+_STDLIB = os.path.dirname(os.__file__) + os.sep
+
+
+@lru_cache(maxsize=4096)
+def _short_path(path: str) -> str:
+    # Frames from installed packages and the standard library are labelled from the package down
+    marker = "site-packages" + os.sep
+    if marker in path:
+        return path.rsplit(marker, 1)[1]
+    if path.startswith(_STDLIB):
+        return path[len(_STDLIB):]
+    return os.path.relpath(path) if os.path.isabs(path) else path
+
+
+def _label(frame: Any) -> str:
+    code = frame.f_code
+    # Semicolons separate frames in the folded format
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring of profiles. Each profile is a folded-stacks file
+    (`frame;frame;frame count` per line, the input of flamegraph.pl and
+    speedscope) next to a small JSON file describing the request.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, capacity: int = PROFILE_RING_SIZE):
+        self.directory = directory
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def save(self, meta: Dict[str, Any], stacks: Counter) -> str:
+        profile_id = f"{int(time.time() * 1000):013d}-{secrets.token_hex(3)}"
+        meta = {**meta, "id": profile_id, "samples": sum(stacks.values())}
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(profile_id, "folded"), "w") as folded:
+                for stack, count in stacks.most_common():
+                    folded.write(f"{stack} {count}\n")
+            # Written last: a profile is listed only once both files exist
+            with open(self._path(profile_id, "json"), "w") as described:
+                json.dump(meta, described)
+            for expired in self._ids()[:-self.capacity]:
+                for extension in ("json", "folded"):
+                    try:
+                        os.remove(self._path(expired, extension))
+                    except FileNotFoundError:
+                        pass
+        return profile_id
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._path(profile_id, "json")) as described:
+                    profiles.append(json.load(described))
+            except (FileNotFoundError, ValueError):
+                continue
+        return profiles
+
+    def read(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, "folded")) as folded:
+                return folded.read()
+        except FileNotFoundError:
+            return None
+
+
+profile_store = ProfileStore()
+
+
+class StackSampler:
+    """
+    Samples stacks of the threads serving one request every `interval`
+    seconds until finish(), then saves them from its own thread so the
+    request never waits on the disk.
+
+    On the event loop thread only stacks passing through this request's
+    middleware call count. Threadpool workers (sync endpoints and
+    dependencies) are sampled whenever they are busy; with other requests in
+    flight their samples can mix in, so profile on a quiet worker when the
+    numbers matter.
+    """
+
+    def __init__(self, scope: Dict[str, Any], interval: float = PROFILE_INTERVAL_SECONDS):
+        self.scope = scope
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.loop_thread_id = threading.get_ident()
+        self._store: Optional[ProfileStore] = None
+        self._meta: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def finish(self, store: ProfileStore, meta: Dict[str, Any]) -> None:
+        self._store = store
+        self._meta = meta
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+        try:
+            self._store.save(self._meta, self.stacks)
+        except Exception as e:
+            print(f"Could not save profile: {str(e)}")
+
+    def _owns(self, frame: Any) -> bool:
+        while frame is not None:
+            if frame.f_code is ProfilingMiddleware.__call__.__code__ and frame.f_locals.get("scope") is self.scope:
+                return True
+            frame = frame.f_back
+        return False
+
+    def sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.loop_thread_id:
+                if not self._owns(frame):
+                    continue
+                root = "event-loop"
+            elif names.get(thread_id, "").startswith("AnyIO worker thread"):
+                root = "worker"
+            else:
+                continue
+
+            labels = []
+            idle = False
+            while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                if root == "worker" and code.co_name == "get" and code.co_filename.endswith("queue.py"):
+                    # A pool thread waiting for work
+                    idle = True
+                    break
+                labels.append(_label(frame))
+                frame = frame.f_back
+            if not idle:
+                self.stacks[";".join([root] + labels[::-1])] += 1
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that runs a StackSampler for requests picked by the admin header or the sample rate."""
+
+    def __init__(
+        self,
+        app: Any,
+        store: Optional[ProfileStore] = None,
+        admin_token: str = PROFILE_ADMIN_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval: float = PROFILE_INTERVAL_SECONDS
+    ):
+        self.app = app
+        self.store = store or profile_store
+        self.admin_token = admin_token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.enabled = bool(admin_token) or sample_rate > 0
+
+    def _wanted(self, scope: Dict[str, Any]) -> Optional[str]:
+        if self.admin_token and hmac.compare_digest(scope_header(scope, b"x-profile"), self.admin_token):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._wanted(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(scope, self.interval)
+        status = None
+
+        async def capture(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            sampler.finish(self.store, {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "user": scope_user_key(scope),
+                "status": status,
+                "trigger": trigger,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+
+
+def require_profile_admin(x_profile: str = Header("")) -> None:
+    """Guards the profile and internal stats endpoints with the same token that triggers profiling."""
+    if not PROFILE_ADMIN_TOKEN or not hmac.compare_digest(x_profile.encode(), PROFILE_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
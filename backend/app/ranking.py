@@ -0,0 +1,54 @@
+from typing import List, Optional
+
+# Fractional index keys: base-62 digits read as a fraction 0.d1d2d3..., so
+# string order is numeric order. The column uses the "C" collation to keep
+# comparisons bytewise. Keys never end in the zero digit, which guarantees
+# there is always room for another key between two neighbours.
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+# Moves producing keys longer than this queue a rebalance of the list
+RANK_MAX_LENGTH = 16
+
+
+def _midpoint(low: str, high: Optional[str]) -> str:
+    # low < high; an empty low is 0 and a missing high is 1
+    if high is not None:
+        shared = 0
+        while shared < len(high) and (low[shared] if shared < len(low) else "0") == high[shared]:
+            shared += 1
+        if shared:
+            return high[:shared] + _midpoint(low[shared:], high[shared:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else len(DIGITS)
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        # high's first digit alone is still above low and below high
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def key_between(low: Optional[str], high: Optional[str]) -> str:
+    """A key strictly between low and high; None means the start or end of the list."""
+    if low is not None and high is not None and low >= high:
+        raise ValueError(f"Rank {low!r} is not below {high!r}")
+    for key in (low, high):
+        if key is not None and (not key or key.endswith("0") or any(char not in DIGITS for char in key)):
+            raise ValueError(f"Invalid rank {key!r}")
+    return _midpoint(low or "", high)
+
+
+def spread_keys(count: int) -> List[str]:
+    """count evenly spaced keys of the shortest width that fits them, for rebalancing."""
+    width = 1
+    while len(DIGITS) ** width <= count:
+        width += 1
+    space = len(DIGITS) ** width
+    keys = []
+    for index in range(1, count + 1):
+        value = index * space // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, len(DIGITS))
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
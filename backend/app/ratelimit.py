@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import json
+import math
+import os
+import threading
+import time
+from . import database
+from .coalesce import scope_user_key
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Tokens per second and bucket capacity (burst)
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "10"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "40"))
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "20"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "80"))
+# Load shedding: requests in progress in this worker, and DB pool saturation
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "256"))
+SHED_ON_POOL_SATURATION = os.getenv("SHED_ON_POOL_SATURATION", "true").lower() == "true"
+# Requests allowed to queue for a primary connection before new ones are shed
+SHED_POOL_QUEUE = int(os.getenv("SHED_POOL_QUEUE", "16"))
+
+# (method, path) -> cost; bcrypt logins and unpaginated dumps cost more
+ROUTE_COSTS: Dict[Tuple[str, str], float] = {
+    ("POST", "/token"): 10,
+    ("POST", "/register"): 10,
+    ("POST", "/users/"): 10,
+    ("GET", "/users/me/activity/debug"): 20,
+    ("POST", "/users/me/activity/increment"): 5,
+    ("GET", "/users/me/dashboard"): 3,
+}
+
+
+class InMemoryBucketBackend:
+    """Token buckets for this worker; idle buckets are dropped LRU-first past max_keys."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """Take cost tokens; returns 0 if allowed, otherwise seconds until it would be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SharedBucketBackend:
+    """
+    Token buckets shared by all workers through a redis-compatible client.
+    The refill-and-take runs as one server-side script so it is atomic.
+    """
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local cost, rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        return float(self._script(keys=[f"bucket:{key}"], args=[cost, rate, burst, time.time()]))
+
+
+def _create_backend() -> Any:
+    redis_url = os.getenv("RATE_LIMIT_URL")
+    if not redis_url:
+        return InMemoryBucketBackend()
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("RATE_LIMIT_URL requires the redis package")
+    return SharedBucketBackend(redis.Redis.from_url(redis_url))
+
+
+def pool_saturated(in_flight: int) -> bool:
+    """
+    True when every open primary connection is checked out and this worker
+    has at least SHED_POOL_QUEUE more requests in progress than that, i.e.
+    about that many are queued for a connection. A short queue is left to the
+    pool; past it, a request would wait up to pool_timeout (30s by default)
+    and then fail anyway, so an immediate 503 with Retry-After is cheaper.
+    """
+    engine = database.engine
+    if engine is None or not hasattr(engine.pool, "overflow"):
+        return False
+    pool = engine.pool
+    busy = pool.checkedout()
+    return busy >= pool.size() + max(pool.overflow(), 0) and in_flight - busy >= SHED_POOL_QUEUE
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware in front of the app: sheds load with 503 when this worker
+    has too many requests in progress or queued for the DB pool, then
+    charges the request's route cost to per-IP and per-user token buckets
+    and answers 429 when either is empty.
+    """
+
+    def __init__(self, app: Any, backend: Optional[Any] = None):
+        self.app = app
+        self.backend = backend or _create_backend()
+        self.in_flight = 0
+        self.rejected = 0
+        self.shed = 0
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= MAX_IN_FLIGHT or (SHED_ON_POOL_SATURATION and pool_saturated(self.in_flight)):
+            self.shed += 1
+            await self._reject(send, 503, "Server is busy, please retry", 1)
+            return
+
+        cost = ROUTE_COSTS.get((scope["method"], scope["path"]), 1)
+        client = scope.get("client")
+        buckets = [(f"ip:{client[0] if client else 'unknown'}", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST)]
+        user_key = scope_user_key(scope)
+        if user_key:
+            buckets.append((f"user:{user_key}", RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST))
+        for key, rate, burst in buckets:
+            wait = self.backend.take(key, cost, rate, burst)
+            if wait > 0:
+                self.rejected += 1
+                await self._reject(send, 429, "Too many requests", wait)
+                return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _reject(self, send: Any, status_code: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
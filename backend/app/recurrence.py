@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional, Tuple
+import calendar
+
+# Subset of RFC 5545 RRULE, e.g. "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=2025-12-31"
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# Guard against unbounded expansion when a client asks for a huge window
+MAX_OCCURRENCES = 1000
+# About ten years per step; larger intervals overflow datetime arithmetic
+MAX_INTERVALS = {"DAILY": 3660, "WEEKLY": 520, "MONTHLY": 120}
+
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    freq: str
+    interval: int = 1
+    by_day: Tuple[int, ...] = ()
+    until: Optional[date] = None
+
+
+def parse_rule(rule: str) -> RecurrenceRule:
+    parts = {}
+    for part in rule.strip().split(";"):
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid recurrence rule part: {part}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    freq = parts.get("FREQ")
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+
+    try:
+        interval = int(parts.get("INTERVAL", "1"))
+    except ValueError:
+        raise ValueError("INTERVAL must be an integer")
+    if interval < 1:
+        raise ValueError("INTERVAL must be positive")
+    if interval > MAX_INTERVALS[freq]:
+        raise ValueError(f"INTERVAL must be at most {MAX_INTERVALS[freq]} with FREQ={freq}")
+
+    by_day = ()
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        try:
+            by_day = tuple(sorted({WEEKDAYS.index(day) for day in parts["BYDAY"].split(",")}))
+        except ValueError:
+            raise ValueError(f"BYDAY must be a list of {', '.join(WEEKDAYS)}")
+
+    until = None
+    if "UNTIL" in parts:
+        until = date.fromisoformat(parts["UNTIL"])
+
+    return RecurrenceRule(freq=freq, interval=interval, by_day=by_day, until=until)
+
+
+def _add_months(value: datetime, months: int) -> Optional[datetime]:
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    if value.day > calendar.monthrange(year, month)[1]:
+        # e.g. the 31st in a 30-day month, which RRULE skips
+        return None
+    return value.replace(year=year, month=month)
+
+
+def _candidates(rule: RecurrenceRule, anchor: datetime, start: datetime) -> Iterator[datetime]:
+    if rule.freq == "DAILY":
+        step = timedelta(days=rule.interval)
+        # Jump straight to the first period that can reach the window
+        skip = max(0, (start - anchor) // step)
+        current = anchor + skip * step
+        while True:
+            yield current
+            current += step
+
+    elif rule.freq == "WEEKLY":
+        days = rule.by_day or (anchor.weekday(),)
+        week_start = anchor - timedelta(days=anchor.weekday())
+        step = timedelta(weeks=rule.interval)
+        skip = max(0, (start - week_start) // step)
+        week_start += skip * step
+        while True:
+            for day in days:
+                yield week_start + timedelta(days=day)
+            week_start += step
+
+    else:
+        months = 0
+        if start > anchor:
+            elapsed = (start.year - anchor.year) * 12 + start.month - anchor.month
+            months = max(0, elapsed - elapsed % rule.interval - rule.interval)
+        while True:
+            current = _add_months(anchor, months)
+            if current is not None:
+                yield current
+            months += rule.interval
+
+
+def expand(rule: RecurrenceRule, anchor: datetime, start: datetime, end: datetime) -> Iterator[datetime]:
+    """
+    Lazily yield occurrences of rule in [start, end], counting from anchor
+    (the task's current due_at). Nothing is written to the database.
+    """
+    produced = 0
+    for occurrence in _candidates(rule, anchor, start):
+        if occurrence > end or (rule.until and occurrence.date() > rule.until):
+            return
+        if occurrence < anchor or occurrence < start:
+            continue
+        yield occurrence
+        produced += 1
+        if produced >= MAX_OCCURRENCES:
+            return
+
+
+def next_occurrence(rule: RecurrenceRule, anchor: datetime, after: datetime) -> Optional[datetime]:
+    # Wide enough for MONTHLY rules that skip short months (e.g. the 31st)
+    horizon = after + timedelta(days=366 * rule.interval)
+    for occurrence in expand(rule, anchor, after, horizon):
+        if occurrence > after:
+            return occurrence
+    return None
@@ -0,0 +1,613 @@
+from datetime import date, datetime
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+from fastapi import Depends, HTTPException
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased, selectinload
+from . import models
+from . import database
+from . import stats
+from . import activity_store
+from . import archive
+from . import goal_tree
+from . import jobs
+from . import outbox
+from . import ranking
+# Registers the goals.recompute job handler that UnitOfWork.commit enqueues for
+from . import goal_completion
+from .cache import response_cache
+from .database import get_db
+from .jobs import job_runner
+from .outbox import outbox_relay
+from .tags import parse_tag_filter
+
+
+def resolve_today(today: Optional[str] = None) -> date:
+    """
+    Use the client's today (YYYY-MM-DD) if provided, otherwise the server's today.
+    This helps handle timezone differences between client and server.
+    """
+    if today:
+        try:
+            return date.fromisoformat(today)
+        except ValueError:
+            print(f"Invalid client today format: {today}, using server date")
+    return date.today()
+
+
+class BaseRepository:
+    model: Type[models.Base] = None
+    # Prefix of the outbox events this repository writes, e.g. task.created
+    aggregate_type: str = None
+
+    def __init__(self, uow: "UnitOfWork"):
+        self.uow = uow
+        self.db = uow.db
+
+    def _remember(self, rows: List[models.Base]) -> List[models.Base]:
+        for row in rows:
+            self.uow.identity_map[(self.model, row.id)] = row
+        return rows
+
+    def get(self, row_id: int) -> Optional[models.Base]:
+        # Rows already loaded in this request (including misses) are served from memory
+        key = (self.model, row_id)
+        if key not in self.uow.identity_map:
+            self.uow.identity_map[key] = self.db.get(self.model, row_id)
+        return self.uow.identity_map[key]
+
+    def get_owned(self, row_id: int, owner_id: int, options: Tuple[Any, ...] = ()) -> Optional[models.Base]:
+        key = (self.model, row_id)
+        if key in self.uow.identity_map:
+            row = self.uow.identity_map[key]
+        else:
+            # Filtering on owner_id too lets Postgres prune to the owner's hash partition
+            row = self.db.query(self.model).options(*options).filter(
+                self.model.id == row_id, self.model.owner_id == owner_id
+            ).first()
+            if row is not None:
+                self.uow.identity_map[key] = row
+        if row is None or row.owner_id != owner_id:
+            return None
+        return row
+
+    def add(self, row: models.Base) -> models.Base:
+        self.db.add(row)
+        self.db.flush()
+        self.uow.identity_map[(self.model, row.id)] = row
+        self.uow.touched_owners.add(row.owner_id)
+        self._event("created", row, outbox.snapshot(row))
+        return row
+
+    def update(self, row: models.Base, values: Dict[str, Any]) -> models.Base:
+        for key, value in values.items():
+            setattr(row, key, value)
+        self.uow.touched_owners.add(row.owner_id)
+        self._event("updated", row, {"id": row.id, "changes": values})
+        return row
+
+    def delete(self, row: models.Base) -> None:
+        self._event("deleted", row, outbox.snapshot(row))
+        self.db.delete(row)
+        self.uow.identity_map[(self.model, row.id)] = None
+        self.uow.touched_owners.add(row.owner_id)
+
+    def _event(self, action: str, row: models.Base, payload: Dict[str, Any]) -> None:
+        self.uow.record_event(f"{self.aggregate_type}.{action}", self.aggregate_type, row.id, row.owner_id, payload)
+
+
+class GoalRepository(BaseRepository):
+    model = models.Goal
+    aggregate_type = "goal"
+
+    @staticmethod
+    def _with_tasks(owner_id: int) -> Any:
+        # Goal responses include their tasks: one more query for all loaded goals,
+        # which Postgres prunes to the owner's partitions of goals and tasks
+        return selectinload(models.Goal.tasks.and_(models.Task.owner_id == owner_id))
+
+    def require_owned(self, goal_id: int, owner_id: int) -> models.Goal:
+        goal = self.get_owned(goal_id, owner_id, options=(self._with_tasks(owner_id),))
+        if goal is None:
+            raise HTTPException(status_code=404, detail="Goal not found")
+        return goal
+
+    def list_for_owner(self, owner_id: int, skip: int = 0, limit: int = 100) -> List[models.Goal]:
+        goals = self.db.query(models.Goal).options(self._with_tasks(owner_id)).filter(
+            models.Goal.owner_id == owner_id
+        ).offset(skip).limit(limit).all()
+        return self._remember(goals)
+
+    def add(self, row: models.Goal) -> models.Goal:
+        goal = super().add(row)
+        # Shared tree lock so a concurrent move can't change the parent's ancestors underneath us
+        goal_tree.lock_tree(self.db, goal.owner_id)
+        goal_tree.insert_paths(self.db, goal.id, goal.parent_id)
+        return goal
+
+    def delete(self, row: models.Goal) -> None:
+        goal_tree.detach(self.db, row)
+        # Live tasks are unlinked through Goal.tasks; archived ones need it done by hand
+        self.db.query(models.TaskArchive).filter(
+            models.TaskArchive.goal_id == row.id
+        ).update({models.TaskArchive.goal_id: None}, synchronize_session=False)
+        self.uow.stats.forget_goal(row.owner_id, row.id)
+        super().delete(row)
+
+    def move(self, goal: models.Goal, parent_id: Optional[int]) -> models.Goal:
+        if parent_id == goal.parent_id:
+            return goal
+        if parent_id is not None:
+            self.require_owned(parent_id, goal.owner_id)
+        try:
+            goal_tree.move_subtree(self.db, goal, parent_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        self.uow.touched_owners.add(goal.owner_id)
+        self._event("moved", goal, {"id": goal.id, "parent_id": parent_id})
+        return goal
+
+    def list_subtree(self, goal_id: int, max_depth: Optional[int] = None) -> List[Tuple[models.Goal, int]]:
+        rows = goal_tree.subtree(self.db, goal_id, max_depth)
+        self._remember([goal for goal, _ in rows])
+        return rows
+
+    def list_ancestors(self, goal_id: int) -> List[Tuple[models.Goal, int]]:
+        rows = goal_tree.ancestors(self.db, goal_id)
+        self._remember([goal for goal, _ in rows])
+        return rows
+
+    def list_pinned_with_progress(self, owner_id: int) -> List[Tuple[models.Goal, int, int]]:
+        # Progress comes from the rolled-up counts, so sub-goals' tasks are included without a join
+        goals = self.db.query(models.Goal).filter(
+            models.Goal.owner_id == owner_id,
+            models.Goal.is_pinned == True
+        ).order_by(models.Goal.completed, models.Goal.created_at.desc()).all()
+        self._remember(goals)
+        return [(goal, goal.subtree_total_tasks, goal.subtree_completed_tasks) for goal in goals]
+
+
+# Columns task listings may be sorted by; schemas.TaskQuery allows the same names
+TASK_SORT_COLUMNS = ("id", "created_at", "updated_at", "due_at", "title", "rank")
+
+
+class TaskRepository(BaseRepository):
+    model = models.Task
+    aggregate_type = "task"
+
+    def _changed(
+        self,
+        owner_id: int,
+        before: Optional[Tuple[Optional[int], bool]],
+        after: Optional[Tuple[Optional[int], bool]]
+    ) -> None:
+        if before == after:
+            return
+        self.uow.stats.record_task_change(owner_id, before, after)
+        # Goals on either side need their completion recomputed after commit
+        self.uow.touched_goals.update((owner_id, state[0]) for state in (before, after) if state and state[0])
+
+        # Roll the change up through each affected goal's ancestors
+        deltas: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        for state, sign in ((before, -1), (after, +1)):
+            if state and state[0]:
+                deltas[state[0]][0] += sign
+                deltas[state[0]][1] += sign if state[1] else 0
+        for goal_id, (total, completed) in deltas.items():
+            goal_tree.apply_task_delta(self.db, owner_id, goal_id, total, completed)
+
+    def add(self, row: models.Task) -> models.Task:
+        if row.rank is None:
+            row.rank = ranking.key_between(self.last_rank(row.owner_id, row.goal_id), None)
+        task = super().add(row)
+        self._changed(task.owner_id, None, (task.goal_id, bool(task.completed)))
+        self.uow.tags.record_change(task.owner_id, [], task.tags or [])
+        return task
+
+    def update(self, task: models.Task, values: Dict[str, Any]) -> models.Task:
+        before = (task.goal_id, bool(task.completed))
+        tags_before = list(task.tags or [])
+        if "goal_id" in values and values["goal_id"] != task.goal_id and "rank" not in values:
+            # Moving to another goal appends the task to that goal's list
+            values = {**values, "rank": ranking.key_between(self.last_rank(task.owner_id, values["goal_id"]), None)}
+        super().update(task, values)
+        self._changed(task.owner_id, before, (task.goal_id, bool(task.completed)))
+        self.uow.tags.record_change(task.owner_id, tags_before, task.tags or [])
+        return task
+
+    def delete(self, row: models.Task) -> None:
+        before = (row.goal_id, bool(row.completed))
+        tags_before = list(row.tags or [])
+        # Deleted and flushed first: a stats row built from the tables below must not count it
+        super().delete(row)
+        self.db.flush()
+        self._changed(row.owner_id, before, None)
+        self.uow.tags.record_change(row.owner_id, tags_before, [])
+
+    def require_owned(self, task_id: int, owner_id: int) -> models.Task:
+        task = self.get_owned(task_id, owner_id)
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return task
+
+    def _in_list(self, owner_id: int, goal_id: Optional[int]) -> List[Any]:
+        # Ranks are ordered within one owner's goal (or ungrouped) list
+        goal_filter = models.Task.goal_id == goal_id if goal_id is not None else models.Task.goal_id.is_(None)
+        return [models.Task.owner_id == owner_id, goal_filter]
+
+    def last_rank(self, owner_id: int, goal_id: Optional[int]) -> Optional[str]:
+        return self.db.query(models.Task.rank).filter(
+            *self._in_list(owner_id, goal_id), models.Task.rank.isnot(None)
+        ).order_by(models.Task.rank.desc()).limit(1).scalar()
+
+    def _adjacent_rank(self, task: models.Task, rank: str, after: bool) -> Optional[str]:
+        query = self.db.query(models.Task.rank).filter(*self._in_list(task.owner_id, task.goal_id), models.Task.id != task.id)
+        if after:
+            query = query.filter(models.Task.rank > rank).order_by(models.Task.rank)
+        else:
+            query = query.filter(models.Task.rank < rank).order_by(models.Task.rank.desc())
+        return query.limit(1).scalar()
+
+    def move(self, task: models.Task, previous_id: Optional[int], next_id: Optional[int]) -> models.Task:
+        """
+        Place a task between two neighbours in its list by giving it a rank key
+        between theirs; only the moved row is written. Either neighbour may be
+        omitted, in which case the other side is looked up with one index probe.
+        """
+        if previous_id is None and next_id is None:
+            raise HTTPException(status_code=400, detail="Give previous_id, next_id or both")
+        neighbours = []
+        for neighbour_id in (previous_id, next_id):
+            neighbour = self.require_owned(neighbour_id, task.owner_id) if neighbour_id is not None else None
+            if neighbour is not None and (neighbour.id == task.id or neighbour.goal_id != task.goal_id):
+                raise HTTPException(status_code=400, detail="Neighbours must be other tasks in the same list")
+            neighbours.append(neighbour)
+        previous, following = neighbours
+
+        low = previous.rank if previous else None
+        high = following.rank if following else None
+        if following is None:
+            high = self._adjacent_rank(task, low, after=True)
+        elif previous is None:
+            low = self._adjacent_rank(task, high, after=False)
+
+        # Raises ValueError when the neighbours share a key, e.g. after two concurrent moves
+        rank = ranking.key_between(low, high)
+        self.update(task, {"rank": rank})
+        if len(rank) > ranking.RANK_MAX_LENGTH:
+            self.uow.enqueue_job("tasks.rebalance", {"owner_id": task.owner_id, "goal_id": task.goal_id})
+        return task
+
+    def rebalance(self, owner_id: int, goal_id: Optional[int]) -> int:
+        """Give every task in a list short, evenly spaced keys in its current order."""
+        tasks = self.db.query(models.Task).filter(*self._in_list(owner_id, goal_id)).order_by(
+            models.Task.rank.asc().nulls_last(), models.Task.id
+        ).with_for_update().all()
+        for task, rank in zip(tasks, ranking.spread_keys(len(tasks))):
+            task.rank = rank
+        self.uow.touched_owners.add(owner_id)
+        return len(tasks)
+
+    def list_for_owner(
+        self,
+        owner_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        goal_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        updated_since: Optional[datetime] = None,
+        sort: str = "rank",
+        order: str = "asc",
+        include_archived: bool = False,
+        tags: Optional[str] = None,
+        tag_match: str = "any"
+    ) -> List[models.Task]:
+        # Filters map onto the owner_id-prefixed indexes on tasks; with
+        # include_archived they apply to both branches of the union
+        task = models.Task
+        if include_archived:
+            task = aliased(models.Task, archive.tasks_with_archive())
+        query = self.db.query(task).filter(task.owner_id == owner_id)
+        if goal_id:
+            query = query.filter(task.goal_id == goal_id)
+        if completed is not None:
+            query = query.filter(task.completed == completed)
+        if created_after is not None:
+            query = query.filter(task.created_at >= created_after)
+        if created_before is not None:
+            query = query.filter(task.created_at < created_before)
+        if updated_since is not None:
+            query = query.filter(task.updated_at >= updated_since)
+        wanted_tags = parse_tag_filter(tags)
+        if wanted_tags:
+            # && and @> on the array, both answered by the GIN index ix_tasks_tags
+            match = task.tags.contains(wanted_tags) if tag_match == "all" else task.tags.overlap(wanted_tags)
+            query = query.filter(match)
+
+        if sort not in TASK_SORT_COLUMNS:
+            raise ValueError(f"Cannot sort tasks by {sort}")
+        column = getattr(task, sort)
+        ordering = column.desc() if order == "desc" else column.asc()
+        if sort == "rank":
+            # Each goal's list in its user-defined order, read straight off ix_tasks_owner_id_goal_id_rank
+            goal_ordering = task.goal_id.desc() if order == "desc" else task.goal_id.asc()
+            query = query.order_by(goal_ordering, ordering, task.id)
+        elif sort != "id":
+            # Nullable columns sort their NULLs last; id keeps pages stable
+            query = query.order_by(ordering.nulls_last(), task.id)
+        else:
+            query = query.order_by(ordering)
+        tasks = query.offset(skip).limit(limit).all()
+        # Archived rows come back as read-only Task objects and are not remembered
+        return tasks if include_archived else self._remember(tasks)
+
+    def get_archived(self, task_id: int) -> Optional[models.TaskArchive]:
+        # Archived tasks are read-only, so they stay out of the identity map
+        return self.db.get(models.TaskArchive, task_id)
+
+    def list_open(self, owner_id: int, limit: int = 100) -> List[models.Task]:
+        query = self.db.query(models.Task).filter(
+            models.Task.owner_id == owner_id,
+            models.Task.completed == False
+        )
+        return self._remember(query.order_by(models.Task.id).limit(limit).all())
+
+    def list_due(
+        self,
+        owner_id: int,
+        start: Optional[datetime],
+        end: datetime,
+        limit: int = 100
+    ) -> List[models.Task]:
+        # Open tasks due in [start, end), served by ix_tasks_owner_id_due_at
+        query = self.db.query(models.Task).filter(
+            models.Task.owner_id == owner_id,
+            models.Task.due_at < end,
+            models.Task.completed == False
+        )
+        if start is not None:
+            query = query.filter(models.Task.due_at >= start)
+        return self._remember(query.order_by(models.Task.due_at).limit(limit).all())
+
+    def list_scheduled(self, owner_id: int, start: datetime, end: datetime) -> List[models.Task]:
+        # One-off tasks due in the window, plus recurring tasks that may repeat into it
+        query = self.db.query(models.Task).filter(
+            models.Task.owner_id == owner_id,
+            models.Task.due_at <= end,
+            or_(models.Task.due_at >= start, models.Task.recurrence_rule.isnot(None))
+        )
+        return self._remember(query.order_by(models.Task.due_at).all())
+
+
+class ActivityRepository:
+    def __init__(self, uow: "UnitOfWork"):
+        self.uow = uow
+        self.db = uow.db
+
+    def counts_by_day(self, user_id: int, start_date: date, end_date: date) -> Dict[date, int]:
+        # Merges compacted yearly history with recent daily rows
+        return activity_store.load_counts(self.db, user_id, start_date, end_date)
+
+    def list_all(self, user_id: int) -> List[models.UserActivity]:
+        return self.db.query(models.UserActivity).filter(
+            models.UserActivity.user_id == user_id
+        ).order_by(models.UserActivity.date).all()
+
+    def increment(self, user_id: int, activity_date: date) -> int:
+        # Single-statement upsert on the (user_id, date) key; returns the new count
+        count = self.db.execute(insert(models.UserActivity).values(
+            user_id=user_id, date=activity_date, count=1
+        ).on_conflict_do_update(
+            index_elements=["user_id", "date"],
+            set_={"count": models.UserActivity.count + 1}
+        ).returning(models.UserActivity.count)).scalar_one()
+        self.uow.stats.record_activity(user_id, activity_date, 1, new_day=count == 1)
+        self.uow.record_event(
+            "activity.incremented", "activity", user_id, user_id, {"date": activity_date, "count": count}
+        )
+        return count
+
+
+class StatsRepository:
+    """
+    Keeps user_stats in step with task and activity writes. Each change locks
+    the user's stats row and applies an O(1) delta; a missing row is built
+    from the source tables, which already include the change being recorded.
+    """
+
+    def __init__(self, uow: "UnitOfWork"):
+        self.uow = uow
+        self.db = uow.db
+
+    def get(self, user_id: int) -> Optional[models.UserStats]:
+        return self.db.get(models.UserStats, user_id)
+
+    def _locked(self, user_id: int) -> Tuple[models.UserStats, bool]:
+        user_stats = self.db.get(models.UserStats, user_id, with_for_update=True)
+        if user_stats is not None:
+            return user_stats, False
+        self.db.flush()
+        built = stats.compute_user_stats(self.db, user_id)
+        # Another request may be creating the same row; let the first one win
+        self.db.execute(insert(models.UserStats).values(
+            user_id=user_id,
+            current_streak=built.current_streak,
+            longest_streak=built.longest_streak,
+            last_active_date=built.last_active_date,
+            total_count=built.total_count,
+            window_end=built.window_end,
+            daily_counts=built.daily_counts,
+            goal_progress=built.goal_progress
+        ).on_conflict_do_nothing(index_elements=["user_id"]))
+        return self.db.get(models.UserStats, user_id, with_for_update=True, populate_existing=True), True
+
+    def ensure(self, user_id: int) -> models.UserStats:
+        return self.get(user_id) or self._locked(user_id)[0]
+
+    def record_activity(self, user_id: int, activity_date: date, delta: int, new_day: bool) -> None:
+        user_stats, created = self._locked(user_id)
+        if created:
+            return
+        if not stats.apply_activity(user_stats, activity_date, delta, new_day):
+            # A day earlier than the last active day can join two streaks
+            stats.compute_user_stats(self.db, user_id, user_stats)
+
+    def record_task_change(
+        self,
+        owner_id: int,
+        before: Optional[Tuple[Optional[int], bool]],
+        after: Optional[Tuple[Optional[int], bool]]
+    ) -> None:
+        # Only tasks under a goal affect stats
+        if before == after or not ((before and before[0]) or (after and after[0])):
+            return
+        user_stats, created = self._locked(owner_id)
+        if created:
+            return
+        if before:
+            stats.apply_goal_delta(user_stats, before[0], before[1], -1)
+        if after:
+            stats.apply_goal_delta(user_stats, after[0], after[1], +1)
+
+    def forget_goal(self, owner_id: int, goal_id: int) -> None:
+        user_stats = self.db.get(models.UserStats, owner_id, with_for_update=True)
+        if user_stats is not None and str(goal_id) in (user_stats.goal_progress or {}):
+            user_stats.goal_progress = {
+                key: value for key, value in user_stats.goal_progress.items() if key != str(goal_id)
+            }
+
+
+class TagRepository:
+    """
+    Keeps tag_counts in step with task writes: each write upserts the +1/-1
+    deltas of the tags it added or removed, so listing tags never scans tasks.
+    The upsert is sent with the other deferred writes at commit.
+    """
+
+    def __init__(self, uow: "UnitOfWork"):
+        self.uow = uow
+        self.db = uow.db
+
+    def record_change(self, owner_id: int, before: List[str], after: List[str]) -> None:
+        deltas = {tag: -1 for tag in set(before) - set(after)}
+        deltas.update({tag: +1 for tag in set(after) - set(before)})
+        if not deltas:
+            return
+        # Sorted so concurrent writers lock an owner's tag rows in the same order
+        statement = insert(models.TagCount).values([
+            {"owner_id": owner_id, "tag": tag, "task_count": delta}
+            for tag, delta in sorted(deltas.items())
+        ])
+        database.defer_write(self.db, statement.on_conflict_do_update(
+            index_elements=["owner_id", "tag"],
+            set_={"task_count": models.TagCount.task_count + statement.excluded.task_count}
+        ))
+        self.uow.touched_owners.add(owner_id)
+
+    def list_for_owner(self, owner_id: int) -> List[Tuple[str, int]]:
+        return self.db.query(models.TagCount.tag, models.TagCount.task_count).filter(
+            models.TagCount.owner_id == owner_id,
+            models.TagCount.task_count > 0
+        ).order_by(models.TagCount.task_count.desc(), models.TagCount.tag).all()
+
+
+class UnitOfWork:
+    """
+    Request-scoped wrapper around a session. Repositories share one identity map
+    so a row is loaded at most once per request, and the request commits once.
+    Outbox events, jobs and tag count deltas are queued with
+    database.defer_write and sent in one pipeline when it does.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.identity_map: Dict[Tuple[type, int], Optional[models.Base]] = {}
+        # Users whose cached task/goal listings this unit of work makes stale
+        self.touched_owners = set()
+        # (owner_id, goal_id) of goals whose auto-completion is recomputed in the background after commit
+        self.touched_goals: Set[Tuple[int, int]] = set()
+        self.jobs_enqueued = False
+        self.events_recorded = False
+        # (user_id, key) claimed by app/idempotency.begin, awaiting its response
+        self.idempotency_key: Optional[Tuple[int, str]] = None
+        self.tasks = TaskRepository(self)
+        self.goals = GoalRepository(self)
+        self.activities = ActivityRepository(self)
+        self.stats = StatsRepository(self)
+        self.tags = TagRepository(self)
+
+    def enqueue_job(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> None:
+        """Defer a side effect to the job runner; it is durable once this unit of work commits."""
+        database.defer_write(self.db, jobs.job_insert(kind, payload, idempotency_key))
+        self.jobs_enqueued = True
+
+    def record_event(
+        self,
+        event_type: str,
+        aggregate_type: str,
+        aggregate_id: int,
+        owner_id: int,
+        payload: Dict[str, Any]
+    ) -> None:
+        """Write a change event to the outbox in this unit of work's transaction."""
+        database.defer_write(self.db, outbox.event_insert(event_type, aggregate_type, aggregate_id, owner_id, payload))
+        self.events_recorded = True
+
+    def commit(self) -> None:
+        goal_ids_by_owner: Dict[int, List[int]] = defaultdict(list)
+        for owner_id, goal_id in sorted(self.touched_goals):
+            goal_ids_by_owner[owner_id].append(goal_id)
+        for owner_id, goal_ids in goal_ids_by_owner.items():
+            self.enqueue_job("goals.recompute", {"owner_id": owner_id, "goal_ids": goal_ids})
+        self.touched_goals.clear()
+        self.db.commit()
+        # Invalidate after the commit so a concurrent miss can't re-cache old rows
+        for owner_id in self.touched_owners:
+            response_cache.invalidate(owner_id)
+        self.touched_owners.clear()
+        if self.jobs_enqueued:
+            job_runner.wake()
+            self.jobs_enqueued = False
+        if self.events_recorded:
+            outbox_relay.wake()
+            self.events_recorded = False
+
+    def rollback(self) -> None:
+        self.db.rollback()
+        self.identity_map.clear()
+        self.touched_owners.clear()
+        self.touched_goals.clear()
+        self.jobs_enqueued = False
+        self.events_recorded = False
+        self.idempotency_key = None
+
+
+@jobs.handler("activity.increment")
+def count_activity_job(db: Session, payloads: List[Dict[str, Any]]) -> Set[int]:
+    uow = UnitOfWork(db)
+    for payload in payloads:
+        uow.activities.increment(payload["user_id"], date.fromisoformat(payload["date"]))
+    # Activity isn't part of the cached listings
+    return set()
+
+
+@jobs.handler("tasks.rebalance")
+def rebalance_ranks_job(db: Session, payloads: List[Dict[str, Any]]) -> Set[int]:
+    uow = UnitOfWork(db)
+    for owner_id, goal_id in {(payload["owner_id"], payload["goal_id"]) for payload in payloads}:
+        uow.tasks.rebalance(owner_id, goal_id)
+    return set(uow.touched_owners)
+
+
+# Dependency
+def get_uow(db: Session = Depends(get_db)):
+    uow = UnitOfWork(db)
+    try:
+        yield uow
+    except Exception:
+        uow.rollback()
+        raise
+
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import hashlib
+import math
+import os
+import threading
+import time
+from . import models
+
+# Every worker polls revoked_tokens this often, so a token revoked through
+# another worker is rejected here at most this many seconds later
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "2"))
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.001"))
+# Polls re-read this much of the recent past, for revocations that committed late
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership with no false negatives and a false positive
+    rate of about `error_rate` while it holds at most `capacity` items.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        if item in self:
+            return
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    In-memory view of revoked_tokens. A Bloom filter answers "not revoked"
+    for almost every request without a query; only a token the filter may
+    contain (a revoked one, or a rare false positive) is looked up exactly.
+    A worker thread adds rows revoked by other workers and rebuilds the
+    filter hourly, dropping tokens that have expired anyway.
+
+    Until the first sync has run every check goes to the database.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        interval_seconds: float = REVOCATION_SYNC_SECONDS,
+        capacity: int = REVOCATION_FILTER_CAPACITY,
+        error_rate: float = REVOCATION_FILTER_ERROR_RATE
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.exact_checks = 0
+        self.false_positives = 0
+        self._filter: Optional[BloomFilter] = None
+        self._synced_until: Optional[datetime] = None
+        self._last_rebuild = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        self.session_factory = session_factory
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds * 5)
+            self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                # Rebuild hourly, or early once the filter holds more than it was sized for
+                if self._filter is None or self._filter.count > self._filter.capacity or time.monotonic() - self._last_rebuild > 3600:
+                    self.rebuild()
+                else:
+                    self.sync()
+            except Exception as e:
+                print(f"Revocation sync error: {str(e)}")
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+    def may_be_revoked(self, jti: str) -> bool:
+        """False only when the filter rules the token out; True before the first sync."""
+        bloom = self._filter
+        return bloom is None or jti in bloom
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            return False
+        self.exact_checks += 1
+        # On the primary: a replica may not have a revocation made a moment ago
+        db.info["replica"] = False
+        revoked = db.query(models.RevokedToken.id).filter(models.RevokedToken.jti == jti).first() is not None
+        if bloom is not None and not revoked:
+            self.false_positives += 1
+        return revoked
+
+    def revoke(self, db: Session, jti: str, user_id: int, expires_at: datetime) -> bool:
+        """
+        Record a revocation in the caller's transaction; this worker rejects
+        the token at once. Returns False if the token was already revoked,
+        which a concurrent revocation of the same token waits to find out.
+        """
+        revoked = db.execute(insert(models.RevokedToken).values(
+            jti=jti, user_id=user_id, expires_at=expires_at
+        ).on_conflict_do_nothing(index_elements=["jti"]).returning(models.RevokedToken.id)).first()
+        # A false entry if the transaction rolls back only costs an exact check
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        return revoked is not None
+
+    def rebuild(self) -> None:
+        db = self.session_factory()
+        try:
+            now = db.query(func.now()).scalar()
+            rows = db.query(models.RevokedToken.jti).filter(models.RevokedToken.expires_at > now).all()
+            bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+            for (jti,) in rows:
+                bloom.add(jti)
+            with self._lock:
+                # Revocations made by this worker while the rows were read are caught by the overlap
+                self._filter = bloom
+                self._synced_until = now
+            self._last_rebuild = time.monotonic()
+            db.commit()
+        finally:
+            db.close()
+        self.sync()
+
+    def sync(self) -> int:
+        """Add revocations made since the last sync; returns how many rows were read."""
+        if self._filter is None:
+            self.rebuild()
+            return 0
+        db = self.session_factory()
+        try:
+            now = db.query(func.now()).scalar()
+            rows = db.query(models.RevokedToken.jti).filter(
+                models.RevokedToken.revoked_at >= self._synced_until - SYNC_OVERLAP
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            for (jti,) in rows:
+                self._filter.add(jti)
+            self._synced_until = now
+        return len(rows)
+
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "ready": bloom is not None,
+            "entries": bloom.count if bloom else 0,
+            "filter_bytes": len(bloom.bits) if bloom else 0,
+            "exact_checks": self.exact_checks,
+            "false_positives": self.false_positives
+        }
+
+
+def prune(db: Session) -> int:
+    # A revoked token that has expired is rejected by its exp claim anyway
+    return db.execute(delete(models.RevokedToken).where(
+        models.RevokedToken.expires_at < datetime.now(timezone.utc)
+    )).rowcount
+
+
+revocation_list = RevocationList()
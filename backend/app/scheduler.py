@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+import os
+import threading
+from . import models
+from .recurrence import next_occurrence, parse_rule
+from .repositories import UnitOfWork
+
+RECURRENCE_SCHEDULER_ENABLED = os.getenv("RECURRENCE_SCHEDULER_ENABLED", "true").lower() == "true"
+RECURRENCE_INTERVAL_SECONDS = float(os.getenv("RECURRENCE_INTERVAL_SECONDS", "60"))
+RECURRENCE_BATCH_SIZE = int(os.getenv("RECURRENCE_BATCH_SIZE", "500"))
+
+
+class RecurrenceScheduler:
+    """
+    Rolls completed recurring tasks forward to their next occurrence once the
+    current one is due. A single worker thread handles at most batch_size rows
+    per transaction and max_batches per tick, so it holds one pooled connection
+    at a time and a large backlog is spread over several ticks.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval_seconds: float = RECURRENCE_INTERVAL_SECONDS,
+        batch_size: int = RECURRENCE_BATCH_SIZE,
+        max_batches: int = 20
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recurrence-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                advanced = self.run_once()
+                if advanced:
+                    print(f"Recurrence scheduler advanced {advanced} tasks")
+            except Exception as e:
+                print(f"Recurrence scheduler error: {str(e)}")
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        advanced = 0
+        last_id = 0
+        for _ in range(self.max_batches):
+            db = self.session_factory()
+            uow = UnitOfWork(db)
+            try:
+                # Keyset pagination over the partial recurring index; SKIP LOCKED
+                # lets several workers share the backlog without blocking requests
+                tasks = db.query(models.Task).filter(
+                    models.Task.recurrence_rule.isnot(None),
+                    models.Task.due_at <= now,
+                    models.Task.completed == True,
+                    models.Task.id > last_id
+                ).order_by(models.Task.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+                if not tasks:
+                    break
+
+                for task in tasks:
+                    last_id = task.id
+                    try:
+                        due_at = next_occurrence(parse_rule(task.recurrence_rule), task.due_at, now)
+                    except (ValueError, OverflowError) as e:
+                        print(f"Skipping task {task.id} with invalid recurrence rule: {str(e)}")
+                        continue
+                    if due_at is None:
+                        # The rule has ended; keep the last occurrence as a one-off task
+                        uow.tasks.update(task, {"recurrence_rule": None})
+                        continue
+                    # Through the repository so stats and goal rollups see the reopened task
+                    uow.tasks.update(task, {"due_at": due_at, "completed": False})
+                    advanced += 1
+
+                # Also invalidates cached listings and queues goal recompute
+                uow.commit()
+            finally:
+                db.close()
+        return advanced
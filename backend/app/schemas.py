@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, TypeAdapter, field_validator
+from typing import Optional, List, Dict, Literal
 from datetime import datetime, date
+from .recurrence import parse_rule
+from .tags import normalize_tags, parse_tag_filter
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -20,14 +22,40 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    # Also revoke this refresh token, ending the session instead of just this access token
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+def _validate_recurrence_rule(value: Optional[str]) -> Optional[str]:
+    if value is not None:
+        parse_rule(value)
+    return value
+
 class TaskBase(BaseModel):
     title: str
     description: Optional[str] = None
     goal_id: Optional[int] = None
+    due_at: Optional[datetime] = None
+    recurrence_rule: Optional[str] = None
+    tags: List[str] = []
+
+    @field_validator("recurrence_rule")
+    @classmethod
+    def check_recurrence_rule(cls, value: Optional[str]) -> Optional[str]:
+        return _validate_recurrence_rule(value)
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, value: List[str]) -> List[str]:
+        return normalize_tags(value)
 
 class TaskCreate(TaskBase):
     pass
@@ -37,6 +65,20 @@ class TaskUpdate(BaseModel):
     description: Optional[str] = None
     completed: Optional[bool] = None
     goal_id: Optional[int] = None
+    due_at: Optional[datetime] = None
+    recurrence_rule: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+    @field_validator("recurrence_rule")
+    @classmethod
+    def check_recurrence_rule(cls, value: Optional[str]) -> Optional[str]:
+        return _validate_recurrence_rule(value)
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, value: Optional[List[str]]) -> List[str]:
+        # An explicit null clears the tags
+        return normalize_tags(value or [])
 
 class Task(TaskBase):
     id: int
@@ -44,6 +86,7 @@ class Task(TaskBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     owner_id: int
+    rank: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -52,11 +95,50 @@ class TaskInGoal(Task):
     class Config:
         from_attributes = True
 
+class TaskQuery(BaseModel):
+    """Filter and sort query parameters for task listings."""
+    completed: Optional[bool] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    updated_since: Optional[datetime] = None
+    sort: Literal["rank", "id", "created_at", "updated_at", "due_at", "title"] = "rank"
+    order: Literal["asc", "desc"] = "asc"
+    # Also list tasks moved to tasks_archive
+    include_archived: bool = False
+    # Comma-separated; "any" matches tasks with at least one of them, "all" with every one
+    tags: Optional[str] = None
+    tag_match: Literal["any", "all"] = "any"
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, value: Optional[str]) -> Optional[str]:
+        # Normalized here so equivalent filters share a cache entry
+        return ",".join(parse_tag_filter(value)) or None
+
+class TaskMove(BaseModel):
+    # The task lands between these two tasks of its list; either may be omitted
+    previous_id: Optional[int] = None
+    next_id: Optional[int] = None
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
+tag_count_list_adapter = TypeAdapter(List[TagCount])
+
+class TaskOccurrence(BaseModel):
+    task_id: int
+    title: str
+    due_at: datetime
+    completed: bool = False
+    recurring: bool = False
+
 class GoalBase(BaseModel):
     title: str
     description: Optional[str] = None
     target_date: Optional[datetime] = None
     is_pinned: bool = False
+    parent_id: Optional[int] = None
 
 class GoalCreate(GoalBase):
     pass
@@ -74,11 +156,31 @@ class Goal(GoalBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     owner_id: int
+    subtree_total_tasks: int = 0
+    subtree_completed_tasks: int = 0
     tasks: List[TaskInGoal] = []
 
     class Config:
         from_attributes = True
 
+class GoalMove(BaseModel):
+    parent_id: Optional[int] = None  # None moves the goal to the top level
+
+class GoalTreeNode(BaseModel):
+    id: int
+    title: str
+    parent_id: Optional[int] = None
+    depth: int  # Distance from the goal the tree was requested for
+    completed: bool = False
+    is_pinned: bool = False
+    subtree_total_tasks: int = 0
+    subtree_completed_tasks: int = 0
+    progress: int = 0  # Progress in percentage, including sub-goals
+
+# Used to serialize cached and content-negotiated responses
+task_list_adapter = TypeAdapter(List[Task])
+goal_list_adapter = TypeAdapter(List[Goal])
+
 class UserActivityBase(BaseModel):
     date: date
     count: int = 1
@@ -92,4 +194,45 @@ class UserActivity(UserActivityBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PinnedGoal(GoalBase):
+    id: int
+    completed: bool = False
+    total_tasks: int = 0
+    completed_tasks: int = 0
+    progress: int = 0  # Progress in percentage
+
+class HeatmapSummary(BaseModel):
+    start_date: date
+    end_date: date
+    total: int = 0
+    active_days: int = 0
+    max_count: int = 0
+    days: Dict[str, int] = {}  # Only days with activity; missing days are zero
+
+class Dashboard(BaseModel):
+    user: User
+    pinned_goals: List[PinnedGoal] = []
+    open_tasks: List[Task] = []
+    today_count: int = 0
+    heatmap: HeatmapSummary
+
+
+class GoalCompletion(BaseModel):
+    goal_id: int
+    total_tasks: int
+    completed_tasks: int
+    ratio: float
+
+class UserStats(BaseModel):
+    current_streak: int = 0
+    longest_streak: int = 0
+    last_active_date: Optional[date] = None
+    count_7d: int = 0
+    count_30d: int = 0
+    total_count: int = 0
+    goal_completion: List[GoalCompletion] = []
+
+dashboard_adapter = TypeAdapter(Dashboard)
+activity_adapter = TypeAdapter(Dict[str, int])
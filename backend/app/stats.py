@@ -0,0 +1,184 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import argparse
+from . import models
+from . import activity_store
+from . import archive
+
+# user_stats.daily_counts holds this many days, newest first (index 0 is window_end)
+WINDOW_DAYS = 30
+
+
+def shift_window(counts: Optional[List[int]], window_end: Optional[date], to: date) -> List[int]:
+    """Return the rolling daily counts re-anchored so index 0 is `to`."""
+    if not counts or window_end is None:
+        return [0] * WINDOW_DAYS
+    gap = (to - window_end).days
+    if gap <= 0:
+        return list(counts)
+    if gap >= WINDOW_DAYS:
+        return [0] * WINDOW_DAYS
+    return [0] * gap + list(counts[:WINDOW_DAYS - gap])
+
+
+def current_streak(stats: models.UserStats, today: date) -> int:
+    # A streak is still alive until a full day passes without activity
+    if stats.last_active_date is None or stats.last_active_date < today - timedelta(days=1):
+        return 0
+    return stats.current_streak
+
+
+def new_user_stats(user_id: int) -> models.UserStats:
+    return models.UserStats(
+        user_id=user_id,
+        current_streak=0,
+        longest_streak=0,
+        last_active_date=None,
+        total_count=0,
+        window_end=None,
+        daily_counts=[0] * WINDOW_DAYS,
+        goal_progress={}
+    )
+
+
+def apply_activity(stats: models.UserStats, activity_date: date, delta: int, new_day: bool) -> bool:
+    """
+    Fold one activity increment into stats in O(1). Returns False when the
+    increment is for a day before the last active day, which can split or
+    join streaks and needs a rebuild instead.
+    """
+    if new_day and stats.last_active_date is not None and activity_date < stats.last_active_date:
+        return False
+
+    if stats.window_end is None or activity_date > stats.window_end:
+        stats.daily_counts = shift_window(stats.daily_counts, stats.window_end, activity_date)
+        stats.window_end = activity_date
+    index = (stats.window_end - activity_date).days
+    if index < WINDOW_DAYS:
+        counts = list(stats.daily_counts)
+        counts[index] += delta
+        stats.daily_counts = counts
+    stats.total_count += delta
+
+    if new_day and stats.last_active_date != activity_date:
+        if stats.last_active_date == activity_date - timedelta(days=1):
+            stats.current_streak += 1
+        else:
+            stats.current_streak = 1
+        stats.last_active_date = activity_date
+        stats.longest_streak = max(stats.longest_streak, stats.current_streak)
+    return True
+
+
+def apply_goal_delta(stats: models.UserStats, goal_id: Optional[int], completed: bool, sign: int) -> None:
+    if not goal_id:
+        return
+    progress = {key: list(value) for key, value in (stats.goal_progress or {}).items()}
+    total, done = progress.get(str(goal_id), [0, 0])
+    total += sign
+    done += sign if completed else 0
+    if total <= 0:
+        progress.pop(str(goal_id), None)
+    else:
+        progress[str(goal_id)] = [total, done]
+    # Reassign so the JSON column is flagged dirty
+    stats.goal_progress = progress
+
+
+def compute_user_stats(db: Session, user_id: int, stats: Optional[models.UserStats] = None) -> models.UserStats:
+    """Recompute every field of a user's stats from the source tables."""
+    stats = stats or new_user_stats(user_id)
+    stats.current_streak = 0
+    stats.longest_streak = 0
+    stats.last_active_date = None
+    stats.total_count = 0
+    stats.window_end = None
+    stats.daily_counts = [0] * WINDOW_DAYS
+
+    for activity_date, count in sorted(activity_store.load_counts(db, user_id).items()):
+        apply_activity(stats, activity_date, count, new_day=True)
+
+    # Archived tasks still count towards their goal's progress
+    tasks = archive.tasks_with_archive("id", "owner_id", "goal_id", "completed")
+    rows = db.query(
+        tasks.c.goal_id,
+        func.count(tasks.c.id),
+        func.count(tasks.c.id).filter(tasks.c.completed == True)
+    ).filter(
+        tasks.c.owner_id == user_id,
+        tasks.c.goal_id.isnot(None)
+    ).group_by(tasks.c.goal_id).all()
+    stats.goal_progress = {str(goal_id): [total, done] for goal_id, total, done in rows}
+    return stats
+
+
+def rebuild_user_stats(db: Session, user_id: int) -> models.UserStats:
+    stats = db.get(models.UserStats, user_id, with_for_update=True)
+    if stats is None:
+        stats = compute_user_stats(db, user_id)
+        db.add(stats)
+    else:
+        compute_user_stats(db, user_id, stats)
+    return stats
+
+
+def rebuild_all(db: Session, batch_size: int = 500) -> int:
+    rebuilt = 0
+    last_id = 0
+    while True:
+        user_ids = [user_id for (user_id,) in db.query(models.User.id).filter(
+            models.User.id > last_id
+        ).order_by(models.User.id).limit(batch_size).all()]
+        if not user_ids:
+            return rebuilt
+        for user_id in user_ids:
+            rebuild_user_stats(db, user_id)
+        db.commit()
+        rebuilt += len(user_ids)
+        last_id = user_ids[-1]
+        print(f"Rebuilt stats for {rebuilt} users")
+
+
+def to_schema_fields(stats: models.UserStats, today: date) -> Dict[str, object]:
+    counts = shift_window(stats.daily_counts, stats.window_end, today)
+    goal_completion = []
+    for goal_id, (total, done) in sorted((stats.goal_progress or {}).items(), key=lambda item: int(item[0])):
+        goal_completion.append({
+            "goal_id": int(goal_id),
+            "total_tasks": total,
+            "completed_tasks": done,
+            "ratio": done / total if total else 0.0
+        })
+    return {
+        "current_streak": current_streak(stats, today),
+        "longest_streak": stats.longest_streak,
+        "last_active_date": stats.last_active_date,
+        "count_7d": sum(counts[:7]),
+        "count_30d": sum(counts),
+        "total_count": stats.total_count,
+        "goal_completion": goal_completion
+    }
+
+
+if __name__ == "__main__":
+    # Backfill: python -m app.stats [--user-id ID]
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Rebuild materialized user_stats rows")
+    parser.add_argument("--user-id", type=int, help="Only rebuild this user")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    init_engine()
+    db = SessionLocal()
+    try:
+        if args.user_id:
+            rebuild_user_stats(db, args.user_id)
+            db.commit()
+            print(f"Rebuilt stats for user {args.user_id}")
+        else:
+            rebuild_all(db, batch_size=args.batch_size)
+    finally:
+        db.close()
@@ -0,0 +1,69 @@
+from typing import Iterable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import argparse
+
+MAX_TAGS_PER_TASK = 20
+TAG_MAX_LENGTH = 50
+
+
+def _unique(tags: Iterable[str]) -> List[str]:
+    # Trimmed, inner whitespace collapsed, lower-cased, first occurrence kept
+    unique = []
+    for tag in tags:
+        tag = " ".join(tag.split()).lower()
+        if tag and tag not in unique:
+            unique.append(tag)
+    return unique
+
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """Tags as stored on a task: normalized, de-duplicated and within the limits."""
+    normalized = _unique(tags)
+    for tag in normalized:
+        if "," in tag:
+            raise ValueError("Tags cannot contain commas")
+        if len(tag) > TAG_MAX_LENGTH:
+            raise ValueError(f"Tags are at most {TAG_MAX_LENGTH} characters")
+    if len(normalized) > MAX_TAGS_PER_TASK:
+        raise ValueError(f"A task has at most {MAX_TAGS_PER_TASK} tags")
+    return normalized
+
+
+def parse_tag_filter(value: Optional[str]) -> List[str]:
+    # ?tags=a,b; no limits here, a tag no task can carry simply matches nothing
+    return _unique(value.split(",")) if value else []
+
+
+def rebuild(db: Session, owner_id: Optional[int] = None) -> None:
+    """Recompute tag_counts from the live tasks, for everyone or one owner."""
+    scope = "WHERE owner_id = :owner_id" if owner_id is not None else ""
+    db.execute(text(f"DELETE FROM tag_counts {scope}"), {"owner_id": owner_id})
+    db.execute(text(f"""
+        INSERT INTO tag_counts (owner_id, tag, task_count)
+        SELECT owner_id, tag, count(*) FROM tasks, unnest(tags) AS tag
+        {scope}
+        GROUP BY owner_id, tag
+    """), {"owner_id": owner_id})
+
+
+if __name__ == "__main__":
+    # Repair: python -m app.tags --rebuild [--owner-id N]
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Maintain per-owner tag counts")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute tag_counts from tasks")
+    parser.add_argument("--owner-id", type=int)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        init_engine()
+        db = SessionLocal()
+        try:
+            rebuild(db, args.owner_id)
+            db.commit()
+            print("Rebuilt tag counts")
+        finally:
+            db.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,99 @@
+"""
+Database driver benchmark: psycopg2 against psycopg 3.
+
+Replays the database work of two requests for the busiest owner, many
+times on one pooled connection per driver, and reports the DB time per
+request (median and p95) and the statements it sent:
+  - GET /tasks         a listing page and a single task by id
+  - PATCH /tasks/{id}  the task update with its outbox event and tag count
+                       deltas; rolled back, so the data is left unchanged
+
+With psycopg the hot statements become prepared statements after
+DATABASE_PREPARE_THRESHOLD runs, and the deferred writes of the PATCH go
+out in one pipeline.
+
+Run from backend/: python scripts/bench_db_driver.py [--requests 500]
+Needs the database from .env to be reachable and both drivers installed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import DRIVERS, RoutingSession, create_db_engine, flush_deferred_writes, get_database_url  # noqa: E402
+from app.repositories import UnitOfWork  # noqa: E402
+
+
+def read_tasks(uow: UnitOfWork, owner_id: int, task_id: int) -> None:
+    uow.tasks.list_for_owner(owner_id, limit=50)
+    uow.tasks.get_owned(task_id, owner_id)
+
+
+def patch_task(uow: UnitOfWork, owner_id: int, task_id: int) -> None:
+    task = uow.tasks.require_owned(task_id, owner_id)
+    tags = list(task.tags or [])
+    uow.tasks.update(task, {"tags": [tag for tag in tags if tag != "bench"] if "bench" in tags else tags + ["bench"]})
+    flush_deferred_writes(uow.db)
+
+
+def bench(driver: str, owner_id: int, task_id: int, requests: int, warmup: int) -> dict:
+    url = get_database_url(driver)
+    engine = create_db_engine(url, pool_size=1)
+    session_factory = sessionmaker(bind=engine, class_=RoutingSession, autoflush=False)
+    statements = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    results = {}
+    try:
+        for name, work in (("GET /tasks", read_tasks), ("PATCH /tasks/{id}", patch_task)):
+            timings = []
+            for run in range(warmup + requests):
+                db = session_factory()
+                statements[0] = 0
+                try:
+                    started = time.perf_counter()
+                    work(UnitOfWork(db), owner_id, task_id)
+                    db.rollback()
+                    elapsed = time.perf_counter() - started
+                finally:
+                    db.close()
+                if run >= warmup:
+                    timings.append(elapsed * 1000)
+            timings.sort()
+            results[name] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1], statements[0])
+    finally:
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per driver, so statements get prepared")
+    parser.add_argument("--owner-id", type=int, help="Defaults to the owner with the most tasks")
+    args = parser.parse_args()
+
+    probe = create_engine(get_database_url("psycopg2"))
+    with probe.connect() as connection:
+        owner_id = args.owner_id or connection.execute(text(
+            "SELECT owner_id FROM tasks GROUP BY owner_id ORDER BY count(*) DESC LIMIT 1"
+        )).scalar()
+        task_id = connection.execute(
+            text("SELECT max(id) FROM tasks WHERE owner_id = :owner_id"), {"owner_id": owner_id}
+        ).scalar()
+    probe.dispose()
+
+    print(f"owner {owner_id}, task {task_id}, {args.requests} requests per driver")
+    print(f"{'request':<20}{'driver':<10}{'median ms':>10}{'p95 ms':>10}{'statements':>12}")
+    for driver in DRIVERS:
+        for name, (median, p95, sent) in bench(driver, owner_id, task_id, args.requests, args.warmup).items():
+            print(f"{name:<20}{driver:<10}{median:>10.3f}{p95:>10.3f}{sent:>12}")
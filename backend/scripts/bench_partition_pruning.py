@@ -0,0 +1,101 @@
+"""
+Partition pruning benchmark for the router queries.
+
+Runs EXPLAIN ANALYZE on the statements behind the task, goal and activity
+endpoints for the busiest owner and reports, per query, how many partitions
+the plan touched and the median execution time. While the _hashed shadows
+exist (between the f6c3a9e1b7d2 and a2d7e5b9c4f8 migrations, after
+`python -m app.partitioning backfill`) each query is also run against them,
+so the plain and the partitioned table can be compared on the same data.
+
+Run from backend/: python scripts/bench_partition_pruning.py [--runs 20]
+Needs the database from .env to be reachable.
+"""
+import argparse
+import os
+import statistics
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.database import init_engine  # noqa: E402
+
+# (name, SQL) with {tasks} and {goals} standing for the table under test
+QUERIES = [
+    ("GET /tasks", "SELECT * FROM {tasks} WHERE owner_id = :owner_id ORDER BY goal_id, rank, id LIMIT 100"),
+    ("GET /tasks?completed=false", (
+        "SELECT * FROM {tasks} WHERE owner_id = :owner_id AND completed = false "
+        "ORDER BY created_at DESC NULLS LAST, id LIMIT 100"
+    )),
+    ("GET /tasks/{id}", "SELECT * FROM {tasks} WHERE id = :task_id AND owner_id = :owner_id"),
+    ("GET /tasks/{id} (id only)", "SELECT * FROM {tasks} WHERE id = :task_id"),
+    ("GET /tasks/upcoming", (
+        "SELECT * FROM {tasks} WHERE owner_id = :owner_id AND due_at >= now() AND due_at < now() + interval '7 days' "
+        "ORDER BY due_at LIMIT 100"
+    )),
+    ("GET /goals", "SELECT * FROM {goals} WHERE owner_id = :owner_id LIMIT 100"),
+    ("GET /me/dashboard goals", (
+        "SELECT * FROM {goals} WHERE owner_id = :owner_id AND is_pinned = true "
+        "ORDER BY completed, created_at DESC"
+    )),
+    ("GET /me/activity", "SELECT date, count FROM user_activities WHERE user_id = :owner_id AND date >= :since"),
+]
+
+
+def relations(plan: dict) -> set:
+    # Every table a plan node reads; partitions show up under their own names
+    found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= relations(child)
+    return found
+
+
+def explain(connection, sql: str, params: dict, runs: int):
+    timings = []
+    touched = set()
+    for _ in range(runs):
+        result = connection.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params).scalar()
+        timings.append(result[0]["Execution Time"])
+        touched = relations(result[0]["Plan"])
+    return statistics.median(timings), touched
+
+
+def partition_count(connection, table: str) -> int:
+    return connection.execute(text(
+        "SELECT count(*) FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"
+    ), {"table": table}).scalar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--owner-id", type=int, help="Defaults to the owner with the most tasks")
+    args = parser.parse_args()
+
+    engine = init_engine()
+    with engine.connect() as connection:
+        owner_id = args.owner_id or connection.execute(text(
+            "SELECT owner_id FROM tasks GROUP BY owner_id ORDER BY count(*) DESC LIMIT 1"
+        )).scalar()
+        task_id = connection.execute(
+            text("SELECT max(id) FROM tasks WHERE owner_id = :owner_id"), {"owner_id": owner_id}
+        ).scalar()
+        params = {"owner_id": owner_id, "task_id": task_id, "since": date.today() - timedelta(days=30)}
+
+        variants = [("current", {"tasks": "tasks", "goals": "goals"})]
+        if connection.execute(text("SELECT to_regclass('tasks_hashed')")).scalar() is not None:
+            variants.append(("hashed", {"tasks": "tasks_hashed", "goals": "goals_hashed"}))
+        for label, tables in variants:
+            total = {name: partition_count(connection, table) for name, table in tables.items()}
+            print(f"{label}: tasks {total['tasks']} partitions, goals {total['goals']} partitions, owner {owner_id}")
+
+        print(f"{'query':<28}{'variant':<10}{'median ms':>10}  partitions read")
+        for name, sql in QUERIES:
+            for label, tables in variants:
+                if "{" not in sql and label != "current":
+                    continue
+                median, touched = explain(connection, sql.format(**tables), params, args.runs)
+                print(f"{name:<28}{label:<10}{median:>10.3f}  {', '.join(sorted(touched))}")
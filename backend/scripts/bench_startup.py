@@ -0,0 +1,78 @@
+"""
+Cold-start benchmark for the API.
+
+Measures, over several fresh interpreters:
+  - import time of app.main (what every worker and test run pays)
+  - time from spawning a uvicorn worker to its first successful response
+
+Run from backend/: python scripts/bench_startup.py [--runs 5] [--port 8765]
+The uvicorn measurement needs the database from .env to be reachable.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def bench_import(runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return timings
+
+
+def bench_uvicorn(runs: int, port: int, timeout: float = 30.0) -> list:
+    timings = []
+    env = dict(os.environ, RECURRENCE_SCHEDULER_ENABLED="false")
+    for _ in range(runs):
+        start = time.perf_counter()
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        try:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("uvicorn did not answer in time")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.01)
+            timings.append(time.perf_counter() - start)
+        finally:
+            worker.terminate()
+            worker.wait()
+    return timings
+
+
+def report(name: str, timings: list) -> None:
+    print(
+        f"{name:<24} median {statistics.median(timings) * 1000:8.1f} ms   "
+        f"min {min(timings) * 1000:8.1f} ms   max {max(timings) * 1000:8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-uvicorn", action="store_true")
+    args = parser.parse_args()
+
+    report("import app.main", bench_import(args.runs))
+    if not args.skip_uvicorn:
+        report("uvicorn first response", bench_uvicorn(args.runs, args.port))
@@ -0,0 +1,104 @@
+"""
+Wire format benchmark for list responses.
+
+Builds a synthetic goal list (each goal with nested tasks) and, for every
+negotiable format, reports encode time and payload size raw, gzipped and
+brotli-compressed (when the brotli package is installed). Needs no database.
+
+Run from backend/: python scripts/bench_wire_format.py [--goals 20] [--tasks 200] [--runs 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import encoding, schemas  # noqa: E402
+
+
+def build_goals(goals: int, tasks: int) -> list:
+    now = datetime(2024, 1, 1, 9, 30)
+    rows = []
+    task_id = 0
+    for goal_id in range(1, goals + 1):
+        goal_tasks = []
+        for index in range(tasks):
+            task_id += 1
+            goal_tasks.append(schemas.TaskInGoal(
+                id=task_id,
+                title=f"Task {index} for goal {goal_id}",
+                description="Short description of the work" if index % 3 else None,
+                goal_id=goal_id,
+                due_at=now + timedelta(days=index) if index % 2 else None,
+                recurrence_rule="FREQ=WEEKLY" if index % 10 == 0 else None,
+                completed=index % 4 == 0,
+                created_at=now + timedelta(minutes=index),
+                updated_at=now + timedelta(hours=index),
+                owner_id=1,
+            ))
+        rows.append(schemas.Goal(
+            id=goal_id,
+            title=f"Goal {goal_id}",
+            description="Long-term goal",
+            target_date=now + timedelta(days=90),
+            is_pinned=goal_id % 5 == 0,
+            completed=False,
+            created_at=now,
+            updated_at=now,
+            owner_id=1,
+            tasks=goal_tasks,
+        ))
+    return rows
+
+
+def time_encode(media_type: str, rows: list, runs: int) -> tuple:
+    timings = []
+    content = b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        content = encoding.render(schemas.goal_list_adapter, rows, media_type)
+        timings.append(time.perf_counter() - start)
+    return content, statistics.median(timings)
+
+
+def time_compress(content: bytes, name: str, runs: int) -> tuple:
+    timings = []
+    compressed = b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        compressed = encoding.compress(content, name)
+        timings.append(time.perf_counter() - start)
+    return len(compressed), statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--goals", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks per goal")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = build_goals(args.goals, args.tasks)
+    media_types = [encoding.JSON, encoding.COLUMNAR_JSON]
+    if encoding.msgpack is not None:
+        media_types.append(encoding.MSGPACK)
+    else:
+        print("msgpack is not installed; skipping application/msgpack")
+    compressions = ["gzip"] + (["br"] if encoding.brotli is not None else [])
+
+    print(f"{args.goals} goals x {args.tasks} tasks, median of {args.runs} runs")
+    print(f"{'format':<40} {'encode ms':>10} {'bytes':>10}" + "".join(
+        f" {name + ' bytes':>12} {name + ' ms':>9}" for name in compressions
+    ))
+    baseline = None
+    for media_type in media_types:
+        content, encode_time = time_encode(media_type, rows, args.runs)
+        baseline = baseline or len(content)
+        line = f"{media_type:<40} {encode_time * 1000:10.2f} {len(content):10d}"
+        for name in compressions:
+            size, compress_time = time_compress(content, name, args.runs)
+            line += f" {size:12d} {compress_time * 1000:9.2f}"
+        print(line + f"   ({len(content) / baseline:.0%} of JSON)")
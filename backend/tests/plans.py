@@ -0,0 +1,126 @@
+"""
+Helpers for the query plan regression tests: capture the SQL an endpoint
+sends, EXPLAIN it, and check each plan against the indexes it should use.
+"""
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+
+# A sequential scan of a table (or partition) this large fails any case
+SEQ_SCAN_MIN_ROWS = 1000
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+class StatementLog:
+    """Records the statements and parameters an engine sends while capturing."""
+
+    def __init__(self, engine: Engine):
+        self.statements: List[Tuple[str, Any]] = []
+        self.capturing = False
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.capturing and not executemany:
+            self.statements.append((statement, parameters))
+
+    def start(self) -> None:
+        self.statements = []
+        self.capturing = True
+
+    def stop(self) -> List[Tuple[str, Any]]:
+        self.capturing = False
+        return self.statements
+
+
+def explainable(statement: str) -> bool:
+    words = statement.lstrip().split(None, 1)
+    if not words:
+        return False
+    keyword = words[0].upper()
+    if keyword == "INSERT":
+        # INSERT ... SELECT reads tables; INSERT ... VALUES has nothing to plan
+        return re.search(r"\bSELECT\b", statement, re.IGNORECASE) is not None
+    return keyword in EXPLAINED
+
+
+def explain(connection: Connection, statement: str, parameters: Any) -> Dict[str, Any]:
+    """Estimated plan of a captured statement; writes are planned, not run."""
+    transaction = connection.begin()
+    try:
+        result = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    finally:
+        transaction.rollback()
+    return result[0]["Plan"]
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+class Catalog:
+    """Partition and index names resolved to the tables and indexes the models declare."""
+
+    def __init__(self, connection: Connection):
+        self.parents: Dict[str, str] = dict(connection.execute(text(
+            "SELECT child.relname, parent.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+        )).all())
+        self.rows: Dict[str, float] = dict(connection.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"
+        )).all())
+        # Bitmap index scans name only the index
+        self.index_tables: Dict[str, str] = dict(connection.execute(text(
+            "SELECT idx.relname, tbl.relname FROM pg_index "
+            "JOIN pg_class idx ON idx.oid = pg_index.indexrelid "
+            "JOIN pg_class tbl ON tbl.oid = pg_index.indrelid"
+        )).all())
+
+    def root(self, name: str) -> str:
+        # Partitions of partitions (user_activities years split by user) resolve to the top
+        while name in self.parents:
+            name = self.parents[name]
+        return name
+
+
+def check_plan(
+    catalog: Catalog,
+    plan: Dict[str, Any],
+    expected: Dict[str, Optional[Set[str]]],
+    min_rows: int = SEQ_SCAN_MIN_ROWS
+) -> List[str]:
+    """
+    Problems with one plan: sequential scans of large tables, and scans of
+    an expected table that don't go through one of its expected indexes.
+    Scans of partitions smaller than min_rows are left to the planner.
+    """
+    problems = []
+    for node in plan_nodes(plan):
+        index = node.get("Index Name")
+        relation = node.get("Relation Name") or catalog.index_tables.get(index)
+        if relation is None or catalog.rows.get(relation, 0) < min_rows:
+            continue
+        table = catalog.root(relation)
+        if node["Node Type"] == "Seq Scan":
+            problems.append(f"sequential scan of {relation} ({catalog.rows[relation]:.0f} rows)")
+            continue
+        allowed = expected.get(table)
+        if allowed and index is not None and catalog.root(index) not in allowed:
+            problems.append(f"{table} read through {catalog.root(index)}, expected one of {sorted(allowed)}")
+    return problems
+
+
+def describe(plan: Dict[str, Any], depth: int = 0) -> str:
+    """Indented one-line-per-node summary for failure messages."""
+    label = plan["Node Type"]
+    if "Relation Name" in plan:
+        label += f" on {plan['Relation Name']}"
+    if "Index Name" in plan:
+        label += f" using {plan['Index Name']}"
+    lines = [f"{'  ' * depth}{label} (cost={plan['Total Cost']})"]
+    lines += [describe(child, depth + 1) for child in plan.get("Plans", [])]
+    return "\n".join(lines)
@@ -0,0 +1,58 @@
+"""
+Commits through psycopg 3 pipeline mode. The deferred writes of a unit of
+work (outbox events, jobs, tag counts) are sent in one pipeline before the
+commit; this checks they all land. Runs against the plan test database and
+removes what it wrote.
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from conftest import PLAN_TEST_DATABASE_URL, SEED_USERS
+
+TAG = "pipeline-test"
+
+
+@pytest.fixture
+def pipeline_session(plan_db):
+    pytest.importorskip("psycopg")
+    from app import database
+
+    engine = database.create_db_engine(database.with_driver(PLAN_TEST_DATABASE_URL, "psycopg"))
+    db = sessionmaker(bind=engine, class_=database.RoutingSession, autocommit=False, autoflush=False)()
+    try:
+        yield db
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM tasks WHERE :tag = ANY(tags)"), {"tag": TAG})
+        db.execute(text("DELETE FROM goal_closure WHERE descendant_id IN (SELECT id FROM goals WHERE title = :tag)"), {"tag": TAG})
+        db.execute(text("DELETE FROM goals WHERE title = :tag"), {"tag": TAG})
+        db.execute(text("DELETE FROM outbox WHERE owner_id = :owner"), {"owner": SEED_USERS})
+        db.execute(text("DELETE FROM background_jobs WHERE payload->>'owner_id' = :owner"), {"owner": str(SEED_USERS)})
+        db.execute(text("DELETE FROM tag_counts WHERE tag = :tag"), {"tag": TAG})
+        db.commit()
+        db.close()
+        engine.dispose()
+
+
+def test_commit_sends_deferred_writes_in_pipeline(pipeline_session):
+    from app import models
+    from app.repositories import UnitOfWork
+
+    db = pipeline_session
+    assert db.connection().connection.driver_connection.prepared_max == 200
+    uow = UnitOfWork(db)
+    goal = uow.goals.add(models.Goal(title=TAG, owner_id=SEED_USERS))
+    uow.tasks.add(models.Task(title=TAG, owner_id=SEED_USERS, goal_id=goal.id, tags=[TAG]))
+    uow.commit()
+
+    events = db.execute(text(
+        "SELECT event_type FROM outbox WHERE owner_id = :owner ORDER BY id"
+    ), {"owner": SEED_USERS}).scalars().all()
+    assert events == ["goal.created", "task.created"]
+    jobs = db.execute(text(
+        "SELECT kind FROM background_jobs WHERE payload->>'owner_id' = :owner"
+    ), {"owner": str(SEED_USERS)}).scalars().all()
+    assert jobs == ["goals.recompute"]
+    count = db.execute(text("SELECT task_count FROM tag_counts WHERE tag = :tag"), {"tag": TAG}).scalar()
+    assert count == 1
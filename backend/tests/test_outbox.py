@@ -0,0 +1,119 @@
+"""
+Outbox relay delivery against the plan test database, with InMemorySink
+standing in for the consumers. Events are written under their own
+aggregate type and removed afterwards.
+"""
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+AGGREGATE = "outbox-test"
+
+
+class FailingSink:
+    def send(self, events):
+        raise RuntimeError("sink is down")
+
+
+@pytest.fixture
+def db(plan_db):
+    from app import database
+
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.execute(text("DELETE FROM outbox WHERE aggregate_type = :aggregate"), {"aggregate": AGGREGATE})
+        session.commit()
+        session.close()
+
+
+def _record(db, event_type, created_at=None):
+    from app import outbox
+
+    statement = outbox.event_insert(event_type, AGGREGATE, 1, 1, {"test": event_type})
+    if created_at is not None:
+        statement = statement.values(created_at=created_at)
+    db.execute(statement)
+
+
+def _relay(*sinks):
+    from app import database
+    from app.outbox import OutboxRelay
+
+    return OutboxRelay(database.SessionLocal, list(sinks), batch_size=10_000)
+
+
+def _sent(sink):
+    return [event["event_type"] for event in sink.events if event["aggregate_type"] == AGGREGATE]
+
+
+def test_rolled_back_event_is_never_dispatched(db):
+    from app.outbox import InMemorySink
+
+    _record(db, "test.rolled_back")
+    db.rollback()
+    _record(db, "test.committed")
+    db.commit()
+
+    sink = InMemorySink()
+    _relay(sink).run_once()
+    assert _sent(sink) == ["test.committed"]
+
+
+def test_sink_failure_leaves_batch_undispatched(db):
+    from app.outbox import InMemorySink
+
+    _record(db, "test.retried")
+    db.commit()
+
+    with pytest.raises(RuntimeError):
+        _relay(InMemorySink(), FailingSink()).run_once()
+    undispatched = db.execute(text(
+        "SELECT count(*) FROM outbox WHERE aggregate_type = :aggregate AND dispatched_at IS NULL"
+    ), {"aggregate": AGGREGATE}).scalar()
+    assert undispatched == 1
+    db.commit()
+
+    # Delivered on the next tick
+    sink = InMemorySink()
+    _relay(sink).run_once()
+    assert _sent(sink) == ["test.retried"]
+
+
+def test_prune_keeps_partitions_with_undispatched_events(db):
+    from app import outbox
+
+    days = [date(2001, 1, 1), date(2001, 1, 2)]
+    try:
+        outbox.ensure_partitions(db, days[0], days=1)
+        _record(db, "test.pending", datetime(2001, 1, 1, 12, tzinfo=timezone.utc))
+        _record(db, "test.sent", datetime(2001, 1, 2, 12, tzinfo=timezone.utc))
+        db.execute(text(
+            "UPDATE outbox SET dispatched_at = now() WHERE aggregate_type = :aggregate AND event_type = 'test.sent'"
+        ), {"aggregate": AGGREGATE})
+
+        dropped = outbox.prune_partitions(db, date(2001, 1, 20), retention_days=7)
+        assert dropped == [outbox.partition_name(days[1])]
+        remaining = db.execute(text(
+            "SELECT event_type FROM outbox WHERE aggregate_type = :aggregate"
+        ), {"aggregate": AGGREGATE}).scalars().all()
+        assert remaining == ["test.pending"]
+    finally:
+        db.rollback()
+
+
+def test_archived_tasks_record_events(db):
+    from app import archive
+
+    try:
+        owners = archive.archive_batch(db, datetime.now(timezone.utc), batch_size=3)
+        events = db.execute(text(
+            "SELECT owner_id, payload->>'completed' FROM outbox WHERE event_type = 'task.archived'"
+        )).all()
+        assert len(owners) == 3
+        assert sorted(events) == sorted((owner_id, "true") for owner_id in owners)
+    finally:
+        db.rollback()
@@ -0,0 +1,126 @@
+"""
+Query plan regression tests. Each case calls one endpoint against the
+seeded database, EXPLAINs every statement it sent and fails when a plan
+sequentially scans a large table, reads a hot table through an index other
+than the ones listed for the case, or is estimated above the case's cost
+budget. When a change is meant to alter a plan, update the case with it.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+import pytest
+
+from plans import check_plan, describe, explain, explainable
+
+# Multiplies every budget, for machines whose cost settings differ from the defaults
+PLAN_COST_SCALE = float(os.getenv("PLAN_COST_SCALE", "1"))
+
+# Parent index names; plans on partitions are mapped back to these
+TASK_KEY = {"tasks_pkey", "ix_tasks_id", "ix_tasks_owner_id_id"}
+TASK_BY_OWNER = {
+    "ix_tasks_owner_id_id",
+    "ix_tasks_owner_id_goal_id_rank",
+    "ix_tasks_owner_id_completed_created_at",
+    "ix_tasks_owner_id_updated_at",
+    "ix_tasks_owner_id_due_at",
+    "ix_tasks_open_owner_id_goal_id",
+}
+GOAL_KEY = {"goals_pkey", "ix_goals_id", "ix_goals_owner_id_id"}
+GOAL_BY_OWNER = {"ix_goals_owner_id_id"}
+ACTIVITY_KEY = {"user_activities_pkey"}
+
+
+class Case(NamedTuple):
+    name: str
+    method: str
+    path: str
+    # Table -> indexes its scans may use; tables not listed only get the sequential scan check
+    expected: Dict[str, Optional[Set[str]]]
+    max_cost: float
+    params: Optional[Dict[str, Any]] = None
+    json: Optional[Dict[str, Any]] = None
+
+
+_now = datetime.now(timezone.utc)
+
+CASES = [
+    # api/tasks.py
+    Case("list tasks", "GET", "/tasks/", {"tasks": TASK_BY_OWNER}, 2000),
+    Case("list open tasks", "GET", "/tasks/", {"tasks": TASK_BY_OWNER}, 2000, params={"completed": "false"}),
+    Case(
+        "list tasks by update time", "GET", "/tasks/", {"tasks": TASK_BY_OWNER}, 2000,
+        params={"sort": "updated_at", "order": "desc"}
+    ),
+    Case(
+        "list tasks by tags", "GET", "/tasks/", {"tasks": TASK_BY_OWNER | {"ix_tasks_tags"}}, 2000,
+        params={"tags": "tag1,tag21", "tag_match": "all"}
+    ),
+    Case("list goal tasks", "GET", "/tasks/", {"tasks": TASK_BY_OWNER, "goals": GOAL_KEY}, 2000, params={"goal_id": "{goal_id}"}),
+    Case("upcoming tasks", "GET", "/tasks/upcoming", {"tasks": TASK_BY_OWNER}, 1000),
+    Case("overdue tasks", "GET", "/tasks/overdue", {"tasks": TASK_BY_OWNER}, 1000),
+    Case(
+        "task occurrences", "GET", "/tasks/occurrences", {"tasks": TASK_BY_OWNER | {"ix_tasks_recurring_due_at"}}, 2000,
+        params={"start": _now.isoformat(), "end": (_now + timedelta(days=14)).isoformat()}
+    ),
+    Case("read task", "GET", "/tasks/{task_id}", {"tasks": TASK_KEY}, 100),
+    Case("patch task", "PATCH", "/tasks/{task_id}", {"tasks": TASK_KEY | TASK_BY_OWNER}, 500, json={"title": "Renamed task"}),
+    Case(
+        "complete task", "PATCH", "/tasks/{task_id}/complete",
+        {"tasks": TASK_KEY | TASK_BY_OWNER, "goals": GOAL_KEY}, 500
+    ),
+    # api/goals.py
+    Case("list goals", "GET", "/goals/", {"goals": GOAL_BY_OWNER}, 1000),
+    Case("read goal", "GET", "/goals/{goal_id}", {"goals": GOAL_KEY}, 100),
+    Case(
+        "goal subtree", "GET", "/goals/{goal_id}/subtree",
+        {"goals": GOAL_KEY, "goal_closure": {"goal_closure_pkey"}}, 500
+    ),
+    Case(
+        "goal ancestors", "GET", "/goals/{child_goal_id}/ancestors",
+        {"goals": GOAL_KEY, "goal_closure": {"ix_goal_closure_descendant_id_depth"}}, 500
+    ),
+    Case("update goal", "PUT", "/goals/{goal_id}", {"goals": GOAL_KEY}, 500, json={"title": "Renamed goal"}),
+    # api/users.py
+    Case(
+        "dashboard", "GET", "/users/me/dashboard",
+        {"tasks": TASK_BY_OWNER, "goals": GOAL_BY_OWNER, "user_activities": ACTIVITY_KEY}, 2000
+    ),
+    Case("stats", "GET", "/users/me/stats", {"tasks": TASK_BY_OWNER, "goals": GOAL_BY_OWNER}, 2000),
+    Case("my tasks", "GET", "/users/me/tasks", {"tasks": TASK_BY_OWNER}, 2000),
+    Case("my goals", "GET", "/users/me/goals", {"goals": GOAL_BY_OWNER}, 1000),
+    Case("activity", "GET", "/users/me/activity", {"user_activities": ACTIVITY_KEY}, 1000),
+    Case("increment activity", "POST", "/users/me/activity/increment", {"user_activities": ACTIVITY_KEY}, 500),
+]
+
+
+def _format(value: Any, ids: Dict[str, int]) -> Any:
+    return value.format(**ids) if isinstance(value, str) else value
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda case: case.name)
+def test_query_plan(case, client, statement_log, catalog, plan_db, seeded):
+    from app.cache import response_cache
+
+    # A cached response would skip the queries under test
+    response_cache.invalidate(seeded["user_id"])
+    params = {key: _format(value, seeded) for key, value in (case.params or {}).items()}
+    statement_log.start()
+    try:
+        response = client.request(case.method, case.path.format(**seeded), params=params, json=case.json)
+    finally:
+        statements = [(sql, parameters) for sql, parameters in statement_log.stop() if explainable(sql)]
+    assert response.status_code < 400, response.text
+    assert statements, "the endpoint sent no statements to explain"
+
+    failures = []
+    with plan_db.connect() as connection:
+        for sql, parameters in statements:
+            plan = explain(connection, sql, parameters)
+            problems = check_plan(catalog, plan, case.expected)
+            budget = case.max_cost * PLAN_COST_SCALE
+            if plan["Total Cost"] > budget:
+                problems.append(f"estimated cost {plan['Total Cost']} is over the budget of {budget}")
+            if problems:
+                failures.append("\n".join([sql.strip(), describe(plan)] + [f"- {problem}" for problem in problems]))
+    assert not failures, f"{case.method} {case.path}:\n\n" + "\n\n".join(failures)
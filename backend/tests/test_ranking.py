@@ -0,0 +1,69 @@
+"""
+Fractional index keys from app/ranking.py: every generated key sorts
+strictly between its neighbours and never ends in the zero digit.
+"""
+import random
+
+import pytest
+
+from app.ranking import DIGITS, key_between, spread_keys
+
+
+def _check(keys):
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    for key in keys:
+        assert key and not key.endswith("0")
+        assert all(char in DIGITS for char in key)
+
+
+@pytest.mark.parametrize("low, high", [("1", "11"), ("z", None), (None, "1"), ("1", "2"), ("0V", "1")])
+def test_key_between_neighbours(low, high):
+    key = key_between(low, high)
+    assert (low is None or low < key) and (high is None or key < high)
+    _check([key])
+
+
+@pytest.mark.parametrize("low, high", [("1", "11"), ("z", None), (None, "1"), (None, None)])
+def test_repeated_inserts_keep_order(low, high):
+    # At the tail, at the head and always just above low
+    for insert in ("tail", "head", "after_low"):
+        keys = [key for key in (low, high) if key is not None]
+        for _ in range(200):
+            if insert == "tail":
+                keys.append(key_between(keys[-1] if keys else None, None))
+            elif insert == "head":
+                keys.insert(0, key_between(None, keys[0] if keys else None))
+            else:
+                above = keys[1] if len(keys) > 1 else None
+                keys.insert(1, key_between(keys[0] if keys else None, above))
+            _check(keys)
+
+
+def test_random_inserts_keep_order():
+    rng = random.Random(42)
+    keys = []
+    for _ in range(2000):
+        position = rng.randint(0, len(keys))
+        low = keys[position - 1] if position else None
+        high = keys[position] if position < len(keys) else None
+        keys.insert(position, key_between(low, high))
+    _check(keys)
+
+
+@pytest.mark.parametrize("low, high", [("2", "1"), ("1", "1"), ("10", None), (None, ""), ("1!", None)])
+def test_key_between_rejects_invalid_bounds(low, high):
+    with pytest.raises(ValueError):
+        key_between(low, high)
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 61, 62, 63, 1000, 3844, 5000])
+def test_spread_keys_are_strictly_increasing(count):
+    keys = spread_keys(count)
+    assert len(keys) == count
+    assert all(low < high for low, high in zip(keys, keys[1:]))
+    _check(keys)
+    if keys:
+        # Room stays at both ends
+        key_between(None, keys[0])
+        key_between(keys[-1], None)
@@ -0,0 +1,134 @@
+"""
+Admission control from app/ratelimit.py: token bucket refill, cost and
+eviction, and the 429 and 503 answers of the middleware.
+"""
+import asyncio
+import types
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app import database, ratelimit
+from app.ratelimit import AdmissionControlMiddleware, InMemoryBucketBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    backend = InMemoryBucketBackend()
+    assert [backend.take("ip", 1, rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert backend.take("ip", 1, rate=2, burst=3) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take("ip", 1, rate=2, burst=3) == 0
+    # Refill stops at the burst size
+    clock.now += 60
+    assert [backend.take("ip", 1, rate=2, burst=3) for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_bucket_charges_route_cost(clock):
+    backend = InMemoryBucketBackend()
+    assert backend.take("user", 10, rate=1, burst=12) == 0
+    # 2 tokens left, so 8 more seconds for another 10
+    assert backend.take("user", 10, rate=1, burst=12) == pytest.approx(8)
+    # A rejected take costs nothing
+    assert backend.take("user", 2, rate=1, burst=12) == 0
+
+
+def test_bucket_evicts_least_recently_used(clock):
+    backend = InMemoryBucketBackend(max_keys=2)
+    backend.take("a", 1, rate=1, burst=1)
+    backend.take("b", 1, rate=1, burst=1)
+    backend.take("a", 1, rate=1, burst=1)
+    backend.take("c", 1, rate=1, burst=1)
+    assert list(backend._buckets) == ["a", "c"]
+    # An evicted bucket starts full again
+    assert backend.take("b", 1, rate=1, burst=1) == 0
+
+
+class FixedBackend:
+    def __init__(self, wait):
+        self.wait = wait
+        self.keys = []
+
+    def take(self, key, cost, rate, burst):
+        self.keys.append((key, cost))
+        return self.wait
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def _call(middleware, method="GET", path="/tasks/"):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": [], "client": ("10.0.0.1", 1234)}
+    asyncio.run(middleware(scope, None, send))
+    return messages[0]["status"], dict(messages[0]["headers"])
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+
+
+def test_empty_bucket_answers_429(enabled):
+    backend = FixedBackend(wait=2.5)
+    middleware = AdmissionControlMiddleware(_ok, backend)
+    status, headers = _call(middleware, "POST", "/token")
+    assert status == 429
+    assert headers[b"retry-after"] == b"3"
+    assert backend.keys == [("ip:10.0.0.1", 10)]
+    assert middleware.rejected == 1
+
+
+def test_allowed_request_reaches_the_app(enabled):
+    middleware = AdmissionControlMiddleware(_ok, FixedBackend(wait=0))
+    assert _call(middleware)[0] == 200
+    assert middleware.in_flight == 0
+
+
+def test_too_many_in_flight_answers_503(enabled):
+    middleware = AdmissionControlMiddleware(_ok, FixedBackend(wait=0))
+    middleware.in_flight = ratelimit.MAX_IN_FLIGHT
+    status, headers = _call(middleware)
+    assert status == 503
+    assert headers[b"retry-after"] == b"1"
+    assert middleware.shed == 1
+
+
+def test_pool_queue_past_threshold_answers_503(enabled, monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=1, max_overflow=0)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(ratelimit, "SHED_POOL_QUEUE", 2)
+    middleware = AdmissionControlMiddleware(_ok, FixedBackend(wait=0))
+    try:
+        with engine.connect():
+            # One connection busy, one request queued behind it: left to the pool
+            middleware.in_flight = 2
+            assert not ratelimit.pool_saturated(middleware.in_flight)
+            assert _call(middleware)[0] == 200
+            middleware.in_flight = 3
+            assert _call(middleware)[0] == 503
+        # Idle connection available again
+        assert not ratelimit.pool_saturated(middleware.in_flight)
+    finally:
+        engine.dispose()
@@ -0,0 +1,145 @@
+"""
+Read replica routing: GETs read a replica, writes and the reads of a user
+who has just written go to the primary. The replica is a second engine,
+on PLAN_TEST_REPLICA_URL if set (e.g. a second local instance) and on the
+plan test database otherwise.
+"""
+import time
+
+from sqlalchemy import update
+
+from conftest import PLAN_TEST_DATABASE_URL, SEED_USERS
+
+# Not the user the plan cases sign in as
+USER_ID = SEED_USERS - 2
+
+
+class FakeRedis:
+    """The set(px=)/exists subset of redis-py that SharedRecentWrites uses."""
+
+    def __init__(self):
+        self.expires = {}
+
+    def set(self, key, value, px):
+        self.expires[key] = time.monotonic() + px / 1000
+
+    def exists(self, key):
+        return int(self.expires.get(key, 0) > time.monotonic())
+
+
+def _touch_user(db):
+    from app import models
+    db.execute(update(models.User).where(models.User.id == USER_ID).values(is_active=True))
+
+
+def test_get_reads_the_replica(client, seeded, replica, statement_log):
+    from app.cache import response_cache
+
+    response_cache.invalidate(seeded["user_id"])
+    replica.start()
+    statement_log.start()
+    try:
+        response = client.get("/tasks/")
+    finally:
+        primary_statements = statement_log.stop()
+        replica_statements = replica.stop()
+    assert response.status_code == 200
+    assert any("FROM tasks" in sql for sql, _ in replica_statements)
+    assert not any("FROM tasks" in sql for sql, _ in primary_statements)
+
+
+def test_write_goes_to_the_primary_and_pins_the_session(replica, statement_log):
+    from app import database, models
+
+    db = database.SessionLocal()
+    db.info["replica"] = True
+    replica.start()
+    statement_log.start()
+    try:
+        _touch_user(db)
+        db.get(models.User, USER_ID - 1)
+        db.rollback()
+    finally:
+        db.close()
+        primary_statements = statement_log.stop()
+        replica_statements = replica.stop()
+    assert not replica_statements
+    assert any(sql.startswith("UPDATE users") for sql, _ in primary_statements)
+    assert any(sql.startswith("SELECT users") for sql, _ in primary_statements)
+
+
+def test_reads_after_a_write_are_pinned_to_the_primary(replica, statement_log, monkeypatch):
+    from app import database, models
+
+    monkeypatch.setattr(database, "recent_writes", database.RecentWrites(ttl_seconds=60))
+    writer = database.SessionLocal()
+    database.pin_to_primary_if_recent_write(writer, "writer@example.com")
+    _touch_user(writer)
+    writer.commit()
+    writer.close()
+
+    sessions = {}
+    for user_key in ("writer@example.com", "reader@example.com"):
+        db = sessions[user_key] = database.SessionLocal()
+        db.info["replica"] = True
+        database.pin_to_primary_if_recent_write(db, user_key)
+
+    replica.start()
+    statement_log.start()
+    try:
+        sessions["writer@example.com"].get(models.User, USER_ID)
+        primary_statements = statement_log.stop()
+        sessions["reader@example.com"].get(models.User, USER_ID)
+        replica_statements = replica.stop()
+    finally:
+        statement_log.stop()
+        replica.stop()
+        for db in sessions.values():
+            db.close()
+    assert [sql for sql, _ in primary_statements if sql.startswith("SELECT users")]
+    assert [sql for sql, _ in replica_statements if sql.startswith("SELECT users")]
+
+
+def test_recent_writes_expire_and_stay_bounded():
+    from app.database import RecentWrites
+
+    marks = RecentWrites(ttl_seconds=0.05, max_keys=2)
+    marks.mark("a")
+    assert marks.is_recent("a")
+    marks.mark("b")
+    marks.mark("c")
+    assert not marks.is_recent("a")
+    assert marks.is_recent("b") and marks.is_recent("c")
+    time.sleep(0.06)
+    assert not marks.is_recent("c")
+    marks.mark("d")
+    assert list(marks._marks) == ["d"]
+
+
+def test_shared_recent_writes_expire():
+    from app.database import SharedRecentWrites
+
+    marks = SharedRecentWrites(FakeRedis(), ttl_seconds=0.05)
+    marks.mark("a")
+    assert marks.is_recent("a")
+    assert not marks.is_recent("b")
+    time.sleep(0.06)
+    assert not marks.is_recent("a")
+
+
+def test_replica_router_strategies(plan_db, replica):
+    from app import database
+
+    second = database.create_db_engine(PLAN_TEST_DATABASE_URL)
+    try:
+        first = database.replica_router.engines[0]
+        router = database.ReplicaRouter([first, second])
+        assert [router.choose() for _ in range(4)] == [first, second, first, second]
+
+        router = database.ReplicaRouter([first, second], strategy="least_connections")
+        with first.connect():
+            assert router.choose() is second
+        with second.connect():
+            assert router.choose() is first
+    finally:
+        second.dispose()
@@ -0,0 +1,130 @@
+"""
+Access token revocation: the Bloom filter, the exact revoked_tokens check
+behind it, which must see revocations the replicas may not have yet, and
+the sync that picks up revocations made by other workers.
+"""
+import secrets
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert, text
+
+from conftest import SEED_USERS
+
+# Not the user the plan cases sign in as
+USER_ID = SEED_USERS - 3
+
+
+@pytest.fixture
+def revocations(plan_db):
+    """A RevocationList of its own, as another worker would have; cleans up USER_ID's rows."""
+    from app import database
+    from app.revocation import RevocationList
+
+    yield RevocationList(database.SessionLocal)
+    db = database.SessionLocal()
+    db.execute(text("DELETE FROM revoked_tokens WHERE user_id = :user_id"), {"user_id": USER_ID})
+    db.commit()
+    db.close()
+
+
+def _revoke(jti, revoked_at=None):
+    from app import database, models
+
+    values = {"jti": jti, "user_id": USER_ID, "expires_at": datetime.now(timezone.utc) + timedelta(hours=1)}
+    if revoked_at is not None:
+        values["revoked_at"] = revoked_at
+    db = database.SessionLocal()
+    db.execute(insert(models.RevokedToken).values(**values))
+    db.commit()
+    db.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    from app.revocation import BloomFilter
+
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    added = [secrets.token_urlsafe(16) for _ in range(10_000)]
+    for jti in added:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in added)
+    others = [secrets.token_urlsafe(16) for _ in range(10_000)]
+    assert sum(jti in bloom for jti in others) < 300
+
+
+def test_possible_revocation_falls_back_to_the_exact_check(revocations):
+    from app import database
+
+    revoked, unknown, false_positive = (secrets.token_urlsafe(16) for _ in range(3))
+    _revoke(revoked)
+    db = database.SessionLocal()
+    try:
+        # Before the first sync every token may be revoked and is checked exactly
+        assert revocations.may_be_revoked(unknown)
+        assert not revocations.is_revoked(db, unknown)
+        assert revocations.exact_checks == 1
+
+        revocations.rebuild()
+        assert revocations.may_be_revoked(revoked)
+        assert revocations.is_revoked(db, revoked)
+        assert not revocations.may_be_revoked(unknown)
+        assert not revocations.is_revoked(db, unknown)
+        assert revocations.exact_checks == 2
+
+        revocations._filter.add(false_positive)
+        assert revocations.may_be_revoked(false_positive)
+        assert not revocations.is_revoked(db, false_positive)
+        assert revocations.false_positives == 1
+    finally:
+        db.close()
+
+
+def test_revocation_by_another_worker_is_picked_up_within_the_overlap(revocations):
+    from app.revocation import SYNC_OVERLAP
+
+    revocations.rebuild()
+    synced_until = revocations._synced_until
+    # Committed after the last sync read, stamped before it: caught by the overlap
+    late = secrets.token_urlsafe(16)
+    _revoke(late, synced_until - SYNC_OVERLAP / 2)
+    # Stamped before the overlap window: only the hourly rebuild finds it
+    too_late = secrets.token_urlsafe(16)
+    _revoke(too_late, synced_until - SYNC_OVERLAP * 2)
+    fresh = secrets.token_urlsafe(16)
+    _revoke(fresh)
+
+    revocations.sync()
+    assert revocations.may_be_revoked(late)
+    assert revocations.may_be_revoked(fresh)
+    assert not revocations.may_be_revoked(too_late)
+    revocations.rebuild()
+    assert revocations.may_be_revoked(too_late)
+
+
+def test_revoked_token_is_refused_on_a_replica_read(client, replica):
+    from app import auth, database, models
+
+    # Not the user the plan cases sign in as, so no recent-write pin applies
+    user_id = SEED_USERS - 1
+    db = database.SessionLocal()
+    try:
+        token = auth.create_access_token({"sub": db.get(models.User, user_id).email})
+        auth.revoke_token(db, auth.decode_token(token), user_id)
+        db.commit()
+    finally:
+        db.close()
+
+    overrides = dict(client.app.dependency_overrides)
+    client.app.dependency_overrides.clear()
+    replica.start()
+    try:
+        response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        statements = replica.stop()
+        client.app.dependency_overrides.update(overrides)
+        db = database.SessionLocal()
+        db.execute(text("DELETE FROM revoked_tokens WHERE user_id = :user_id"), {"user_id": user_id})
+        db.commit()
+        db.close()
+    assert response.status_code == 401
+    assert not [sql for sql, _ in statements if "revoked_tokens" in sql]
@@ -8,6 +8,7 @@ import { IconAlertCircle } from '@tabler/icons-react';
 import Link from 'next/link';
 import { useUser } from '@/hooks/useUser';
 import axiosInstance from '@/utils/axios';
+import { storeSession } from '@/utils/session';
 
 export default function SignIn() {
   const [email, setEmail] = useState('');
@@ -45,8 +46,8 @@ export default function SignIn() {
         },
       });
 
-      // Store the token
-      localStorage.setItem('token', response.data.access_token);
+      // Store the access and refresh tokens
+      storeSession(response.data);
       
       // Fetch user data immediately after successful login
       await fetchUser();
@@ -6,6 +6,7 @@ import { notifications } from '@mantine/notifications';
 import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import axiosInstance from '@/utils/axios';
+import { storeSession } from '@/utils/session';
 import { useUser } from '@/hooks/useUser';
 
 export default function SignUp() {
@@ -39,8 +40,8 @@ export default function SignUp() {
         },
       });
 
-      // Store the token
-      localStorage.setItem('token', loginResponse.data.access_token);
+      // Store the access and refresh tokens
+      storeSession(loginResponse.data);
 
       // Fetch user data immediately
       await fetchUser();
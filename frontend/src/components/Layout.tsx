@@ -8,6 +8,7 @@ import Link from 'next/link';
 import { useUser } from '@/hooks/useUser';
 import SettingsModal from './SettingsModal';
 import { useTheme } from '@/hooks/useTheme';
+import { endSession } from '@/utils/session';
 
 export default function Layout({ children }: { children: React.ReactNode }) {
   const { user, loading, fetchUser } = useUser();
@@ -31,8 +32,8 @@ export default function Layout({ children }: { children: React.ReactNode }) {
   }, [fetchUser]);
 
   const handleSignOut = () => {
-    // First remove auth token
-    localStorage.removeItem('token');
+    // First end the session; the server revokes its tokens
+    endSession();
     
     // Clear the user state
     useUser.getState().setUser(null);
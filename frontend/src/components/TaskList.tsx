@@ -99,18 +99,9 @@ export default function TaskList({ onTaskUpdate }: TaskListProps) {
         )
       );
       
-      // IMPORTANT: For task completion, also directly increment the activity counter
-      // This ensures the activity counter is updated properly regardless of other issues
+      // The server counts the completion towards today's activity (once per task
+      // and day), so the graph only needs to be refreshed
       if (isCompleting) {
-        try {
-          console.log('Task completed - directly incrementing activity counter');
-          // Pass today parameter to ensure consistent date handling
-          const activityResponse = await axiosInstance.post(`/users/me/activity/increment?today=${today}`);
-          console.log('Activity increment response:', activityResponse.data);
-        } catch (activityError) {
-          console.error('Failed to increment activity counter:', activityError);
-        }
-        
         // Always call onTaskUpdate after server confirms the update
         console.log('Server confirmed task completion - ensuring activity graph updates');
         setTimeout(() => {
@@ -2,6 +2,7 @@
 
 import { create } from 'zustand';
 import { StateCreator } from 'zustand';
+import { refreshSession } from '@/utils/session';
 
 interface User {
   id: number;
@@ -30,11 +31,22 @@ const createUserStore: StateCreator<UserStore> = (set) => ({
         return;
       }
 
-      const response = await fetch('http://localhost:8000/users/me', {
+      let response = await fetch('http://localhost:8000/users/me', {
         headers: {
           'Authorization': `Bearer ${token}`,
         },
       });
+      if (response.status === 401) {
+        // The access token expired; try once more with a refreshed one
+        const refreshed = await refreshSession();
+        if (refreshed) {
+          response = await fetch('http://localhost:8000/users/me', {
+            headers: {
+              'Authorization': `Bearer ${refreshed}`,
+            },
+          });
+        }
+      }
 
       if (response.ok) {
         const userData = await response.json();
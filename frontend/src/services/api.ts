@@ -21,6 +21,22 @@ export interface UpdateTaskInput {
   completed?: boolean;
 }
 
+// Writes carry an Idempotency-Key, so retrying one after a network error can't apply it twice
+const sendWithRetry = async (
+  url: string,
+  init: RequestInit & { headers: Record<string, string> },
+  retries = 2
+): Promise<Response> => {
+  const headers = { ...init.headers, 'Idempotency-Key': crypto.randomUUID() };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, { ...init, headers });
+    } catch (error) {
+      if (attempt >= retries) throw error;
+    }
+  }
+};
+
 export const api = {
   getTasks: async (): Promise<Task[]> => {
     const response = await fetch(`${API_BASE_URL}/tasks/`);
@@ -29,7 +45,7 @@ export const api = {
   },
 
   createTask: async (task: CreateTaskInput): Promise<Task> => {
-    const response = await fetch(`${API_BASE_URL}/tasks/`, {
+    const response = await sendWithRetry(`${API_BASE_URL}/tasks/`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(task),
@@ -39,7 +55,7 @@ export const api = {
   },
 
   updateTask: async (taskId: number, updates: UpdateTaskInput): Promise<Task> => {
-    const response = await fetch(`${API_BASE_URL}/tasks/${taskId}`, {
+    const response = await sendWithRetry(`${API_BASE_URL}/tasks/${taskId}`, {
       method: 'PATCH',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(updates),
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { clearSession, refreshSession } from './session';
 
 const instance = axios.create({
   baseURL: 'http://localhost:8000',  // FastAPI backend URL
@@ -29,8 +30,18 @@ instance.interceptors.response.use(
     const isSigninPage = typeof window !== 'undefined' && window.location.pathname === '/signin';
     
     if (error.response?.status === 401 && !isSigninPage) {
+      // An expired access token is renewed once with the refresh token before giving up
+      const original = error.config;
+      if (original && !original._retried) {
+        original._retried = true;
+        const token = await refreshSession();
+        if (token) {
+          original.headers.Authorization = `Bearer ${token}`;
+          return instance(original);
+        }
+      }
       // Handle unauthorized error (e.g., redirect to login)
-      localStorage.removeItem('token');
+      clearSession();
       window.location.href = '/signin';
     }
     return Promise.reject(error);
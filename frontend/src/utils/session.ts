@@ -0,0 +1,73 @@
+const API_BASE_URL = 'http://localhost:8000';
+
+interface TokenPair {
+  access_token: string;
+  refresh_token?: string;
+}
+
+export const storeSession = (tokens: TokenPair) => {
+  localStorage.setItem('token', tokens.access_token);
+  if (tokens.refresh_token) {
+    localStorage.setItem('refresh_token', tokens.refresh_token);
+  }
+};
+
+export const clearSession = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+};
+
+// Access tokens are short-lived; one refresh is shared by every request that got a 401 meanwhile
+let refreshing: Promise<string | null> | null = null;
+
+export const refreshSession = (): Promise<string | null> => {
+  if (!refreshing) {
+    refreshing = (async () => {
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken) {
+        return null;
+      }
+      try {
+        const response = await fetch(`${API_BASE_URL}/token/refresh`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ refresh_token: refreshToken }),
+        });
+        if (!response.ok) {
+          clearSession();
+          return null;
+        }
+        const tokens: TokenPair = await response.json();
+        storeSession(tokens);
+        return tokens.access_token;
+      } catch (error) {
+        return null;
+      }
+    })().finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
+// Revokes the access and refresh tokens on the server; the local session is cleared either way
+export const endSession = async () => {
+  const token = localStorage.getItem('token');
+  const refreshToken = localStorage.getItem('refresh_token');
+  clearSession();
+  if (!token) {
+    return;
+  }
+  try {
+    await fetch(`${API_BASE_URL}/logout`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    });
+  } catch (error) {
+    console.error('Failed to revoke session:', error);
+  }
+};